@@ -0,0 +1,232 @@
+"""
+Benchmark of the GlitchFinder against the local stand-in server in MockServers. Every scenario runs
+GlitchFinder.GlitchTest over the llama2 tokenizer in its own process and reports tokens/sec, the per-request overhead
+of the framework, peak RSS and I/O volume. The cold start (import of GlitchTokenDiscovery in a fresh interpreter) is measured as well and
+can be checked against a budget. The results are written to a JSON file so regressions can be tracked.
+
+Usage: python -m Benchmark.GlitchBenchmark --tokens 2000 --output benchmark_results.json --baseline previous.json
+       python -m Benchmark.GlitchBenchmark --scenarios --cold-start-budget-ms 150
+"""
+import argparse, contextlib, json, multiprocessing, os, platform, subprocess, sys, tempfile, threading, time
+from datetime import datetime
+
+try:
+    import resource
+except ImportError:  # not available on Windows, peak RSS is not reported there
+    resource = None
+
+from MockServers import OllamaMockServer
+
+REPOSITORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_TOKENIZER = os.path.join(REPOSITORY, "Examples", "tokenizer_llama2-7b.json")
+COLD_START_BUDGET_MS: float = 150.0  # import time of GlitchTokenDiscovery in a fresh interpreter
+
+# scenario name -> generator, GlitchTest and mock server settings
+SCENARIOS: dict[str, dict] = {
+    "sequential": {"generator": "ollama", "max_workers": 1, "server": {}},
+    "concurrent": {"generator": "ollama", "max_workers": 8,
+                   "server": {"latency": 0.005, "latency_distribution": "lognormal"}},
+    "runaway": {"generator": "ollama", "max_workers": 8, "stream": True, "max_chars": 2000,
+                "server": {"glitch_rate": 0.05, "runaway_chars": 50000}},
+    "errors": {"generator": "ollama", "scheduled": True, "max_workers": 8, "server": {"error_rate": 0.05}},
+    "openai": {"generator": "openai", "max_workers": 8,
+               "server": {"latency": 0.005, "latency_distribution": "exponential", "response_chars": 200}},
+    "journal": {"generator": "ollama", "max_workers": 1, "journal": True, "server": {"response_chars": 1000}},
+}
+
+
+def _io_counters() -> dict:
+    # bytes read and written by the process (including sockets) and by the storage layer
+    try:
+        with open("/proc/self/io") as io_file:
+            counters = dict(line.split(": ") for line in io_file.read().splitlines())
+        return {name: int(counters[name]) for name in ("rchar", "wchar", "read_bytes", "write_bytes")}
+    except OSError:
+        if resource is None:
+            return {}
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        return {"read_bytes": usage.ru_inblock * 512, "write_bytes": usage.ru_oublock * 512}
+
+
+def _peak_rss_mib() -> float:
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1 << 20) if sys.platform == "darwin" else peak / 1024  # bytes on macOS, KiB on Linux
+
+
+def _build_generator(config: dict, server_url: str, openai_url: str):
+    from GlitchTokenDiscovery import ResponseGenerator, OllamaResponseGenerator, ScheduledResponseGenerator
+
+    if config["generator"] == "openai":
+        from Generators.GPTResponseGenerator import GPTResponseGenerator
+        generator = GPTResponseGenerator(api_key="benchmark", base_url=openai_url)
+    else:
+        generator = OllamaResponseGenerator(api_url=server_url, pool_size=config["max_workers"],
+                                            stream=config.get("stream", False), max_chars=config.get("max_chars"))
+    if config.get("scheduled"):
+        generator = ScheduledResponseGenerator(generator, backoff_base=0.01, backoff_max=0.1)
+
+    class TimedGenerator(ResponseGenerator):
+        """
+        Measures the time spent inside the generator, everything else of a run is framework overhead.
+        """
+        SUPPORTS_EARLY_STOP = getattr(generator, "SUPPORTS_EARLY_STOP", False)
+
+        def __init__(self):
+            self.requests = 0
+            self.seconds = 0.0
+            self._lock = threading.Lock()
+
+        def generateResponse(self, model: str, prompt: str, systemInstruction: str, **kwargs) -> str:
+            start = time.perf_counter()
+            try:
+                return generator.generateResponse(model, prompt, systemInstruction, **kwargs)
+            finally:
+                with self._lock:
+                    self.requests += 1
+                    self.seconds += time.perf_counter() - start
+
+    return TimedGenerator()
+
+
+def _run_worker(config: dict, server_url: str, openai_url: str, path_to_tokenizer: str, tokens: int,
+                connection) -> None:
+    # runs in a fresh process, so peak RSS and I/O belong to this scenario alone
+    from GlitchTokenDiscovery import GlitchFinder
+
+    generator = _build_generator(config, server_url, openai_url)
+    with tempfile.TemporaryDirectory() as folder:
+        io_before = _io_counters()
+        start = time.perf_counter()
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull), contextlib.redirect_stderr(devnull):
+            GlitchFinder.GlitchTest(path_to_token_csv_or_json=path_to_tokenizer,
+                                    path_to_output_csv=os.path.join(folder, "result.csv"), model="benchmark",
+                                    generator=generator, topN=tokens, max_workers=config["max_workers"],
+                                    path_to_journal=os.path.join(folder, "journal.jsonl")
+                                    if config.get("journal") else None)
+        seconds = time.perf_counter() - start
+        io_after = _io_counters()
+        with open(os.path.join(folder, "result.csv"), encoding="utf-8") as result_file:
+            glitch_tokens = sum(1 for _ in result_file) - 1
+    # time of the run not covered by requests, requests of several workers overlap
+    overhead = seconds - generator.seconds / config["max_workers"]
+    connection.send({
+        "seconds": round(seconds, 4),
+        "tokens_per_second": round(tokens / seconds, 2),
+        "requests": generator.requests,
+        "requests_per_second": round(generator.requests / seconds, 2),
+        "mean_request_ms": round(generator.seconds / max(generator.requests, 1) * 1000, 4),
+        "overhead_per_request_ms": round(max(overhead, 0.0) / max(generator.requests, 1) * 1000, 4),
+        "peak_rss_mib": _peak_rss_mib(),
+        "io_bytes": {name: io_after[name] - io_before[name] for name in io_after},
+        "glitch_tokens": glitch_tokens,
+    })
+
+
+def run_scenario(name: str, tokens: int = 2000, path_to_tokenizer: str = DEFAULT_TOKENIZER) -> dict:
+    """
+    Runs one scenario of SCENARIOS against a fresh mock server.
+    :param name: scenario name
+    :param tokens: number of tokens tested (topN)
+    :param path_to_tokenizer: tokenizer of the run
+    :return: metrics of the scenario
+    """
+    config = SCENARIOS[name]
+    context = multiprocessing.get_context("spawn")
+    receiver, sender = context.Pipe(duplex=False)
+    with OllamaMockServer(**{"glitch_rate": 0.02, "seed": 0, **config["server"]}) as server:
+        worker = context.Process(target=_run_worker,
+                                 args=(config, server.url, server.openai_url, path_to_tokenizer, tokens, sender))
+        worker.start()
+        sender.close()
+        try:
+            metrics = receiver.recv()
+        except EOFError:
+            raise RuntimeError(f"benchmark scenario {name} failed, see the output of the worker process.")
+        finally:
+            worker.join()
+        metrics["server_requests"] = server.requests
+        metrics["server_errors"] = server.errors
+    return {"config": config, **metrics}
+
+
+def cold_start_ms(repeats: int = 7) -> float:
+    """
+    Measures the start-up cost of the module: the median wall time of 'import GlitchTokenDiscovery' in a fresh
+    interpreter minus the median of an empty interpreter start.
+    :param repeats: number of interpreter starts per measurement
+    :return: start-up cost in milliseconds
+    """
+    environment = dict(os.environ, PYTHONPATH=REPOSITORY)
+    environment.pop("PYTHONDONTWRITEBYTECODE", None)  # bytecode caching as in an installed package
+
+    def median_ms(code: str) -> float:
+        subprocess.run([sys.executable, "-c", code], env=environment, check=True)  # warms up caches and bytecode
+        seconds = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            subprocess.run([sys.executable, "-c", code], env=environment, check=True)
+            seconds.append(time.perf_counter() - start)
+        return sorted(seconds)[len(seconds) // 2] * 1000
+
+    return max(median_ms("import GlitchTokenDiscovery") - median_ms("pass"), 0.0)
+
+
+def run(scenarios: list[str] = None, tokens: int = 2000, path_to_output: str = "benchmark_results.json",
+        path_to_baseline: str = None, path_to_tokenizer: str = DEFAULT_TOKENIZER,
+        cold_start_budget_ms: float = COLD_START_BUDGET_MS) -> dict:
+    """
+    Runs the scenarios and writes the results as JSON.
+    :param scenarios: names of the scenarios, all by default
+    :param path_to_baseline: optional earlier result file, the change of tokens/sec is printed per scenario
+    :param cold_start_budget_ms: budget of the cold start, results['cold_start_within_budget'] is False above it
+    :return: benchmark results
+    """
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPOSITORY, capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    results = {"timestamp": datetime.now().isoformat(timespec="seconds"), "commit": commit,
+               "python": platform.python_version(), "platform": platform.platform(), "tokens": tokens,
+               "tokenizer": os.path.basename(path_to_tokenizer), "scenarios": {}}
+    baseline = {}
+    if path_to_baseline is not None:
+        with open(path_to_baseline, encoding="utf-8") as baseline_file:
+            baseline = json.load(baseline_file)["scenarios"]
+    results["cold_start_ms"] = round(cold_start_ms(), 1)
+    results["cold_start_budget_ms"] = cold_start_budget_ms
+    results["cold_start_within_budget"] = results["cold_start_ms"] <= cold_start_budget_ms
+    print(f"{'cold start':<12} {results['cold_start_ms']:>10.1f} ms (budget {cold_start_budget_ms:.0f} ms"
+          f"{'' if results['cold_start_within_budget'] else ', EXCEEDED'})")
+    for name in SCENARIOS if scenarios is None else scenarios:
+        metrics = run_scenario(name, tokens, path_to_tokenizer)
+        results["scenarios"][name] = metrics
+        change = ""
+        if name in baseline:
+            change = f" ({metrics['tokens_per_second'] / baseline[name]['tokens_per_second'] - 1:+.1%} vs. baseline)"
+        print(f"{name:<12} {metrics['tokens_per_second']:>10.1f} tokens/s{change}  "
+              f"overhead {metrics['overhead_per_request_ms']:.3f} ms/request  "
+              f"peak RSS {metrics['peak_rss_mib'] or 0:.0f} MiB  "
+              f"written {metrics['io_bytes'].get('wchar', metrics['io_bytes'].get('write_bytes', 0)) / 1024:.0f} KiB")
+    with open(path_to_output, "w", encoding="utf-8") as output_file:
+        json.dump(results, output_file, indent=2)
+    print(f"results saved in {path_to_output}")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark of the GlitchFinder against a local mock server.")
+    parser.add_argument("--scenarios", nargs="*", choices=list(SCENARIOS),
+                        help="scenarios to run, all by default, none if the option is given without names")
+    parser.add_argument("--tokens", type=int, default=2000, help="number of tokens tested per scenario")
+    parser.add_argument("--tokenizer", default=DEFAULT_TOKENIZER, help="tokenizer file of the runs")
+    parser.add_argument("--output", default="benchmark_results.json", help="JSON file of the results")
+    parser.add_argument("--baseline", help="earlier JSON result file to compare tokens/sec with")
+    parser.add_argument("--cold-start-budget-ms", type=float, default=COLD_START_BUDGET_MS,
+                        help="exit with status 1 if importing GlitchTokenDiscovery takes longer")
+    arguments = parser.parse_args()
+    benchmark = run(arguments.scenarios, arguments.tokens, arguments.output, arguments.baseline, arguments.tokenizer,
+                    arguments.cold_start_budget_ms)
+    sys.exit(0 if benchmark["cold_start_within_budget"] else 1)
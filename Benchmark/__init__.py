@@ -0,0 +1,3 @@
+"""
+Benchmark suite of the GlitchFinder, run it with python -m Benchmark.GlitchBenchmark
+"""
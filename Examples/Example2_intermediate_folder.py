@@ -7,7 +7,7 @@ This example works by using the necessary inputs and a path field for saving int
 2. the output path
 3. the model name to be tested
 4. path to the intermediate folder
-5. custom saving interval (here 500 tests)
+5. custom saving interval of the run journal (here 500 tests)
 """
 from GlitchTokenDiscovery import GlitchFinder #Import the GlitchFinder class
 
@@ -16,5 +16,5 @@ GlitchFinder.GlitchTest(
     path_to_output_csv = "example2_results.csv", # Output
     model = "llama2:7b", # Model
     path_to_intermediate_res_folder = "Intermediate_Results", # Intermediate Folder name
-    saving_interval = 500 # Save the results every 500 tests
+    saving_interval = 500 # Sync the run journal every 500 tests
 )
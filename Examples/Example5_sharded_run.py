@@ -0,0 +1,36 @@
+"""
+This example demonstrates a sharded run. The token set is split into shards, every shard is tested by its own worker
+process (or machine) and the shard results are merged into the result file a single run would have produced.
+For demonstration purposes the workers query a local stand-in of the Ollama server instead of a real model. For actual
+runs, start one worker per shard with the api_url of a real Ollama server.
+"""
+import multiprocessing
+
+from GlitchTokenDiscovery import GlitchFinder, OllamaResponseGenerator
+from MockServers import OllamaMockServer
+
+SHARDS = 4
+
+def run_shard(index: int, api_url: str) -> None:
+    GlitchFinder.GlitchTest(
+        generator = OllamaResponseGenerator(api_url=api_url), # Ollama server of this worker
+        path_to_token_csv_or_json = "tokenizer_llama2-7b.json", # Tokenizer
+        path_to_output_csv = f"Intermediate_Results/example5_shard{index}.csv", # Output of the shard
+        model = "llama2:7b", # Model
+        topN = 2000, # the first 2000 tokens are split into the shards
+        shard = (index, SHARDS) # shard index and number of shards
+    )
+
+if __name__ == "__main__":
+    with OllamaMockServer(glitch_rate=0.02) as server: # stand-in server answering like a model
+        workers = [multiprocessing.Process(target=run_shard, args=(index, server.url)) for index in range(SHARDS)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+    # every shard run writes a manifest next to its output, the manifests are used to merge the results
+    GlitchFinder.MergeShards(
+        paths_to_manifests = [f"Intermediate_Results/example5_shard{index}.manifest.json" for index in range(SHARDS)],
+        path_to_output_csv = "example5_results.csv"
+    )
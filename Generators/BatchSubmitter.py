@@ -0,0 +1,60 @@
+"""
+Interface of provider batch APIs, shared by GlitchFinder.run_batch_stage and the submitters in this package.
+"""
+import json
+from abc import ABC, abstractmethod
+from typing import Iterable
+
+class BatchSubmitter(ABC):
+    """
+    Interface for provider batch APIs. A batch is an OpenAI-style JSONL file with one chat completion request per line,
+    identified by its custom_id. The GlitchFinder writes one batch file per stage, submits it and polls its status
+    until it is finished.
+    """
+    POLL_INTERVAL: float = 30.0  # seconds between two status requests
+    MAX_REQUESTS: int = 50000  # requests per batch file, larger stages are split
+    FINISHED = {"completed", "failed", "expired", "cancelled"}
+
+    @abstractmethod
+    def submit(self, path_to_batch_file: str) -> str:
+        """
+        :param path_to_batch_file: JSONL file of chat completion requests
+        :return: id of the submitted batch
+        """
+        pass
+
+    @abstractmethod
+    def status(self, batch_id: str) -> str:
+        """
+        :return: status of the batch, one of FINISHED once the batch is no longer processed
+        :raises LookupError: if the batch id is unknown, e.g. a batch of an earlier run the provider deleted
+        """
+        pass
+
+    @abstractmethod
+    def results(self, batch_id: str) -> dict[str, str]:
+        """
+        :return: response text by custom_id. Failed requests are missing or map to 'ERROR occurred: <message>'.
+        """
+        pass
+
+    @staticmethod
+    def parse_output(lines: Iterable[str]) -> dict[str, str]:
+        """
+        Reads the lines of an OpenAI-style batch output (or error) file.
+        :return: response text by custom_id
+        """
+        results = {}
+        for line in lines:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            response = entry.get("response") or {}
+            if entry.get("error") or response.get("status_code", 200) != 200:
+                error = entry.get("error") or response.get("body", {}).get("error") or response.get("status_code")
+                if isinstance(error, dict):
+                    error = error.get("message", error)
+                results[entry["custom_id"]] = f"ERROR occurred: {error}"
+            else:
+                results[entry["custom_id"]] = str(response["body"]["choices"][0]["message"]["content"])
+        return results
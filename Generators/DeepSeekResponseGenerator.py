@@ -2,19 +2,29 @@
 Author: Maximilian Stefan Schreber
 Date: 13.03.2025
 """
+import os
 
 from Generators import ResponseGenerator
 from openai import OpenAI
-client = OpenAI(api_key="<key>", base_url="https://api.deepseek.com")
 
 class DeepSeekResponseGenerator(ResponseGenerator):
     """
     Implementation of the GenerateResponse interface to make DeepSeek Accessible
     """
-    @staticmethod
+    API_URL: str = "https://api.deepseek.com"
+
+    def __init__(self, api_key: str = None):
+        """
+        One OpenAI client is shared by all requests of the generator. Its connection pool keeps the HTTP
+        connections alive instead of setting them up for every token.
+        :param api_key: DeepSeek API key. If not set, the DEEPSEEK_API_KEY environment variable is used.
+        """
+        self.client = OpenAI(api_key=api_key if api_key is not None else os.environ.get("DEEPSEEK_API_KEY", "<key>"),
+                             base_url=self.API_URL)
+
     def generateResponse(self,model:str, prompt:str,systemRole:str) -> str:
-        response = client.chat.completions.create(
-            model="deepseek-chat",
+        response = self.client.chat.completions.create(
+            model=model,
             messages=[
                 {"role": "system", "content": systemRole},
                 {"role": "user", "content": prompt},
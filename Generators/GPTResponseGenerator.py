@@ -2,17 +2,24 @@
 Author: Maximilian Stefan Schreber
 Date: 13.03.2025
 """
+import os
 
 from Generators import ResponseGenerator
 from openai import OpenAI
 
 class GPTResponseGenerator(ResponseGenerator):
-    @staticmethod
-    def generateResponse(self,model:str, prompt:str,systemInstructions:str) -> str:
+    def __init__(self, api_key: str = None, base_url: str = None):
+        """
+        One OpenAI client is shared by all requests of the generator. Its connection pool keeps the HTTP
+        connections alive instead of setting them up for every token.
+        :param api_key: OpenAI API key. If not set, the OPENAI_API_KEY environment variable is used.
+        :param base_url: optional base url of an OpenAI compatible endpoint
+        """
+        self.client = OpenAI(api_key=api_key if api_key is not None else os.environ.get("OPENAI_API_KEY", "<key>"),
+                             base_url=base_url)
 
-        client = OpenAI(api_key="<key>")
-
-        completion = client.chat.completions.create(
+    def generateResponse(self, model:str, prompt:str, systemInstructions:str) -> str:
+        completion = self.client.chat.completions.create(
             model=model,
             messages=[
                 {"role": "system", "content": systemInstructions},
@@ -23,4 +30,4 @@ class GPTResponseGenerator(ResponseGenerator):
             ],
         )
 
-        return str(completion.choices[0].message.content)
\ No newline at end of file
+        return str(completion.choices[0].message.content)
@@ -3,13 +3,7 @@ Author: Maximilian Stefan Schreber
 Date: 13.03.2025
 """
 from Generators import ResponseGenerator
-import requests, json, signal
-
-def timeout_handler(signum, frame):
-    """
-    standard time-out handler
-    """
-    raise TimeoutException('Timed out while waiting for model response.')
+import requests, requests.adapters, json
 
 class TimeoutException(Exception):
     """
@@ -18,7 +12,21 @@ class TimeoutException(Exception):
     pass
 
 class OllamaResponseGenerator(ResponseGenerator):
-    @staticmethod
+    TIMEOUT_SECONDS: int = 20  # default timeout duration 20 sec
+
+    def __init__(self, timeout_seconds: int = None, pool_size: int = 16):
+        """
+        :param timeout_seconds: timeout per request, TIMEOUT_SECONDS if not set
+        :param pool_size: number of keep-alive connections held by the session, should cover the number of
+        concurrent requests
+        """
+        self.TIMEOUT_SECONDS = timeout_seconds if timeout_seconds is not None else self.TIMEOUT_SECONDS
+        # persistent session, avoids a new TCP connection for every request
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
     def generateResponse(self,model:str, prompt:str, system_instructions:str) -> str:
         """
         Program connector to use Ollama as a model provider. Given Inputs result in the model respose text.
@@ -28,7 +36,6 @@ class OllamaResponseGenerator(ResponseGenerator):
         :return: response text
         """
 
-        timeout = 20 # fixed timeout parameter for execution
         if not isinstance(prompt, str):
             raise ValueError("Wrong Input Type :(",
                              "The Prompt should be a String, change the input type or add Diaresises")
@@ -45,14 +52,10 @@ class OllamaResponseGenerator(ResponseGenerator):
                 "temperature": temperature
             },
         }
-        # send a REST POST request
-        signal.signal(signal.SIGALRM, timeout_handler)
-        signal.alarm(timeout)
-
+        # send a REST POST request, the socket timeout also works outside the main thread
         try:
-            response = requests.post(api_url, json=data)
-            signal.alarm(0) # timeout alarm
-        except TimeoutException as e:
+            response = self.session.post(api_url, json=data, timeout=self.TIMEOUT_SECONDS)
+        except requests.exceptions.Timeout:
             print("timeout")
             return "timeout"
 
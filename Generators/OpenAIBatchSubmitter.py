@@ -0,0 +1,42 @@
+"""
+Batch API submitter for OpenAI and OpenAI compatible providers.
+"""
+import os
+
+from Generators.BatchSubmitter import BatchSubmitter
+from openai import NotFoundError, OpenAI
+
+class OpenAIBatchSubmitter(BatchSubmitter):
+    def __init__(self, api_key: str = None, base_url: str = None, completion_window: str = "24h"):
+        """
+        Submits the batch files of the GlitchFinder to the batch API (/v1/batches). Batch requests are billed at a
+        reduced rate and do not count against the rate limits of synchronous requests.
+        :param api_key: OpenAI API key. If not set, the OPENAI_API_KEY environment variable is used.
+        :param base_url: optional base url of an OpenAI compatible batch API
+        :param completion_window: time frame within which the batch has to be processed
+        """
+        self.client = OpenAI(api_key=api_key if api_key is not None else os.environ.get("OPENAI_API_KEY", "<key>"),
+                             base_url=base_url)
+        self.completion_window = completion_window
+
+    def submit(self, path_to_batch_file: str) -> str:
+        with open(path_to_batch_file, "rb") as batch_file:
+            input_file = self.client.files.create(file=batch_file, purpose="batch")
+        batch = self.client.batches.create(input_file_id=input_file.id, endpoint="/v1/chat/completions",
+                                           completion_window=self.completion_window)
+        return batch.id
+
+    def status(self, batch_id: str) -> str:
+        try:
+            return self.client.batches.retrieve(batch_id).status
+        except NotFoundError as e:
+            raise LookupError(f"unknown batch {batch_id}") from e
+
+    def results(self, batch_id: str) -> dict[str, str]:
+        batch = self.client.batches.retrieve(batch_id)
+        results = {}
+        # failed requests are listed in the error file, successful ones in the output file
+        for file_id in (batch.error_file_id, batch.output_file_id):
+            if file_id is not None:
+                results.update(self.parse_output(self.client.files.content(file_id).text.splitlines()))
+        return results
@@ -19,4 +19,15 @@ class ResponseGenerator(ABC):
         :param prompt: Model prompt to be executed
         :return: String model response
         """
-        pass
\ No newline at end of file
+        pass
+
+    def generateResponses(self, model:str, prompts:list[str], systemInstructions:str) -> list[str]:
+        """
+        Batch variant of generateResponse. Implementations may override it with a native batch endpoint or pooled
+        requests, by default the prompts are processed one after another.
+        :param systemInstructions: Further Instructions for the model to consider during execution.
+        :param model: Model name as listed in the according framework
+        :param prompts: Model prompts to be executed, all sharing the system instructions
+        :return: String model responses in the order of the prompts
+        """
+        return [self.generateResponse(model, prompt, systemInstructions) for prompt in prompts]
@@ -1 +1,2 @@
-import ResponseGenerator, OllamaResponseGenerator, GPTResponseGenerator, DeepSeekResponseGenerator
\ No newline at end of file
+from .ResponseGenerator import ResponseGenerator
+from .BatchSubmitter import BatchSubmitter
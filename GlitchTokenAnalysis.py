@@ -0,0 +1,433 @@
+"""
+Analysis of glitch token result sets. Result files of GlitchTest (csv, any header) or run journals are loaded into
+data frames, features of the tokens and their responses are computed column-wise on code point arrays, failure modes
+are categorized by rules, tokens are clustered and the overlaps between the glitch tokens of several models are
+computed. 20 result sets with 120k rows each are analysed in about 40 seconds on a single core without the per-token
+files, of which about 10 s are spent parsing the csv files and 28 s computing the features.
+
+Usage: python GlitchTokenAnalysis.py "Glitch Token Results/GlitchTokens_olmo2-7b.csv" ... --output analysis
+"""
+import argparse, json, operator, os, re, time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from GlitchTokenDiscovery import RunJournal, TokenPrior
+
+
+class GlitchTokenAnalysis:
+    MAX_CHARS: int = 64  # code points per string used for the character features and edit distances
+    CHUNK: int = 4096  # string pairs per vectorized edit distance computation
+    CLUSTER_SAMPLE: int = 20000  # tokens the k-means centers are fitted on
+    # code point ranges of the scripts, everything else is 'other'
+    SCRIPTS: list[tuple[int, int, str]] = [
+        (0x41, 0x5A, "latin"), (0x61, 0x7A, "latin"), (0xC0, 0x24F, "latin"), (0x370, 0x3FF, "greek"),
+        (0x400, 0x52F, "cyrillic"), (0x590, 0x5FF, "hebrew"), (0x600, 0x6FF, "arabic"), (0x900, 0x97F, "devanagari"),
+        (0xE00, 0xE7F, "thai"), (0x1100, 0x11FF, "hangul"), (0x1E00, 0x1EFF, "latin"), (0x3040, 0x30FF, "kana"),
+        (0x3400, 0x4DBF, "cjk"), (0x4E00, 0x9FFF, "cjk"), (0xAC00, 0xD7AF, "hangul"), (0x1F300, 0x1FAFF, "emoji")]
+    WHITESPACE: list[int] = [9, 10, 11, 12, 13, 32, 0x85, 0xA0, 0x1680, *range(0x2000, 0x200B), 0x2028, 0x2029,
+                             0x202F, 0x205F, 0x3000]
+    REFUSAL = r"(?i)\b(?:sorry|apologi[sz]e|i can(?:no|')t|i am unable|i'm unable|cannot (?:repeat|help|comply))\b"
+    ERROR_RESPONSES = ("ERROR", "timeout")
+    RUNAWAY_CHARS: int = 500  # responses this long and RUNAWAY_RATIO times longer than the token are runaway outputs
+    RUNAWAY_RATIO: float = 20.0
+    EXPLANATION_RATIO: float = 5.0  # responses this much longer than the token talk about the string instead
+    PARTIAL_DISTANCE: float = 0.5  # normalized edit distance up to which an echo counts as partially correct
+    FAILURE_MODES = ("error", "empty", "refusal", "runaway", "correct", "partial", "explanation", "substitution")
+    ECHO_STAGES: tuple[int, ...] = (0, 1)  # stages of the default prompts that ask to repeat the token
+
+    @staticmethod
+    def load_results(path: str, model: str = None, max_response_chars: int = None) -> pd.DataFrame:
+        """
+        Loads a result set with the columns token_id, token, res_1, res_2, ...
+        :param path: result csv (';' separated, the header names do not matter) or run journal (.jsonl). Of a journal
+        the tokens failing all stages are loaded.
+        :param model: name of the model, derived from the file name if not set (GlitchTokens_<model>.csv)
+        :param max_response_chars: optional cap of the response length, saves memory with long runaway responses
+        :return: data frame of the result set, the model is in frame.attrs['model']
+        """
+        if path.endswith(".jsonl"):
+            header, records = RunJournal.read(path)
+            journal = pd.DataFrame.from_records(records, columns=["stage", "token_id", "token", "response", "passed"])
+            journal = journal.drop_duplicates(["stage", "token_id"], keep="last")
+            stages = len(header.get("prompts", [])) or int(journal["stage"].max()) + 1
+            # glitch tokens failed every stage, whatever order the stages ran in
+            failed = journal[~journal["passed"].astype(bool)]
+            counts = failed["token_id"].value_counts()
+            failing = failed[(failed["stage"] == failed["stage"].min()) &
+                             failed["token_id"].isin(counts.index[counts == stages])]
+            frame = failing[["token_id", "token"]].sort_values("token_id", kind="stable").reset_index(drop=True)
+            for stage in range(stages):
+                responses = journal[journal["stage"] == stage].set_index("token_id")["response"]
+                frame[f"res_{stage + 1}"] = frame["token_id"].map(responses).fillna("").to_numpy()
+            model = model or header.get("model")
+        else:
+            frame = pd.read_csv(path, sep=";", dtype=str, keep_default_na=False)
+            frame.columns = ["token_id", "token", *[f"res_{index + 1}" for index in range(len(frame.columns) - 2)]]
+        frame["token_id"] = frame["token_id"].astype(np.int64)
+        if max_response_chars is not None:
+            for column in frame.columns[2:]:
+                frame[column] = frame[column].str.slice(0, max_response_chars)
+        if model is None:
+            model = re.sub(r"^GlitchTokens_", "", os.path.splitext(os.path.basename(path))[0])
+        frame.attrs["model"] = model
+        return frame
+
+    @staticmethod
+    def load_many(paths: list[str], max_response_chars: int = None, max_workers: int = None) -> dict[str, pd.DataFrame]:
+        """
+        Loads several result sets in parallel, the csv parser of pandas releases the GIL.
+        :return: model -> result set
+        """
+        with ThreadPoolExecutor(max_workers=max_workers or min(len(paths), os.cpu_count() or 1) or 1) as pool:
+            frames = list(pool.map(lambda path: GlitchTokenAnalysis.load_results(
+                path, max_response_chars=max_response_chars), paths))
+        results = {}
+        for path, frame in zip(paths, frames):
+            if frame.attrs["model"] in results:
+                raise ValueError(f"Two result sets belong to the model {frame.attrs['model']} ({path}).")
+            results[frame.attrs["model"]] = frame
+        return results
+
+    @staticmethod
+    def codepoints(strings: list[str], width: int = None) -> tuple[np.ndarray, np.ndarray]:
+        """
+        :param strings: strings to convert
+        :param width: number of code points per row, longer strings are cut off. The longest string by default.
+        :return: code point matrix (rows padded with 0) and the lengths of the (cut off) strings
+        """
+        if width is not None:
+            strings = list(map(operator.itemgetter(slice(0, width)), strings))
+        lengths = np.fromiter(map(len, strings), dtype=np.int64, count=len(strings))
+        width = int(lengths.max(initial=0)) if width is None else width
+        chars = np.zeros((len(strings), width), dtype=np.uint32)
+        # the code points of all strings in one buffer, a boolean mask scatters them row by row
+        chars[np.arange(width) < lengths[:, None]] = np.frombuffer("".join(strings).encode("utf-32-le"),
+                                                                   dtype=np.uint32)
+        return chars, lengths
+
+    @staticmethod
+    def edit_distance(a: list[str], b: list[str], max_chars: int = None) -> np.ndarray:
+        """
+        Levenshtein distances of the string pairs (a[i], b[i]) with the bit-parallel algorithm of Myers (in the
+        formulation of Hyyro): a column of the dynamic program is a 64 bit vector, so every code point of the other
+        string is one step of a few integer operations for thousands of pairs at once.
+        :param max_chars: strings are cut off after this many code points, MAX_CHARS by default (at most 64)
+        :return: distances as int array
+        """
+        max_chars = min(max_chars or GlitchTokenAnalysis.MAX_CHARS, 64)
+        chars_a, length_a = GlitchTokenAnalysis.codepoints(a, max_chars)
+        chars_b, length_b = GlitchTokenAnalysis.codepoints(b, max_chars)
+        # the distance is symmetric: the longer string of every pair is the bit vector, the steps follow the shorter
+        swap = length_a < length_b
+        longer, shorter = np.where(swap, length_b, length_a), np.where(swap, length_a, length_b)
+        distances = np.where(shorter == 0, longer, 0)
+        # pairs are grouped by their lengths in steps of 8 code points to keep the padding small
+        group = longer // 8 * 9 + shorter // 8
+        order = np.argsort(group, kind="stable")
+        order = order[shorter[order] > 0]
+        one = np.uint64(1)
+        for part in np.split(order, np.flatnonzero(np.diff(group[order])) + 1):
+            for start in range(0, len(part), GlitchTokenAnalysis.CHUNK):
+                rows = part[start:start + GlitchTokenAnalysis.CHUNK]
+                rows_long, rows_short, flip = longer[rows], shorter[rows], swap[rows, None]
+                chunk_a, chunk_b = chars_a[rows, :rows_long.max()], chars_b[rows, :rows_long.max()]
+                pattern = np.where(flip, chunk_b, chunk_a)
+                text = np.where(flip, chunk_a, chunk_b)[:, :rows_short.max()]
+                # match[:, i] has bit j set where pattern[:, j] == text[:, i]
+                bits = np.zeros((len(rows), text.shape[1], 8), dtype=np.uint8)
+                packed = np.packbits(text[:, :, None] == pattern[:, None, :], axis=2, bitorder="little")
+                bits[:, :, :packed.shape[2]] = packed
+                match = bits.view("<u8")[:, :, 0]
+                top = one << (rows_long.astype(np.uint64) - one)  # bit of the last row of the dynamic program
+                positive = np.full(len(rows), ~np.uint64(0))  # vertical differences +1
+                negative = np.zeros(len(rows), dtype=np.uint64)  # vertical differences -1
+                score = rows_long.copy()
+                for i in range(text.shape[1]):
+                    eq = match[:, i]
+                    vertical = eq | negative
+                    horizontal = (((eq & positive) + positive) ^ positive) | eq
+                    horizontal_positive = negative | ~(horizontal | positive)
+                    horizontal_negative = positive & horizontal
+                    active = i < rows_short
+                    score += ((horizontal_positive & top) != 0) & active
+                    score -= ((horizontal_negative & top) != 0) & active
+                    horizontal_positive = (horizontal_positive << one) | one
+                    horizontal_negative = horizontal_negative << one
+                    positive = horizontal_negative | ~(vertical | horizontal_positive)
+                    negative = horizontal_positive & vertical
+                distances[rows] = score
+        return distances
+
+    @staticmethod
+    def token_features(tokens: pd.Series) -> pd.DataFrame:
+        """
+        Character features of the decoded tokens ('Ġ' and '▁' are decoded to spaces), computed once per distinct token.
+        The character classes and scripts are counted over the first MAX_CHARS code points.
+        :return: chars, bytes, shares of the character classes, leading space and dominant script per token
+        """
+        codes, unique = pd.factorize(tokens)
+        text = [TokenPrior.normalize(token) for token in unique]
+        chars, lengths = GlitchTokenAnalysis.codepoints(text, min(max(map(len, text), default=0),
+                                                                  GlitchTokenAnalysis.MAX_CHARS))
+        valid = np.arange(chars.shape[1]) < lengths[:, None]
+        whitespace = np.isin(chars, GlitchTokenAnalysis.WHITESPACE) & valid
+        classes = {
+            "letters": ((chars >= 0x41) & (chars <= 0x5A)) | ((chars >= 0x61) & (chars <= 0x7A)),
+            "digits": (chars >= 0x30) & (chars <= 0x39),
+            "whitespace": whitespace,
+            "punctuation": (((chars >= 0x21) & (chars <= 0x2F)) | ((chars >= 0x3A) & (chars <= 0x40))
+                            | ((chars >= 0x5B) & (chars <= 0x60)) | ((chars >= 0x7B) & (chars <= 0x7E))),
+            "non_ascii": chars > 0x7F,
+            "control": ((chars < 0x20) | (chars == 0x7F) | ((chars >= 0x80) & (chars < 0xA0))) & ~whitespace,
+            "replacement": chars == 0xFFFD,  # incomplete UTF-8 sequences of byte-level tokens
+        }
+        denominator = np.maximum(lengths, 1)
+        features = {
+            "chars": np.fromiter(map(len, text), dtype=np.int64, count=len(text)),
+            "bytes": np.fromiter((len(string.encode("utf-8", errors="surrogatepass")) for string in text),
+                                 dtype=np.int64, count=len(text)),
+            **{f"share_{name}": (mask & valid).sum(axis=1) / denominator for name, mask in classes.items()},
+            "leading_space": chars[:, 0] == 0x20 if chars.shape[1] else np.zeros(len(text), dtype=bool),
+        }
+        # dominant script: script id of every code point by its range, counted per row
+        names = sorted({name for _, _, name in GlitchTokenAnalysis.SCRIPTS})
+        bounds = sorted(GlitchTokenAnalysis.SCRIPTS)
+        starts = np.array([start for start, _, _ in bounds])
+        ends = np.array([end for _, end, _ in bounds])
+        ids = np.array([names.index(name) for _, _, name in bounds])
+        position = np.clip(np.searchsorted(starts, chars, side="right") - 1, 0, len(bounds) - 1)
+        inside = (chars >= starts[position]) & (chars <= ends[position]) & valid
+        script = np.where(inside, ids[position], len(names))
+        rows = np.arange(len(text))[:, None]
+        counts = np.bincount((rows * (len(names) + 1) + script)[valid], minlength=len(text) * (len(names) + 1))
+        counts = counts.reshape(len(text), len(names) + 1)[:, :len(names)]
+        features["script"] = np.where(counts.max(axis=1, initial=0) > 0,
+                                      np.array(names, dtype=object)[counts.argmax(axis=1)], "other")
+        return pd.DataFrame({name: values[codes] for name, values in features.items()}, index=tokens.index)
+
+    @staticmethod
+    def echo(responses: pd.Series) -> pd.Series:
+        """
+        :return: the echoed string of responses to a repeat prompt: the first line without surrounding whitespace,
+        quotes and backticks
+        """
+        return pd.Series([response.strip().partition("\n")[0].strip(" \t'\"`") for response in responses.tolist()],
+                         index=responses.index, dtype=object)
+
+    @staticmethod
+    def response_features(frame: pd.DataFrame) -> pd.DataFrame:
+        """
+        Features of every response column res_<n>: length, length ratio to the token, whether the token is contained
+        and, for the echo stages (ECHO_STAGES), the normalized edit distance between the token and the echoed string.
+        """
+        tokens = frame["token"].tolist()
+        token_chars = np.maximum(frame["token"].str.len().to_numpy(), 1)
+        features = {}
+        for stage, column in enumerate(column for column in frame.columns if column.startswith("res_")):
+            responses = frame[column]
+            index = column.removeprefix("res_")
+            chars = responses.str.len().to_numpy()
+            features[f"chars_{index}"] = chars
+            features[f"ratio_{index}"] = chars / token_chars
+            features[f"contains_{index}"] = np.fromiter(map(operator.contains, responses.tolist(), tokens), dtype=bool,
+                                                        count=len(frame))
+            if stage in GlitchTokenAnalysis.ECHO_STAGES:
+                echoed = GlitchTokenAnalysis.echo(responses).tolist()
+                distance = GlitchTokenAnalysis.edit_distance(tokens, echoed)
+                echoed_chars = np.fromiter(map(len, echoed), dtype=np.int64, count=len(echoed))
+                features[f"distance_{index}"] = distance / np.maximum(
+                    np.minimum(np.maximum(token_chars, echoed_chars), GlitchTokenAnalysis.MAX_CHARS), 1)
+        return pd.DataFrame(features, index=frame.index)
+
+    @staticmethod
+    def failure_modes(frame: pd.DataFrame, features: pd.DataFrame) -> pd.DataFrame:
+        """
+        Categorizes the responses of the echo stages into FAILURE_MODES by rules on the response features.
+        :param frame: result set
+        :param features: response_features of the result set
+        :return: mode_<n> per echo stage and failure_mode, the mode of the first echo stage
+        """
+        modes = {}
+        columns = [column for column in frame.columns if column.startswith("res_")]
+        for stage in GlitchTokenAnalysis.ECHO_STAGES:
+            if stage >= len(columns):
+                continue
+            responses, index = frame[columns[stage]], columns[stage].removeprefix("res_")
+            chars, ratio = features[f"chars_{index}"].to_numpy(), features[f"ratio_{index}"].to_numpy()
+            distance = features[f"distance_{index}"].to_numpy()
+            conditions = [
+                (responses.isin(GlitchTokenAnalysis.ERROR_RESPONSES) | responses.str.startswith("ERROR occurred"))
+                .to_numpy(),
+                (responses.str.strip().str.len() == 0).to_numpy(),
+                responses.str.contains(GlitchTokenAnalysis.REFUSAL, regex=True).to_numpy(),
+                (chars >= GlitchTokenAnalysis.RUNAWAY_CHARS) & (ratio >= GlitchTokenAnalysis.RUNAWAY_RATIO),
+                distance == 0,
+                distance <= GlitchTokenAnalysis.PARTIAL_DISTANCE,
+                ratio >= GlitchTokenAnalysis.EXPLANATION_RATIO,
+            ]
+            modes[f"mode_{index}"] = np.select(conditions, GlitchTokenAnalysis.FAILURE_MODES[:-1],
+                                               GlitchTokenAnalysis.FAILURE_MODES[-1])
+        result = pd.DataFrame(modes, index=frame.index)
+        if len(result.columns):
+            result["failure_mode"] = result[result.columns[0]]
+        return result
+
+    @staticmethod
+    def features(frame: pd.DataFrame) -> pd.DataFrame:
+        """
+        :return: token_id, token, token features, response features and failure modes of a result set
+        """
+        response_features = GlitchTokenAnalysis.response_features(frame)
+        return pd.concat([frame[["token_id", "token"]], GlitchTokenAnalysis.token_features(frame["token"]),
+                          response_features, GlitchTokenAnalysis.failure_modes(frame, response_features)], axis=1)
+
+    @staticmethod
+    def cluster(features: pd.DataFrame, clusters: int = 8, seed: int = 0, iterations: int = 50) -> np.ndarray:
+        """
+        k-means clustering of the tokens. Numeric features are standardized, script and failure mode are one-hot
+        encoded, token id and token are left out. Above CLUSTER_SAMPLE tokens the centers are fitted on a random sample.
+        :return: cluster label per row
+        """
+        numeric = features.select_dtypes(include=["number", "bool"]).drop(columns=["token_id"], errors="ignore")
+        numeric = numeric.loc[:, [not column.startswith("chars_") for column in numeric.columns]]
+        matrix = numeric.to_numpy(dtype=float)
+        matrix = np.log1p(np.abs(matrix)) * np.sign(matrix)  # response lengths are heavy-tailed
+        matrix = (matrix - matrix.mean(axis=0)) / np.maximum(matrix.std(axis=0), 1e-9)
+        categories = [column for column in ("script", "failure_mode") if column in features.columns]
+        if categories:
+            matrix = np.hstack([matrix, pd.get_dummies(features[categories]).to_numpy(dtype=float)])
+        clusters = min(clusters, len(matrix))
+        if clusters == 0:
+            return np.zeros(0, dtype=np.int64)
+        generator = np.random.default_rng(seed)
+        sample = matrix if len(matrix) <= GlitchTokenAnalysis.CLUSTER_SAMPLE else \
+            matrix[generator.choice(len(matrix), GlitchTokenAnalysis.CLUSTER_SAMPLE, replace=False)]
+
+        def assign(points: np.ndarray, centers: np.ndarray) -> np.ndarray:
+            # squared distances without the n x k x d intermediate
+            return ((points ** 2).sum(axis=1)[:, None] - 2 * points @ centers.T + (centers ** 2).sum(axis=1)).argmin(
+                axis=1)
+
+        # k-means++ initialization, the distances to the nearest center are updated with every new center
+        centers = [sample[generator.integers(len(sample))]]
+        distances = np.full(len(sample), np.inf)
+        for _ in range(1, clusters):
+            distances = np.minimum(distances, ((sample - centers[-1]) ** 2).sum(axis=1))
+            total = distances.sum()
+            centers.append(sample[generator.choice(len(sample), p=distances / total) if total > 0 else
+                                  generator.integers(len(sample))])
+        centers = np.array(centers)
+        labels = None
+        for _ in range(iterations):
+            new_labels = assign(sample, centers)
+            if labels is not None and np.array_equal(new_labels, labels):
+                break
+            labels = new_labels
+            for index in range(clusters):
+                members = labels == index
+                if members.any():
+                    centers[index] = sample[members].mean(axis=0)
+        # the centers fitted on the sample are applied to all tokens
+        labels = np.concatenate([assign(matrix[start:start + GlitchTokenAnalysis.CLUSTER_SAMPLE], centers)
+                                 for start in range(0, len(matrix), GlitchTokenAnalysis.CLUSTER_SAMPLE)])
+        return labels
+
+    @staticmethod
+    def cross_model_overlap(results: dict[str, pd.DataFrame]) -> tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+        """
+        Overlaps of the glitch tokens of several models. Tokens of different tokenizers are compared by their decoded
+        text.
+        :param results: model -> result set
+        :return: membership matrix (decoded token x model, 1 = glitch token of the model, plus a 'models' count),
+        pairwise numbers of shared glitch tokens and pairwise Jaccard similarities
+        """
+        models = list(results)
+        # result sets of models with the same tokenizer share most tokens, every distinct token is decoded once
+        tokens, unique = pd.factorize(pd.concat([frame["token"] for frame in results.values()], ignore_index=True))
+        texts, unique_texts = pd.factorize(pd.Series([TokenPrior.normalize(token) for token in unique]))
+        matrix = np.zeros((len(unique_texts), len(models)), dtype=np.int64)
+        matrix[texts[tokens], np.repeat(np.arange(len(models)), [len(frame) for frame in results.values()])] = 1
+        membership = pd.DataFrame(matrix, index=pd.Index(unique_texts, name="text"), columns=models)
+        shared = matrix.T @ matrix
+        sizes = np.diag(shared)
+        union = sizes[:, None] + sizes[None, :] - shared
+        jaccard = np.divide(shared, union, out=np.zeros(shared.shape), where=union > 0)
+        membership["models"] = matrix.sum(axis=1)
+        return (membership.sort_values("models", ascending=False, kind="stable"),
+                pd.DataFrame(shared, index=models, columns=models), pd.DataFrame(jaccard, index=models, columns=models))
+
+    @staticmethod
+    def Analyze(paths: list[str], path_to_output_folder: str, clusters: int = 8, max_response_chars: int = None,
+                seed: int = 0, write_tokens: bool = True) -> dict:
+        """
+        Analyses several result sets and writes the results to a folder:
+        <model>_analysis.csv with the features, failure modes and cluster of every token, clusters.csv with a summary
+        of every cluster, membership.csv, overlap_counts.csv and overlap_jaccard.csv with the cross-model overlaps and
+        summary.json with the failure modes and scripts per model.
+
+        :param paths: result csv files or run journals
+        :param path_to_output_folder: output folder, created if necessary
+        :param clusters: number of k-means clusters, computed over the tokens of all models together
+        :param max_response_chars: optional cap of the response length
+        :param seed: seed of the clustering
+        :param write_tokens: write the <model>_analysis.csv files, formatting them dominates the run time of large sets
+        :return: the summary
+        """
+        os.makedirs(path_to_output_folder, exist_ok=True)
+        started = time.perf_counter()
+        results = GlitchTokenAnalysis.load_many(paths, max_response_chars=max_response_chars)
+        loaded = time.perf_counter()
+        features = {model: GlitchTokenAnalysis.features(frame) for model, frame in results.items()}
+        combined = pd.concat([frame.assign(model=model) for model, frame in features.items()], ignore_index=True)
+        combined["cluster"] = GlitchTokenAnalysis.cluster(
+            combined[[column for column in combined.columns
+                      if column in ("script", "failure_mode") or column.startswith(("share_", "ratio_", "distance_"))
+                      or column in ("chars", "bytes", "leading_space")]], clusters, seed)
+        membership, shared, jaccard = GlitchTokenAnalysis.cross_model_overlap(results)
+        analysed = time.perf_counter()
+
+        summary = {"models": {}, "clusters": []}
+        for model, frame in combined.groupby("model", sort=False):
+            if write_tokens:
+                frame.drop(columns="model").to_csv(
+                    os.path.join(path_to_output_folder, f"{re.sub(r'[^A-Za-z0-9_.-]', '_', model)}_analysis.csv"),
+                    sep=";", index=False, float_format="%.4f")
+            summary["models"][model] = {
+                "glitch_tokens": len(frame),
+                "failure_modes": frame["failure_mode"].value_counts().to_dict() if "failure_mode" in frame else {},
+                "scripts": frame["script"].value_counts().to_dict()}
+        for label, frame in combined.groupby("cluster"):
+            summary["clusters"].append({
+                "cluster": int(label), "tokens": len(frame),
+                "models": frame["model"].value_counts().to_dict(),
+                "script": frame["script"].mode().iat[0],
+                "failure_mode": frame["failure_mode"].mode().iat[0] if "failure_mode" in frame else None,
+                "mean_chars": round(float(frame["chars"].mean()), 2),
+                "examples": frame["token"].head(5).tolist()})
+        pd.DataFrame(summary["clusters"]).to_csv(os.path.join(path_to_output_folder, "clusters.csv"), sep=";",
+                                                 index=False)
+        membership.to_csv(os.path.join(path_to_output_folder, "membership.csv"), sep=";")
+        shared.to_csv(os.path.join(path_to_output_folder, "overlap_counts.csv"), sep=";")
+        jaccard.round(4).to_csv(os.path.join(path_to_output_folder, "overlap_jaccard.csv"), sep=";")
+        summary["shared_by_all_models"] = int((membership["models"] == len(results)).sum())
+        with open(os.path.join(path_to_output_folder, "summary.json"), "w", encoding="utf-8") as summary_file:
+            json.dump(summary, summary_file, indent=2, ensure_ascii=False)
+        print(f"analysed {len(combined)} tokens of {len(results)} models in {time.perf_counter() - started:.2f} s "
+              f"(loading {loaded - started:.2f} s, features, clustering and overlaps {analysed - loaded:.2f} s, "
+              f"writing {time.perf_counter() - analysed:.2f} s), results saved in {path_to_output_folder}")
+        return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Analysis of glitch token result sets.")
+    parser.add_argument("paths", nargs="+", help="result csv files or run journals (.jsonl)")
+    parser.add_argument("--output", default="analysis", help="output folder")
+    parser.add_argument("--clusters", type=int, default=8, help="number of k-means clusters")
+    parser.add_argument("--max-response-chars", type=int, help="cap of the response length")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the clustering")
+    parser.add_argument("--no-token-files", action="store_true", help="skip the <model>_analysis.csv files")
+    arguments = parser.parse_args()
+    GlitchTokenAnalysis.Analyze(arguments.paths, arguments.output, arguments.clusters, arguments.max_response_chars,
+                                arguments.seed, not arguments.no_token_files)
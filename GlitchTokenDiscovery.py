@@ -2,16 +2,61 @@
 Author: Maximilian Stefan Schreber
 email: max.schreber@tum.de
 """
-import subprocess
+from __future__ import annotations  # annotations must not trigger the lazy imports below
+import argparse, copy, subprocess, sys, zlib, importlib.util
 from abc import ABC, abstractmethod
-import signal, requests, json, datetime, csv, socket
+import json, datetime, csv, socket, time, os, random, hashlib, threading, ast, re, base64, queue, itertools
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait
 from datetime import datetime
-import pandas as pd
-from dotenv import dotenv_values
-from tqdm import tqdm
+from typing import Callable, Iterable, Iterator
+
+from Generators.BatchSubmitter import BatchSubmitter  # provider batch interface, shared with the Generators package
+
+#### LAZY IMPORTS OF HEAVY DEPENDENCIES --------------------------------------------------------------------------------
+def _lazy_import(name: str):
+    """
+    Registers a module that is only executed on the first attribute access (importlib.util.LazyLoader). Importing
+    pandas, numpy and requests takes most of the start-up time, which short worker processes do not need to pay.
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+
+np = _lazy_import("numpy")
+pd = _lazy_import("pandas")
+requests = _lazy_import("requests")
+urllib3 = _lazy_import("urllib3")
+
+
+def load_lazy_modules() -> None:
+    """
+    Executes the lazily imported modules. The LazyLoader is not thread-safe, so this is done before worker threads
+    may touch them for the first time.
+    """
+    for module in (np, pd, requests, urllib3):
+        getattr(module, "__file__", None)
 
 #### API KEY CONFIGURATION
-config = dotenv_values(".env")
+config: dict = None  # contents of the .env file, read on first use by load_config
+
+
+def load_config() -> dict:
+    """
+    :return: the configuration of the .env file in the working directory, read once
+    """
+    global config
+    if config is None:
+        from dotenv import dotenv_values
+        config = dotenv_values(".env")
+    return config
+
 #### DEFAULT PROMPTS
 default_prompts = [
     [0,"Your task is to repeat any String presented to you. A String is defined as any character sequence delimited by"
@@ -23,7 +68,7 @@ default_prompts = [
        "ence delimited by the first occurring and the last occurring single quote in the request. The bit sequence shou"
        "ld also be returned with whitespaces in between the byte representations. Example: Question: Can you return th"
        "e UTF-8 bit sequence of the string ’Banana’? Answer: 01000010 01100001 01101110 01100001 01101110 01100001",
-        "Can you return the UTF-8 bit sequence of the string '{}'?","\" \".join(f\"b:08b\" for b in token.encode(\"ut"
+        "Can you return the UTF-8 bit sequence of the string '{}'?","\" \".join(f\"{b:08b}\" for b in token.encode(\"ut"
         "f-8\")) in result"],
     [3,"Your task is to analyze a given String. A String is defined as any character sequence delimited by the first o"
        "ccurring and the last occurring single quote in the request. A ’normal’ character is defined as an English alp"
@@ -31,7 +76,9 @@ default_prompts = [
        "ges, including digits, symbols, punctuation or whitespaces are considered 'notnormal'. Example: The String ’3-"
        "2-1-Apple’ has 5 normal and 6 not normal characters. If prompted, return the tuple (#normal_characters, #not_no"
        "rmal_characters) and do not add anything else to your answer. Example: ’3-2-1-Apple’ returns the Tuple (5,6)",
-       "Can you please return the number of normal characters and the number of not normal characters of the String '{}'?"
+       "Can you please return the number of normal characters and the number of not normal characters of the String '{}'?",
+       "f\"({sum(c.isascii() and c.isalpha() for c in token)},{sum(not (c.isascii() and c.isalpha()) for c in token)})\""
+       " in result.replace(\" \", \"\")"
      ]
 ]
 
@@ -55,6 +102,18 @@ class ResponseGenerator(ABC):
         """
         pass
 
+    def generateResponses(self, model: str, prompts: list[str], systemInstruction: str) -> list[str]:
+        """
+        Batch variant of generateResponse for several prompts sharing the same system instruction. Implementations
+        may override it to use a native batch endpoint or a pooled client; by default the prompts are processed one
+        by one.
+        :param model: model name as listed in the generator
+        :param prompts: prompts to be processed by the LLM (generator)
+        :param systemInstruction: Instructions to the model before processing the prompts
+        :return: list of the model responses in the order of the prompts
+        """
+        return [self.generateResponse(model, prompt, systemInstruction) for prompt in prompts]
+
 #### TIMEOUT HANDLING --------------------------------------------------------------------------------------------------
 class TimeoutException(Exception):
     """
@@ -62,29 +121,70 @@ class TimeoutException(Exception):
     """
     pass
 
-def timeout_handler(signum, frame):
-    # Signal handler for raising TimeoutExceptions in case the model response exceeds a set threshold
-    raise TimeoutException("Timeout for model response")
+
+class ServiceUnavailableException(Exception):
+    """
+    Exception to be raised when a service stays unavailable longer than allowed. It is not recorded as the result of a
+    token but aborts the run, which can be resumed from its journal.
+    """
+    pass
 
 #### OLLAMA IMPLEMENTATION OF RESPONSE GENERATOR INTERFACE -------------------------------------------------------------
 class OllamaResponseGenerator(ResponseGenerator):
     TIMEOUT_SECONDS: int = 30  # default timeout duration 30 sec
     API_URL: str = "http://localhost:11434/api/generate"  # default ollama local server api url
 
-    def __init__(self, timeout_seconds: int = None, api_url: str = None, temperature: int = 0):
+    POOL_SIZE: int = 16  # default number of pooled keep-alive connections
+    SUPPORTS_EARLY_STOP: bool = False  # True if generateResponse accepts a stop_condition (streaming mode)
+    PREFIX_CACHE_KEEP_ALIVE: str = "30m"  # keep_alive of prefix cache runs, the model stays loaded between stages
+
+    def __init__(self, timeout_seconds: int = None, api_url: str = None, temperature: int = 0,
+                 pool_size: int = None, stream: bool = False, max_chars: int = None, num_predict: int = None,
+                 keep_alive: str | int = None):
+        """
+        :param timeout_seconds: timeout per request
+        :param api_url: generate endpoint of the Ollama server
+        :param temperature: temperature of model responses
+        :param pool_size: number of pooled keep-alive connections
+        :param stream: consume the response as a stream. The generation is cancelled as soon as max_chars is reached
+        or the stop_condition of the request is met.
+        :param max_chars: maximum number of characters of a streamed response, longer responses are cut off
+        :param num_predict: maximum number of tokens the model generates (Ollama option num_predict)
+        :param keep_alive: how long Ollama keeps the model loaded after a request, e.g. '30m' or -1 (forever). The
+        server default unloads idle models after 5 minutes, which drops the cached prompt prefix as well.
+        """
         # optional change of timeout threshold
         self.TIMEOUT_SECONDS = timeout_seconds if timeout_seconds is not None else self.TIMEOUT_SECONDS
         # optional change of api_url in case of request redirection (i.e. ngrok/Google Colab)
         self.API_URL = api_url if api_url is not None else self.API_URL
         # temperature of model responses. Default value 0 to avoid model misbehavior
         self.temperature = temperature
+        # one persistent session for all requests. Connections are kept alive instead of opening a new TCP
+        # connection per token, the pool should be at least as large as the number of concurrent requests
+        self.POOL_SIZE = pool_size if pool_size is not None else self.POOL_SIZE
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=self.POOL_SIZE)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        # output length caps, runaway responses of glitch tokens would otherwise occupy the server until the timeout
+        self.stream = stream
+        self.max_chars = max_chars
+        self.num_predict = num_predict
+        self.SUPPORTS_EARLY_STOP = stream
+        self.keep_alive = keep_alive
+        # prompt evaluation statistics reported by Ollama, by (model, system instruction)
+        self._prompt_stats: dict[tuple[str, str], dict] = {}
+        self._prompt_stats_lock = threading.Lock()
 
-    def generateResponse(self, model: str, prompt: str, systemInstruction: str) -> str:
+    def generateResponse(self, model: str, prompt: str, systemInstruction: str,
+                         stop_condition: Callable[[str], bool] = None) -> str:
         """
         Implementation of ResponseGenerator Interface.
         :param model: model name
         :param prompt: prompt to be processed by the LLM (generator)
         :param systemInstruction: Instructions to the model before processing the prompt..Further instructions on how to
+        :param stop_condition: optional function of the partial response. In streaming mode the generation is stopped
+        as soon as it returns True.
         :return: string of the model response
         """
         # Input data type validation
@@ -92,32 +192,95 @@ class OllamaResponseGenerator(ResponseGenerator):
             raise ValueError("All inputs should be strings.")
 
         # create json payload for model request
+        data = self._payload(model, prompt, systemInstruction)
+
+        # POST request to ollama API. The timeout is handled by the socket instead of a SIGALRM handler, so the
+        # generator can also be used from the worker threads of the RequestEngine
+        try:
+            return self._request(self.API_URL, data, stop_condition)
+        except requests.exceptions.Timeout:
+            print("timeout")
+            return "timeout"
+        except requests.exceptions.HTTPError:
+            # server errors are reported like any other failed request
+            return "ERROR"
+
+    def _payload(self, model: str, prompt: str, systemInstruction: str) -> dict:
         data = {
             "model": model,
             "system": systemInstruction,
             "prompt": prompt,
-            "stream": False,  # response should be sent as a single entity
+            "stream": self.stream,  # by default the response should be sent as a single entity
             "options": {
                 "temperature": self.temperature
             },
         }
+        if self.num_predict is not None:
+            data["options"]["num_predict"] = self.num_predict
+        if self.keep_alive is not None:
+            data["keep_alive"] = self.keep_alive
+        return data
 
-        # configure the timeout signal handler
-        signal.signal(signal.SIGALRM, timeout_handler)
-        signal.alarm(self.TIMEOUT_SECONDS)
+    def _request(self, api_url: str, data: dict, stop_condition: Callable[[str], bool] = None) -> str:
+        # sends the payload to an Ollama server. Raises the requests exceptions for timeouts and connection errors
+        # and an HTTPError for server errors (status code >= 500)
+        start = time.monotonic()
+        response = self.session.post(api_url, json=data, timeout=self.TIMEOUT_SECONDS, stream=self.stream)
+        with response:
+            if response.status_code >= 500:
+                print(f"Request failed with status code {response.status_code}")
+                print("Response Text:", response.text)
+                response.raise_for_status()
+            if not self.stream or response.status_code != 200:
+                return self._parse_response(response, data)
+            return self._read_stream(response, data, start, stop_condition)
 
-        # POST request to ollama API
+    def _read_stream(self, response: requests.Response, data: dict, start: float,
+                     stop_condition: Callable[[str], bool] = None) -> str:
+        # consumes the chunked response until it is done, too long or decided. Leaving the with-block of _request
+        # closes the connection, which makes Ollama cancel the generation
+        deadline = time.monotonic() + self.TIMEOUT_SECONDS
+        response_text = ""
+        first_chunk = None  # seconds until the first chunk arrived (time to first token)
         try:
-            response = requests.post(self.API_URL, json=data)
-            signal.alarm(0)
-        except TimeoutException as e:
-            print("timeout")
-            return "timeout"
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                chunk = json.loads(line)
+                if "error" in chunk:
+                    print(f"Error in response stream: {chunk['error']}")
+                    return "ERROR"
+                if first_chunk is None:
+                    first_chunk = time.monotonic() - start
+                response_text += chunk.get("response", "")
+                if chunk.get("done"):
+                    self._record_prompt_stats(data, chunk, first_chunk)
+                    break
+                if self.max_chars is not None and len(response_text) >= self.max_chars:
+                    response_text = response_text[:self.max_chars]
+                    self._record_prompt_stats(data, {}, first_chunk)  # cancelled, Ollama sends no statistics
+                    break
+                if stop_condition is not None and stop_condition(response_text):
+                    self._record_prompt_stats(data, {}, first_chunk)
+                    break
+                if time.monotonic() > deadline:
+                    raise requests.exceptions.Timeout("Timeout for model response")
+        except requests.exceptions.ConnectionError as e:
+            # a read timeout while streaming surfaces as a ConnectionError
+            if e.args and isinstance(e.args[0], urllib3.exceptions.ReadTimeoutError):
+                raise requests.exceptions.Timeout(e)
+            raise
+        if not response_text:
+            print("No answer")
+            return "ERROR"
+        return response_text
 
+    def _parse_response(self, response: requests.Response, data: dict) -> str:
         # retrieve ollama response and extracting response text
         if response.status_code == 200:
             try:
                 output = response.json()
+                self._record_prompt_stats(data, output)
                 response_text = output.get("response")  # filter the prompt answer
                 if response_text:
                     return response_text
@@ -134,227 +297,3309 @@ class OllamaResponseGenerator(ResponseGenerator):
         # Necessary for keeping a flow in testing algorithm
         return "ERROR"
 
-#### PUSH NOTIFICATIONS FOR REMOTE STATUS UPDATE (OPTIONAL, ONLY USED AS A CONVENIENCE BENEFIT) ------------------------
-class PushNotification:
-    @staticmethod
-    def send_push(message: str) -> None:
-        api_token: str = config.get("PUSHOVER_API_TOKEN")
-        user_key: str = config.get("PUSHOVER_USER_KEY")
-        if api_token is None or user_key is None: return
-        url = "https://api.pushover.net/1/messages.json"
-        data = {
-            "token": api_token,
-            "user": user_key,
-            "message": message
+    def _record_prompt_stats(self, data: dict, output: dict, first_chunk: float = None) -> None:
+        # durations of Ollama are reported in nanoseconds. Prompt tokens found in the KV cache are not evaluated
+        # again, so prompt_eval_count drops for requests sharing the prefix of the previous request.
+        with self._prompt_stats_lock:
+            entry = self._prompt_stats.setdefault((data["model"], data["system"]), {
+                "requests": 0, "reported": 0, "prompt_eval_count": 0, "max_prompt_eval_count": 0,
+                "prompt_eval_ns": 0, "load_ns": 0, "first_chunks": 0, "first_chunk_seconds": 0.0})
+            entry["requests"] += 1
+            if "prompt_eval_duration" in output or "prompt_eval_count" in output:
+                entry["reported"] += 1
+                entry["prompt_eval_count"] += output.get("prompt_eval_count", 0)
+                entry["max_prompt_eval_count"] = max(entry["max_prompt_eval_count"], output.get("prompt_eval_count", 0))
+                entry["prompt_eval_ns"] += output.get("prompt_eval_duration", 0)
+                entry["load_ns"] += output.get("load_duration", 0)
+            if first_chunk is not None:
+                entry["first_chunks"] += 1
+                entry["first_chunk_seconds"] += first_chunk
+
+    def prompt_stats(self) -> dict:
+        """
+        Prompt evaluation statistics of the requests so far, as reported by Ollama.
+        prefix_reuse estimates the share of prompt tokens taken from the KV cache: the longest prompt of a system
+        instruction counts as fully evaluated, every shorter evaluation is attributed to a reused prefix.
+        :return: requests, evaluated prompt tokens, mean prompt evaluation and model load time, mean time to first
+        token (measured in streaming mode, prompt evaluation plus load time otherwise) and prefix_reuse
+        """
+        with self._prompt_stats_lock:
+            entries = [dict(entry) for entry in self._prompt_stats.values()]
+        reported = sum(entry["reported"] for entry in entries)
+        evaluated = sum(entry["prompt_eval_count"] for entry in entries)
+        full = sum(entry["reported"] * entry["max_prompt_eval_count"] for entry in entries)
+        prompt_eval_ns = sum(entry["prompt_eval_ns"] for entry in entries)
+        load_ns = sum(entry["load_ns"] for entry in entries)
+        first_chunks = sum(entry["first_chunks"] for entry in entries)
+        time_to_first_token = None
+        if first_chunks:
+            time_to_first_token = sum(entry["first_chunk_seconds"] for entry in entries) / first_chunks * 1000
+        elif reported:
+            time_to_first_token = (prompt_eval_ns + load_ns) / reported / 1e6
+        return {
+            "requests": sum(entry["requests"] for entry in entries),
+            "prompt_tokens_evaluated": evaluated,
+            "mean_prompt_eval_ms": round(prompt_eval_ns / reported / 1e6, 3) if reported else None,
+            "mean_load_ms": round(load_ns / reported / 1e6, 3) if reported else None,
+            "mean_time_to_first_token_ms": round(time_to_first_token, 3) if time_to_first_token is not None else None,
+            "prefix_reuse": round(1 - evaluated / full, 4) if full else None,
         }
-        response = requests.post(url, data=data)
 
-#### GLITCH FINDER METHOD TO IMPLEMENT MAIN FUNCTIONALITY --------------------------------------------------------------
-class GlitchFinder:
+    def generateResponses(self, model: str, prompts: list[str], systemInstruction: str) -> list[str]:
+        """
+        Batch implementation of the ResponseGenerator Interface. Ollama has no batch endpoint, so the prompts are sent
+        in parallel over the pooled session.
+        :param model: model name
+        :param prompts: prompts to be processed by the LLM (generator)
+        :param systemInstruction: Instructions to the model before processing the prompts
+        :return: list of the model responses in prompt order
+        """
+        with ThreadPoolExecutor(max_workers=max(1, min(self.POOL_SIZE, len(prompts)))) as pool:
+            return list(pool.map(lambda prompt: self.generateResponse(model, prompt, systemInstruction), prompts))
+
+#### MULTI-ENDPOINT OLLAMA LOAD BALANCING ------------------------------------------------------------------------------
+class OllamaEndpoint:
+    """
+    Bookkeeping of a single Ollama server in a PooledOllamaResponseGenerator.
+    """
+    LATENCY_SMOOTHING: float = 0.2  # weight of the newest request in the moving latency average
+
+    def __init__(self, api_url: str):
+        self.api_url = api_url
+        self.in_flight = 0
+        self.latency = None  # moving average of the request latency in seconds, None until the first response
+        self.requests = 0
+        self.failures = 0  # total number of failed requests
+        self.consecutive_failures = 0
+        self.down_until = 0.0  # monotonic time until which the endpoint is not used after a failure
+
+    def healthy(self, now: float) -> bool:
+        return now >= self.down_until
+
+    def load(self) -> float:
+        # expected waiting time for one more request, unknown latencies are treated optimistically
+        return (self.in_flight + 1) * (self.latency or 0.0)
+
+    def stats(self) -> dict:
+        return {"api_url": self.api_url, "requests": self.requests, "failures": self.failures,
+                "in_flight": self.in_flight, "latency": self.latency, "healthy": self.healthy(time.monotonic())}
+
+
+class PooledOllamaResponseGenerator(OllamaResponseGenerator):
+    """
+    Ollama generator distributing the requests over several Ollama servers. Every request is routed to the healthy
+    endpoint with the lowest expected waiting time (requests in flight times average latency). Endpoints failing with
+    a connection error or a server error are drained for a cool-down period and the request is repeated on another
+    endpoint, so the run continues as long as one server is reachable.
+    """
+    FAILURE_COOLDOWN: float = 30.0  # seconds an endpoint is skipped after a failure, doubled per repeated failure
+
+    def __init__(self, api_urls: list[str], timeout_seconds: int = None, temperature: int = 0,
+                 pool_size: int = None, failure_cooldown: float = None, stream: bool = False, max_chars: int = None,
+                 num_predict: int = None, keep_alive: str | int = None):
+        """
+        :param api_urls: generate endpoints of the Ollama servers, e.g. http://host:11434/api/generate
+        :param timeout_seconds: timeout per request. Timeouts are model behaviour and not counted as failures.
+        :param temperature: temperature of model responses
+        :param pool_size: keep-alive connections per endpoint
+        :param failure_cooldown: seconds a failed endpoint is skipped before it is tried again
+        :param stream: streaming mode with early exit, see OllamaResponseGenerator
+        :param max_chars: maximum number of characters of a streamed response
+        :param num_predict: maximum number of tokens the model generates
+        :param keep_alive: how long every server keeps the model loaded after a request
+        """
+        if not api_urls:
+            raise ValueError("At least one api url is required.")
+        super().__init__(timeout_seconds=timeout_seconds, api_url=api_urls[0], temperature=temperature,
+                         pool_size=pool_size, stream=stream, max_chars=max_chars, num_predict=num_predict,
+                         keep_alive=keep_alive)
+        adapter = requests.adapters.HTTPAdapter(pool_connections=len(api_urls), pool_maxsize=self.POOL_SIZE)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.FAILURE_COOLDOWN = failure_cooldown if failure_cooldown is not None else self.FAILURE_COOLDOWN
+        self.endpoints = [OllamaEndpoint(api_url) for api_url in api_urls]
+        self._lock = threading.Lock()
+
+    def _acquire(self, tried: set) -> OllamaEndpoint:
+        # picks the least loaded healthy endpoint. If none is healthy, the one recovering first is probed.
+        with self._lock:
+            now = time.monotonic()
+            candidates = [endpoint for endpoint in self.endpoints if endpoint.api_url not in tried]
+            if not candidates:
+                return None
+            healthy = [endpoint for endpoint in candidates if endpoint.healthy(now)]
+            endpoint = (min(healthy, key=OllamaEndpoint.load) if healthy
+                        else min(candidates, key=lambda candidate: candidate.down_until))
+            endpoint.in_flight += 1
+            return endpoint
+
+    def _release(self, endpoint: OllamaEndpoint, latency: float = None, failed: bool = False) -> None:
+        with self._lock:
+            endpoint.in_flight -= 1
+            endpoint.requests += 1
+            if failed:
+                endpoint.failures += 1
+                endpoint.consecutive_failures += 1
+                cooldown = self.FAILURE_COOLDOWN * 2 ** min(endpoint.consecutive_failures - 1, 6)
+                endpoint.down_until = time.monotonic() + cooldown
+                return
+            endpoint.consecutive_failures = 0
+            if latency is not None:
+                endpoint.latency = latency if endpoint.latency is None else (
+                        OllamaEndpoint.LATENCY_SMOOTHING * latency
+                        + (1 - OllamaEndpoint.LATENCY_SMOOTHING) * endpoint.latency)
+
+    def generateResponse(self, model: str, prompt: str, systemInstruction: str,
+                         stop_condition: Callable[[str], bool] = None) -> str:
+        """
+        Implementation of ResponseGenerator Interface, routed to the least loaded healthy endpoint.
+        :raises ConnectionError: if the request failed on every endpoint
+        """
+        if any(not isinstance(var, str) for var in [model, prompt, systemInstruction]):
+            raise ValueError("All inputs should be strings.")
+        data = self._payload(model, prompt, systemInstruction)
+        tried = set()
+        errors = []
+        while (endpoint := self._acquire(tried)) is not None:
+            tried.add(endpoint.api_url)
+            start = time.monotonic()
+            try:
+                response_text = self._request(endpoint.api_url, data, stop_condition)
+            except requests.exceptions.Timeout:
+                self._release(endpoint, latency=time.monotonic() - start)
+                print("timeout")
+                return "timeout"
+            except requests.exceptions.RequestException as e:
+                self._release(endpoint, failed=True)  # drain the endpoint and try the next one
+                errors.append(f"{endpoint.api_url}: {e}")
+                continue
+            self._release(endpoint, latency=time.monotonic() - start)
+            return response_text
+        raise ConnectionError(f"Request failed on all Ollama endpoints: {errors}")
+
+    def endpoint_stats(self) -> list[dict]:
+        """
+        :return: requests, failures, requests in flight, average latency and health of every endpoint
+        """
+        with self._lock:
+            return [endpoint.stats() for endpoint in self.endpoints]
+
+#### PERSISTENT RESPONSE CACHE -----------------------------------------------------------------------------------------
+class CachedResponseGenerator(ResponseGenerator):
+    """
+    Content-addressed on-disk cache (SQLite) in front of any ResponseGenerator. Responses are keyed by the generator
+    type, model, system instruction, final prompt and sampling options, so re-runs with changed predicates, a different
+    prompt order or an overlapping tokenizer only send requests that were never answered before.
+    """
+    # options of a generator that change its responses, caps of the response length are only part of the key if set
+    KEY_OPTIONS: tuple[str, ...] = ("temperature", "num_predict", "max_chars", "stream")
+
+    def __init__(self, generator: ResponseGenerator, path_to_cache: str, max_entries: int = None,
+                 max_bytes: int = None, read_only: bool = False, options: dict = None, generator_name: str = None):
+        """
+        :param generator: ResponseGenerator to be cached. May be None in read_only mode, cache misses raise a
+        LookupError then.
+        :param path_to_cache: file path of the SQLite cache
+        :param max_entries: optional maximum number of cached responses, least recently used ones are evicted
+        :param max_bytes: optional maximum size of all cached responses in bytes (UTF-8)
+        :param read_only: never write to the cache, misses are answered by the generator without storing them
+        :param options: sampling options that are part of the key. Defaults to the KEY_OPTIONS of the generator, so
+        responses cut short by num_predict or max_chars are not replayed to runs without these caps.
+        :param generator_name: name of the generator in the key, defaults to the class name of the generator
+        """
+        if generator is None and not read_only:
+            raise ValueError("A generator is required unless the cache is opened read-only.")
+        self.generator = generator
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.read_only = read_only
+        self.options = options if options is not None else CachedResponseGenerator.key_options(generator)
+        self.generator_name = generator_name if generator_name is not None else type(generator).__name__
+        self.hits = self.misses = self.stores = self.evictions = 0
+        self._lock = threading.Lock()
+
+        import sqlite3
+        if read_only:
+            self._db = sqlite3.connect(f"file:{path_to_cache}?mode=ro", uri=True, check_same_thread=False)
+        else:
+            self._db = sqlite3.connect(path_to_cache, isolation_level=None, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute("CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, response TEXT NOT NULL, "
+                             "size INTEGER NOT NULL, last_used REAL NOT NULL)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+        self._entries, self._bytes = self._db.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+
     @staticmethod
-    def GlitchTest(path_to_token_csv_or_json: str,
-                   path_to_output_csv: str,
-                   model: str,
-                   generator: ResponseGenerator = None,
-                   path_to_intermediate_res_folder: str = None,
-                   path_to_prompts_csv: str = None,
-                   saving_interval=300,
-                   topN=None,
-                   sendSMS: bool = False) -> None:
+    def key_options(generator: ResponseGenerator) -> dict:
         """
-        Main Method to extract glitch tokens from a closed source model with the use of a predefined list of prompts
-        listed in this python file.
+        :return: KEY_OPTIONS of the generator. Wrappers like the ScheduledResponseGenerator are looked through.
+        """
+        while generator is not None and not hasattr(generator, "temperature") and hasattr(generator, "generator"):
+            generator = generator.generator
+        options = {"temperature": getattr(generator, "temperature", None)}
+        options.update((name, getattr(generator, name)) for name in CachedResponseGenerator.KEY_OPTIONS[1:]
+                       if getattr(generator, name, None) not in (None, False))
+        return options
 
-        :param topN: for testing and debugging of data: if set. the token will be sliced at the set row number
-        :param path_to_intermediate_res_folder: folder path to save the intermediate results in case intermediate
-        results are wished.
-        :param path_to_prompts_csv: path to SEMICOLON SEPARATED Prompt CSV of the form
-        [PROMPT_ID, SYSTEM_INSTRUCTION, PROMPT_TEXT, PREDICATE]
-        :param generator: ResponseGenerator implementation to execute model requests
-        :param saving_interval: interval for the intermediate saving option
-        :param model: name of the model as listed in ollama server
-        :param path_to_token_csv_or_json: File path to the csv-file containing the tokens in the following format:
-        <Token-id>;<Token>
-        :param path_to_output_csv: File path to the result file in which the values will be positioned as follows:
-        <Token-ID>;<Token>;<Prompt1_answer>;<Prompt2_answer>;<Prompt3_answer>
-        :param sendSMS if an SMS should be sent to update on status.
-        :return results only in form of a saved csv file
+    def _key(self, model: str, prompt: str, system_instruction: str) -> str:
+        content = json.dumps([self.generator_name, model, system_instruction, prompt, self.options],
+                             sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+    def _lookup(self, key: str):
+        with self._lock:
+            row = self._db.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            if not self.read_only:  # refresh the entry for the LRU eviction
+                self._db.execute("UPDATE responses SET last_used = ? WHERE key = ?", (time.time(), key))
+            return row[0]
+
+    def _store(self, key: str, response: str) -> None:
+        # failed requests are not cached, they should be repeated in the next run
+        if self.read_only or not isinstance(response, str) or response == "timeout" or response.startswith("ERROR"):
+            return
+        size = len(response.encode("utf-8"))
+        with self._lock:
+            previous = self._db.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            self._db.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)", (key, response, size, time.time()))
+            self._entries += 0 if previous else 1
+            self._bytes += size - (previous[0] if previous else 0)
+            self.stores += 1
+            self._evict()
+
+    def _evict(self) -> None:
+        # removes the least recently used entries until the size bounds hold again: a single ordered scan finds the
+        # newest entry to remove, one statement deletes it together with all older entries
+        excess_entries = self._entries - self.max_entries if self.max_entries is not None else 0
+        excess_bytes = self._bytes - self.max_bytes if self.max_bytes is not None else 0
+        if excess_entries <= 0 and excess_bytes <= 0:
+            return
+        count = freed = 0
+        cutoff = None
+        cursor = self._db.execute("SELECT last_used, rowid, size FROM responses ORDER BY last_used, rowid")
+        for last_used, rowid, size in cursor:
+            count, freed, cutoff = count + 1, freed + size, (last_used, rowid)
+            if count >= excess_entries and freed >= excess_bytes:
+                break
+        cursor.close()
+        if cutoff is None:
+            return
+        self._db.execute("DELETE FROM responses WHERE last_used < ? OR (last_used = ? AND rowid <= ?)",
+                         (cutoff[0], *cutoff))
+        self._entries -= count
+        self._bytes -= freed
+        self.evictions += count
+
+    def _forward(self, model: str, prompts: list[str], system_instruction: str) -> list[str]:
+        if self.generator is None:
+            raise LookupError("Response not cached and no generator available (read-only cache).")
+        if len(prompts) == 1:
+            return [self.generator.generateResponse(model, prompts[0], system_instruction)]
+        return self.generator.generateResponses(model, prompts, system_instruction)
+
+    def generateResponse(self, model: str, prompt: str, systemInstruction: str) -> str:
         """
-        # Choosing the standard model provider
-        if generator is None:
-            print("Choosing Ollama as model serving engine!")
-            generator = OllamaResponseGenerator()
-            model_is_installed = False
-            try: # check whether the model is installed
-                result = subprocess.run(["ollama", "list", "--json"], capture_output=True, text=True, check=True)
-                models = json.loads(result.stdout)
-                installed_models = [model["name"] for model in models.get("models", [])]
-                model_is_installed = model_name in installed_models
+        Returns the cached response or forwards the request to the wrapped generator and caches its response.
+        """
+        key = self._key(model, prompt, systemInstruction)
+        response = self._lookup(key)
+        if response is None:
+            response = self._forward(model, [prompt], systemInstruction)[0]
+            self._store(key, response)
+        return response
+
+    def generateResponses(self, model: str, prompts: list[str], systemInstruction: str) -> list[str]:
+        """
+        Batch lookup, only the cache misses are forwarded to the wrapped generator as one batch.
+        """
+        keys = [self._key(model, prompt, systemInstruction) for prompt in prompts]
+        responses = [self._lookup(key) for key in keys]
+        missing = [i for i, response in enumerate(responses) if response is None]
+        if missing:
+            for i, response in zip(missing, self._forward(model, [prompts[i] for i in missing], systemInstruction)):
+                responses[i] = response
+                self._store(keys[i], response)
+        return responses
+
+    def stats(self) -> dict:
+        """
+        :return: hit/miss statistics and the current size of the cache
+        """
+        lookups = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hits / lookups if lookups else 0.0,
+                "stores": self.stores, "evictions": self.evictions, "entries": self._entries, "bytes": self._bytes}
+
+    def close(self) -> None:
+        self._db.close()
+
+#### RATE LIMITING, RETRIES AND CIRCUIT BREAKING ----------------------------------------------------------------------
+class TokenBucket:
+    """
+    Thread-safe token bucket. acquire() blocks until the requested amount is available.
+    """
+
+    def __init__(self, rate_per_minute: float, capacity: float = None):
+        """
+        :param rate_per_minute: refill rate of the bucket
+        :param capacity: maximum burst size, defaults to one second worth of refill (at least 1)
+        """
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else max(1.0, self.rate)
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, amount: float = 1.0) -> float:
+        """
+        :return: seconds spent waiting
+        """
+        amount = min(amount, self.capacity)  # larger amounts would never fit into the bucket
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= amount:
+                    self._tokens -= amount
+                    return waited
+                delay = (amount - self._tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+
+class ScheduledResponseGenerator(ResponseGenerator):
+    """
+    Scheduling layer around any ResponseGenerator for rate limited APIs. Requests are throttled by token buckets for
+    requests and (estimated) tokens per minute, transient errors (429, 5xx, timeouts, connection errors) are retried
+    with exponential backoff and jitter, and a circuit breaker pauses all requests after a series of failures instead
+    of letting thousands of tokens fail during an outage.
+    """
+    TRANSIENT_STATUS_CODES = {408, 409, 425, 429, 500, 502, 503, 504, 529}
+    TRANSIENT_ERRORS = (TimeoutException, ConnectionError, TimeoutError)  # and the connection errors of requests
+    TRANSIENT_ERROR_NAMES = {"APIConnectionError", "APITimeoutError", "RateLimitError", "InternalServerError"}
+
+    def __init__(self, generator: ResponseGenerator, requests_per_minute: float = None,
+                 tokens_per_minute: float = None, max_retries: int = 5, backoff_base: float = 1.0,
+                 backoff_max: float = 60.0, breaker_threshold: int = 10, breaker_cooldown: float = 60.0,
+                 expected_output_tokens: int = 64, retry_results: tuple[str, ...] = ("ERROR",),
+                 max_outage: float = None):
+        """
+        :param generator: ResponseGenerator to be scheduled
+        :param requests_per_minute: optional request rate limit
+        :param tokens_per_minute: optional token rate limit. Prompt tokens are estimated with 4 characters per token.
+        :param max_retries: retries of a request after a transient error before the error is passed on
+        :param backoff_base: initial backoff in seconds, doubled with every retry (full jitter)
+        :param backoff_max: maximum backoff in seconds
+        :param breaker_threshold: consecutive failed attempts that open the circuit breaker
+        :param breaker_cooldown: seconds the circuit stays open before a probe request is let through. Doubles with
+        every failed probe, up to 16 times the initial value.
+        :param expected_output_tokens: tokens added to the prompt estimate for the token rate limit
+        :param retry_results: results of the generator that are treated as transient errors (e.g. the 'ERROR' result
+        of the Ollama generator)
+        :param max_outage: optional seconds the circuit may stay open before a ServiceUnavailableException aborts the
+        run. Without it the requests wait until a probe succeeds.
+        """
+        self.generator = generator
+        self.request_bucket = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.token_bucket = TokenBucket(tokens_per_minute, capacity=tokens_per_minute / 6) if tokens_per_minute else None
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker_threshold = breaker_threshold
+        self.breaker_cooldown = breaker_cooldown
+        self.expected_output_tokens = expected_output_tokens
+        self.retry_results = set(retry_results)
+        self.max_outage = max_outage
+        self.retries = self.circuit_opens = 0
+        self.throttled_seconds = 0.0
+        self._state = "closed"  # closed: requests pass, open: requests wait, half_open: one probe request in flight
+        self._failures = 0
+        self._open_until = 0.0
+        self._outage_start = 0.0  # time the circuit opened after being closed
+        self._current_cooldown = breaker_cooldown
+        self._condition = threading.Condition()
+        self._random = random.Random()
+
+    def _is_transient(self, error: Exception) -> bool:
+        status_code = getattr(error, "status_code", None)
+        if status_code is None and getattr(error, "response", None) is not None:
+            status_code = getattr(error.response, "status_code", None)
+        return (status_code in self.TRANSIENT_STATUS_CODES or isinstance(error, self.TRANSIENT_ERRORS)
+                or isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout))
+                or type(error).__name__ in self.TRANSIENT_ERROR_NAMES)
+
+    @staticmethod
+    def _retry_after(error: Exception) -> float:
+        # Retry-After header of a rate limit response, if the error carries one
+        headers = getattr(getattr(error, "response", None), "headers", None) or {}
+        try:
+            return float(headers.get("retry-after") or headers.get("Retry-After"))
+        except (TypeError, ValueError):
+            return None
+
+    def _await_circuit(self) -> None:
+        with self._condition:
+            while True:
+                if self._state == "closed":
+                    return
+                now = time.monotonic()
+                if self.max_outage is not None and now - self._outage_start >= self.max_outage:
+                    raise ServiceUnavailableException(f"circuit breaker open for {now - self._outage_start:.1f} s, "
+                                                      f"longer than max_outage")
+                if self._state == "open" and now >= self._open_until:
+                    self._state = "half_open"  # this request is the probe
+                    return
+                deadline = self._open_until if self._state == "open" else float("inf")
+                if self.max_outage is not None:
+                    deadline = min(deadline, self._outage_start + self.max_outage)
+                self._condition.wait(timeout=max(deadline - now, 0.05) if deadline < float("inf") else None)
+
+    def _record(self, success: bool) -> bool:
+        # returns whether the circuit is open (or half-open) after the attempt
+        with self._condition:
+            if success:
+                self._state, self._failures, self._current_cooldown = "closed", 0, self.breaker_cooldown
+                self._condition.notify_all()
+                return False
+            self._failures += 1
+            if self._state == "half_open" or (self._state == "closed" and self._failures >= self.breaker_threshold):
+                if self._state == "half_open":
+                    self._current_cooldown = min(self._current_cooldown * 2, self.breaker_cooldown * 16)
+                else:
+                    self._outage_start = time.monotonic()
+                self._state = "open"
+                self._open_until = time.monotonic() + self._current_cooldown
+                self.circuit_opens += 1
+                print(f"circuit breaker open after {self._failures} failed requests, "
+                      f"pausing for {self._current_cooldown:.1f} s")
+                self._condition.notify_all()
+            return self._state != "closed"
+
+    def _throttle(self, prompt: str, systemInstruction: str) -> None:
+        if self.request_bucket is not None:
+            self.throttled_seconds += self.request_bucket.acquire()
+        if self.token_bucket is not None:
+            estimate = (len(prompt) + len(systemInstruction)) / 4 + self.expected_output_tokens
+            self.throttled_seconds += self.token_bucket.acquire(estimate)
+
+    def generateResponse(self, model: str, prompt: str, systemInstruction: str) -> str:
+        """
+        Forwards the request to the wrapped generator, throttled and retried on transient errors. While the circuit is
+        open, failed attempts do not count as retries, the request waits for a successful probe instead.
+        """
+        attempt = 0
+        while True:
+            self._await_circuit()
+            self._throttle(prompt, systemInstruction)
+            retry_after = None
+            try:
+                result = self.generator.generateResponse(model, prompt, systemInstruction)
+                if result not in self.retry_results:
+                    self._record(success=True)
+                    return result
+                failure = None
             except Exception as e:
-                print(f"Error: {e}")
+                if not self._is_transient(e):
+                    self._record(success=True)  # the service answered, the request itself is faulty
+                    raise
+                failure, retry_after = e, self._retry_after(e)
+            if self._record(success=False):
+                continue  # outage, _await_circuit blocks until a probe succeeds or max_outage is exceeded
+            if attempt >= self.max_retries:
+                if failure is not None:
+                    raise failure
+                return result
+            attempt += 1
+            self.retries += 1
+            # exponential backoff with full jitter, a Retry-After of the server takes precedence
+            delay = retry_after if retry_after is not None else self._random.uniform(
+                0, min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1)))
+            time.sleep(delay)
 
-            if not model_is_installed:
-                print(f"Model {model} not installed! Try pulling it by executing the command 'ollama pull {model}'.")
-                return None # termination
+    def stats(self) -> dict:
+        """
+        :return: retries, circuit breaker openings, throttling time and the current circuit state
+        """
+        return {"retries": self.retries, "circuit_opens": self.circuit_opens,
+                "throttled_seconds": self.throttled_seconds, "circuit": self._state}
 
-        # for csv saving
-        def save_token_map_to_csv(data: pd.DataFrame, day, month, year, hour, minute, prompt_nr, folder, model):
-            filename = f"intermediate_res_{model}_{day}-{month}-{year}_{hour}{minute}_p{prompt_nr}.csv"
-            data.to_csv(f"{folder}/{filename}", sep=";", index=False)
+#### RUN METRICS AND PROFILING -----------------------------------------------------------------------------------------
+class RunMetrics:
+    """
+    Instrumentation of a GlitchTest run: request latency histograms per stage, time spent in predicate evaluation,
+    waiting for responses and saving, error and timeout counters by type and the number of requests in flight.
+    Hooks are called with (event, data) for every 'request', 'stage_start', 'stage_end' and 'run_end' event. They run
+    on the thread that triggers the event (request events on the worker threads) and have to be fast and thread-safe.
+    Snapshots can be written to a file (JSON for *.json, Prometheus text format otherwise) and served via HTTP.
+    """
+    LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, float("inf"))
 
-        # Console output coloring
-        GREEN = "\033[92m"
-        RED = "\033[91m"
-        BLUE = "\033[94m"
-        RESET = "\033[0m"
-        bar_format = f"{GREEN}{{l_bar}}{{bar}}{{r_bar}}{RESET}"  # progress bar coloring
+    def __init__(self, hooks: list[Callable[[str, dict], None]] = None, path_to_snapshot: str = None,
+                 snapshot_interval: float = 30.0, port: int = None, profiler: str = None,
+                 path_to_profile: str = None, host: str = "127.0.0.1"):
+        """
+        :param hooks: callables receiving (event, data)
+        :param path_to_snapshot: optional file that is rewritten with the current metrics every snapshot_interval
+        seconds, e.g. for the textfile collector of the Prometheus node exporter
+        :param snapshot_interval: seconds between two snapshot files
+        :param port: optional port serving the metrics at /metrics (Prometheus) and /metrics.json
+        :param profiler: optional 'cprofile' (deterministic, slower) or 'sampling' (stack samples every 10 ms, suited
+        for long production runs) profiling of the run
+        :param path_to_profile: output of the profiler: pstats file for 'cprofile', collapsed stacks (flame graph
+        input) for 'sampling'. The 15 most expensive functions are printed if not set.
+        :param host: interface the metrics are served on, only the local machine by default. '0.0.0.0' exposes the
+        run data on every interface.
+        """
+        if profiler not in (None, "cprofile", "sampling"):
+            raise ValueError("profiler has to be 'cprofile' or 'sampling'.")
+        self.hooks = list(hooks or [])
+        self.path_to_snapshot = path_to_snapshot
+        self.snapshot_interval = snapshot_interval
+        self.port = port
+        self.host = host
+        self.profiler = profiler
+        self.path_to_profile = path_to_profile
+        self.stage = 0
+        self.in_flight = 0
+        self.histograms: dict[int, list[int]] = {}  # stage -> request count per latency bucket
+        self.latency_sums: dict[int, float] = {}
+        self.phase_seconds = {"predicate": 0.0, "waiting": 0.0, "saving": 0.0}
+        self.errors: dict[str, int] = {}
+        self.tested: dict[int, int] = {}
+        self.failed: dict[int, int] = {}
+        self.sources: dict[str, Callable[[], dict]] = {}  # name -> stats() of generators and caches
+        self._lock = threading.Lock()
+        self._last_snapshot = time.monotonic()
+        self._server = None
+        self._profile = None
 
-        # fixating time and date values for traceability
-        now = datetime.now()
-        day_now, month_now, year_now, hour_now, min_now = now.day, now.month, now.year, now.hour, now.minute
+    def add_hook(self, hook: Callable[[str, dict], None]) -> None:
+        self.hooks.append(hook)
 
-        # 1 Read in the token map
-        # 1.1 Convert JSON-Tokenizer
-        print("reading in tokens...")
-        if path_to_token_csv_or_json.endswith(".csv"):
-            with open(path_to_token_csv_or_json, 'r', encoding='utf-8') as token_csv:
-                csv_reader = csv.reader(token_csv, delimiter=';')
-                next(csv_reader)  # skip header row
-                # create a dictionary with KV-pairs TOKEN-ID:int,TOKEN:str
-                token_map: dict[int, str] = {int(row[0]): row[1] for row in csv_reader}
-        elif path_to_token_csv_or_json.endswith(".json"):
-            with open(path_to_token_csv_or_json, 'r', encoding='utf-8') as token_json:
-                json_reader = json.load(token_json)
-            vocab = json_reader.get("model", {}).get("vocab", {})
-            token_map: dict[int, str] = {token_id: token for token, token_id in vocab.items()}  # swap ID and TOKEN pos
-        else:  # wrong file format
-            raise ValueError("Wrong file format. Expected .csv ([TOKEN_ID; TOKEN]) "
-                             "or .json ({\"model\":{\"vocab\"{\"<token>\": <id>}}})")
+    def add_source(self, name: str, stats: Callable[[], dict]) -> None:
+        """
+        Includes the statistics of a component, e.g. generator.stats, in every snapshot.
+        """
+        self.sources[name] = stats
 
-        # topN option: slicing the token set to only test upper n tokens of the tokenizer
-        if topN is not None:
-            old_size_of_map = len(token_map)
-            token_map = dict(list(token_map.items())[:topN])
-            print(f"sliced Token set from {old_size_of_map} to {topN} tokens.")
+    def _emit(self, event: str, data: dict) -> None:
+        for hook in self.hooks:
+            try:
+                hook(event, data)
+            except Exception as e:  # a faulty hook must not stop the run
+                print(f"metrics hook {hook} failed: {e}")
 
-        print("reading in prompts...")
+    def request_started(self, count: int = 1) -> None:
+        with self._lock:
+            self.in_flight += count
 
-        # 2 Read in the prompts, save as nested lists via pandas
-        if path_to_prompts_csv is not None:
-            df = pd.read_csv(path_to_prompts_csv, delimiter=";")
-            prompts = df.values.tolist()
-        else:
-            prompts = default_prompts
-
-        # push notification with initialization information
-        sendSMS and PushNotification.send_push(
-            f"Starting the tests with {len(prompts)} prompts on model {model} with {len(token_map)} "
-            f"tokens.\nThe program is running on {socket.gethostname()}.")
-        print("starting the testing proces...")
-        SMS_count = 0  # for SMS tracing
-
-        # token set initialization
-        remaining_tokens = [[token_id, token] for token_id, token in token_map.items()]
-
-        # 3 Iterating every prompt
-        for prompt in prompts:
-            # extracting prompt parameters
-            prompt_index, system_instruction = prompt[0], prompt[1]
-            prompt_string, prompt_predicate = prompt[2], prompt[3]
-            """
-            Lingo for predicate is a string containing the predicate with 'result' as model response
-            and 'token' as the token to be tested in the current iteration
-            """
-            # traceability measures
-            print(f"Testing prompt {prompt_index + 1} of {len(prompts)}: {prompt_string}")
-            print(f"{RED}{len(remaining_tokens)}{RESET} Tokens remaining")
-            # quarter marks for push notifications
-            marks: list[int] = [int(len(remaining_tokens) * 0.25), int(len(remaining_tokens) * 0.5),
-                                int(len(remaining_tokens) * 0.75), int(len(remaining_tokens))]
-            # initialisation of set for tokens to fail the test
-            result_tokens = []
-            # progress bar and iterable configuration with tqdm progress bar
-            pbar = tqdm(remaining_tokens, desc="Processing Tokens ", bar_format=bar_format)
-            # 4 iterating every remaining token
-            for token_row in pbar:  # token row is a list of values for the token (id, token, predicate,..)
-                token, token_index = token_row[1], token_row[0]
-                # update progress bar
-                pbar.set_description(f"Processing Tokens Stage {prompt_index + 1} '{token}'")
-                # 5 sending the request to the response generator
-                try:
-                    final_prompt = prompt_string.replace("{}", token)  # insert the token
-                    result = generator.generateResponse(model, final_prompt,
-                                                        system_instruction)
-                except Exception as e:
-                    result = f"ERROR occurred: {e}"
-                    # send push to fathom error origin
-                    sendSMS and PushNotification.send_push(f"⚠️ An error occurred. Message: {e}")
-
-                # 6 result evaluation based on provided predicate string
-                try:
-                    test_eval: bool = bool(eval(prompt_predicate))
-                except Exception as e:
-                    test_eval: bool = False  # any test failures will mark the test as failed
-                    print(
-                        f"Error while evaluating predicate for prompt {prompt_index + 1}. Predicate: {prompt_predicate}; Message: {e}")
-
-                if not test_eval:
-                    # if eval fails, the token remains in the list for next prompt tests.
-                    # nested list row format [id,token,res1,res2,res3,res4,...]
-                    result_entry = [token_index, token]
-                    if prompt_index != 0:  # first prompt iteration has no result so skipping the result fishing
-                        # retrieves the previous results of earlier tests and appends current results for token
-                        for res_i in range(2, prompt_index + 2):
-                            result_entry.append(token_row[res_i])  # previous results
-                    result_entry.append(result)  # new result
-                    result_tokens.append(result_entry)  # assembled row into result token list
-
-                # intermediate result saving based on token-id and set interval
-                if ((token_index % saving_interval == 0 or token_index == len(remaining_tokens) - 1)
-                        and path_to_intermediate_res_folder is not None):
-                    save_token_map_to_csv(pd.DataFrame(result_tokens), day_now, month_now, year_now, hour_now, min_now,
-                                          prompt_index, path_to_intermediate_res_folder, model)
-
-                # send status SMS
-                if sendSMS and SMS_count in marks:
-                    PushNotification.send_push(
-                        f"{model}-test Stage {prompt_index + 1} of {len(prompts)}:"
-                        f"{SMS_count / len(remaining_tokens) * 100:.2f}% done.")
-                SMS_count += 1
-
-            # 7 reallocate remaining tokens for next iteration
-            remaining_tokens = result_tokens
-
-            # saving the final results of prompt test if requested
-            if path_to_intermediate_res_folder is not None:
-                save_token_map_to_csv(pd.DataFrame(result_tokens), day_now, month_now, year_now, hour_now, min_now,
-                                  prompt_index, path_to_intermediate_res_folder,
-                                  f"{model}_finalresultIn{prompt_index}.csv")
-
-        # final save of result of last prompt test iteration
-        print("saving the final results...")
-        columns = ["token_id", "token"]
-        for prompt_index in range(len(prompts)):  # creating column names for all prompts
-            columns.append(f"res_{prompt_index + 1}")  # enumerating all result columns
-        end_result = pd.DataFrame(columns=columns, data=remaining_tokens)
-
-        # csv export
-        end_result.to_csv(path_to_output_csv, index=False, sep=";")
+    def request_finished(self, count: int, seconds: float, results: list[tuple[str, Exception]]) -> None:
+        """
+        :param count: number of prompts of the request (batch size)
+        :param seconds: duration of the request
+        :param results: (result, error) per prompt
+        """
+        stage = self.stage
+        bucket = next(index for index, bound in enumerate(self.LATENCY_BUCKETS) if seconds <= bound)
+        with self._lock:
+            self.in_flight -= count
+            histogram = self.histograms.setdefault(stage, [0] * len(self.LATENCY_BUCKETS))
+            histogram[bucket] += count
+            self.latency_sums[stage] = self.latency_sums.get(stage, 0.0) + seconds * count
+            for result, error in results:
+                kind = type(error).__name__ if error is not None else result if result in ("timeout", "ERROR") \
+                    else None
+                if kind is not None:
+                    self.errors[kind] = self.errors.get(kind, 0) + 1
+        self.hooks and self._emit("request", {"stage": stage, "seconds": seconds, "count": count})
 
-        # end communication
-        print(f"{RED}{len(remaining_tokens)}{RESET} Tokens failed all tests and will be saved in a final csv-file.")
+    def count_error(self, kind: str, count: int = 1) -> None:
+        with self._lock:
+            self.errors[kind] = self.errors.get(kind, 0) + count
 
-        sendSMS and PushNotification.send_push(f"{len(remaining_tokens)} tokens found in test for model {model}."
-                                               f"The files are saved in {path_to_output_csv}.🥳 ")
-        print(f"file saved in {BLUE}{path_to_output_csv}{RESET}")
+    def add_phase(self, phase: str, seconds: float) -> None:
+        self.phase_seconds[phase] = self.phase_seconds.get(phase, 0.0) + seconds
 
+    def count_tokens(self, stage: int, tested: int, failed: int) -> None:
+        self.tested[stage] = self.tested.get(stage, 0) + tested
+        self.failed[stage] = self.failed.get(stage, 0) + failed
 
-#### MAIN METHODOLOGY --------------------------------------------------------------------------------------------------
-if __name__ == "__main__":
+    def start_stage(self, stage: int, tokens: int) -> None:
+        self.stage = stage
+        self._emit("stage_start", {"stage": stage, "tokens": tokens})
+
+    def end_stage(self, stage: int) -> None:
+        self._emit("stage_end", {"stage": stage, "tested": self.tested.get(stage, 0),
+                                 "failed": self.failed.get(stage, 0)})
+        self.write_snapshot()
+
+    def snapshot(self) -> dict:
+        """
+        :return: all metrics as a JSON serializable dict
+        """
+        with self._lock:
+            snapshot = {
+                "stage": self.stage + 1,
+                "in_flight": self.in_flight,
+                "request_latency": {str(stage + 1): {"buckets": dict(zip(map(str, self.LATENCY_BUCKETS), histogram)),
+                                                     "count": sum(histogram), "sum": self.latency_sums[stage]}
+                                    for stage, histogram in self.histograms.items()},
+                "phase_seconds": dict(self.phase_seconds),
+                "errors": dict(self.errors),
+                "tested": {str(stage + 1): count for stage, count in self.tested.items()},
+                "failed": {str(stage + 1): count for stage, count in self.failed.items()},
+            }
+        for name, stats in self.sources.items():
+            try:
+                snapshot[name] = stats()
+            except Exception as e:
+                snapshot[name] = {"error": str(e)}
+        return snapshot
+
+    def to_prometheus(self) -> str:
+        """
+        :return: metrics in the Prometheus text exposition format
+        """
+        snapshot = self.snapshot()
+        lines = ["# TYPE glitch_request_seconds histogram"]
+        for stage, histogram in snapshot["request_latency"].items():
+            cumulative = 0
+            for bound, count in histogram["buckets"].items():
+                cumulative += count
+                bound = "+Inf" if bound == "inf" else bound
+                lines.append(f'glitch_request_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+            lines.append(f'glitch_request_seconds_sum{{stage="{stage}"}} {histogram["sum"]}')
+            lines.append(f'glitch_request_seconds_count{{stage="{stage}"}} {histogram["count"]}')
+        lines.append("# TYPE glitch_phase_seconds_total counter")
+        lines += [f'glitch_phase_seconds_total{{phase="{phase}"}} {seconds}'
+                  for phase, seconds in snapshot["phase_seconds"].items()]
+        lines.append("# TYPE glitch_errors_total counter")
+        lines += [f'glitch_errors_total{{type="{kind}"}} {count}' for kind, count in snapshot["errors"].items()]
+        for name in ("tested", "failed"):
+            lines.append(f"# TYPE glitch_tokens_{name}_total counter")
+            lines += [f'glitch_tokens_{name}_total{{stage="{stage}"}} {count}'
+                      for stage, count in snapshot[name].items()]
+        lines += ["# TYPE glitch_requests_in_flight gauge", f"glitch_requests_in_flight {snapshot['in_flight']}",
+                  "# TYPE glitch_stage gauge", f"glitch_stage {snapshot['stage']}"]
+        for name in self.sources:
+            for key, value in snapshot[name].items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    lines.append(f"glitch_{name}_{re.sub(r'[^a-zA-Z0-9_]', '_', key)} {value}")
+        return "\n".join(lines) + "\n"
+
+    def write_snapshot(self) -> None:
+        """
+        Rewrites the snapshot file atomically, if one is configured.
+        """
+        self._last_snapshot = time.monotonic()
+        if self.path_to_snapshot is None:
+            return
+        content = json.dumps(self.snapshot(), indent=2) if self.path_to_snapshot.endswith(".json") \
+            else self.to_prometheus()
+        with open(f"{self.path_to_snapshot}.tmp", "w", encoding="utf-8") as snapshot_file:
+            snapshot_file.write(content)
+        os.replace(f"{self.path_to_snapshot}.tmp", self.path_to_snapshot)
+
+    def tick(self) -> None:
+        """
+        Writes a snapshot if the snapshot interval has passed, called regularly by the run loop.
+        """
+        if self.path_to_snapshot is not None and time.monotonic() - self._last_snapshot >= self.snapshot_interval:
+            self.write_snapshot()
+
+    def start(self) -> None:
+        """
+        Starts the metrics endpoint and the profiler, if configured.
+        """
+        if self.port is not None and self._server is None:
+            from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+            metrics = self
+
+            class MetricsHandler(BaseHTTPRequestHandler):
+                def log_message(self, format, *args):
+                    pass
+
+                def do_GET(self):
+                    if self.path not in ("/metrics", "/metrics.json"):
+                        self.send_error(404)
+                        return
+                    json_format = self.path.endswith(".json")
+                    body = (json.dumps(metrics.snapshot()) if json_format else metrics.to_prometheus()).encode()
+                    self.send_response(200)
+                    self.send_header("Content-Type", "application/json" if json_format else "text/plain; version=0.0.4")
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+
+            self._server = ThreadingHTTPServer((self.host, self.port), MetricsHandler)
+            self._server.daemon_threads = True
+            threading.Thread(target=self._server.serve_forever, daemon=True).start()
+            print(f"serving metrics on {self.host}:{self._server.server_address[1]}")
+        if self.profiler == "cprofile":
+            import cProfile
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+        elif self.profiler == "sampling":
+            self._profile = SamplingProfiler()
+            self._profile.start()
+
+    def stop(self) -> None:
+        """
+        Stops the profiler (writing its output) and the metrics endpoint and writes the last snapshot.
+        """
+        self._emit("run_end", self.snapshot())
+        self.write_snapshot()
+        if isinstance(self._profile, SamplingProfiler):
+            self._profile.stop()
+            if self.path_to_profile is not None:
+                self._profile.save(self.path_to_profile)
+            else:
+                self._profile.print()
+        elif self._profile is not None:
+            import pstats
+            self._profile.disable()
+            if self.path_to_profile is not None:
+                self._profile.dump_stats(self.path_to_profile)
+            else:
+                pstats.Stats(self._profile).sort_stats("cumulative").print_stats(15)
+        self._profile = None
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def summary(self) -> str:
+        requests_seconds = sum(self.latency_sums.values())
+        requests_count = sum(sum(histogram) for histogram in self.histograms.values())
+        phases = ", ".join(f"{phase} {seconds:.1f} s" for phase, seconds in self.phase_seconds.items())
+        return (f"{requests_count} requests, mean latency {requests_seconds / max(requests_count, 1):.3f} s, "
+                f"time split: {phases}, errors: {self.errors or 'none'}")
+
+
+class SamplingProfiler:
     """
-    The main method is configured to choose all necessary files by file select windows 
+    Low-overhead profiler for long runs. A background thread samples the stacks of all other threads and counts
+    them, the result can be saved as collapsed stacks for flame graph tools.
+    """
+
+    def __init__(self, interval: float = 0.01):
+        """
+        :param interval: seconds between two samples
+        """
+        self.interval = interval
+        self.samples: dict[str, int] = {}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self) -> None:
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(f"{frame.f_code.co_name} ({os.path.basename(frame.f_code.co_filename)}:"
+                                 f"{frame.f_code.co_firstlineno})")
+                    frame = frame.f_back
+                key = ";".join(reversed(stack))
+                self.samples[key] = self.samples.get(key, 0) + 1
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._sample, daemon=True, name="glitch-profiler")
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread is not None and self._thread.join()
+
+    def save(self, path: str) -> None:
+        """
+        Writes the samples as collapsed stacks ('frame;frame;frame count' per line).
+        """
+        with open(path, "w", encoding="utf-8") as profile_file:
+            profile_file.writelines(f"{stack} {count}\n" for stack, count in self.samples.items())
+
+    def print(self, top: int = 15) -> None:
+        """
+        Prints the functions that were found on top of the stack (self time) most often.
+        """
+        own_time: dict[str, int] = {}
+        for stack, count in self.samples.items():
+            leaf = stack.rsplit(";", 1)[-1]
+            own_time[leaf] = own_time.get(leaf, 0) + count
+        total = max(sum(own_time.values()), 1)
+        for leaf, count in sorted(own_time.items(), key=lambda item: -item[1])[:top]:
+            print(f"{count / total:7.2%}  {leaf}")
+
+#### CONCURRENT REQUEST ENGINE -----------------------------------------------------------------------------------------
+class RequestEngine:
+    """
+    Executes the model requests of a test stage with a configurable number of requests in flight. Results are handed
+    back in the order the requests were submitted, so the stage evaluation stays deterministic no matter in which
+    order the model server answers.
+    """
+
+    def __init__(self, generator: ResponseGenerator, model: str, max_workers: int = 1, request_timeout: float = None,
+                 batch_size: int = 1, metrics: RunMetrics = None):
+        """
+        :param generator: ResponseGenerator implementation to execute model requests
+        :param model: name of the model as listed in the generator
+        :param max_workers: number of requests (or batches) that may be in flight at the same time
+        :param request_timeout: optional timeout in seconds per request. Works on any thread, a request exceeding it
+        is reported with the result 'timeout' and its worker is abandoned.
+        :param batch_size: number of prompts handed to generator.generateResponses at once. 1 uses generateResponse.
+        :param metrics: optional RunMetrics recording latency, errors and requests in flight
+        """
+        if max_workers < 1 or batch_size < 1:
+            raise ValueError("max_workers and batch_size must be at least 1.")
+        self.generator = generator
+        self.model = model
+        self.max_workers = max_workers
+        self.request_timeout = request_timeout
+        self.batch_size = batch_size
+        self.metrics = metrics
+
+    def _units(self, jobs: Iterable[tuple]) -> Iterator[list[tuple]]:
+        # groups the jobs into units of work. A batch only contains prompts sharing the same system instruction
+        unit = []
+        for job in jobs:
+            if unit and (len(unit) == self.batch_size or unit[0][1] != job[1]):
+                yield unit
+                unit = []
+            unit.append(job)
+        if unit:
+            yield unit
+
+    def _call(self, prompt: str, system_instruction: str,
+              stop_condition: Callable[[str], bool] = None) -> tuple[str, Exception]:
+        try:
+            if stop_condition is not None and getattr(self.generator, "SUPPORTS_EARLY_STOP", False):
+                return self.generator.generateResponse(self.model, prompt, system_instruction,
+                                                       stop_condition=stop_condition), None
+            return self.generator.generateResponse(self.model, prompt, system_instruction), None
+        except ServiceUnavailableException:
+            raise  # aborts the run instead of failing the token
+        except Exception as e:  # per-token error capture
+            return None, e
+
+    def _execute(self, unit: list[tuple], started: list) -> list[tuple[str, Exception]]:
+        started.append(time.monotonic())  # start time is needed to not count the queueing time into the timeout
+        if self.metrics is None:
+            return self._dispatch(unit)
+        self.metrics.request_started(len(unit))
+        results = []
+        try:
+            results = self._dispatch(unit)
+            return results
+        finally:
+            self.metrics.request_finished(len(unit), time.monotonic() - started[0], results)
+
+    def _dispatch(self, unit: list[tuple]) -> list[tuple[str, Exception]]:
+        if len(unit) == 1:
+            return [self._call(*unit[0])]
+        try:
+            results = self.generator.generateResponses(self.model, [job[0] for job in unit], unit[0][1])
+            if len(results) != len(unit):
+                raise ValueError(f"Expected {len(unit)} responses from the batch, got {len(results)}.")
+            return [(result, None) for result in results]
+        except Exception:
+            # a failed batch is repeated request by request to attribute the error to the responsible token
+            return [self._call(*job) for job in unit]
+
+    def _await(self, future, started: list, submitted: float) -> list[tuple[str, Exception]]:
+        # waits for a single unit, measuring the timeout from the moment a worker picked the unit up. Returns None if
+        # no worker picked the unit up within the timeout after its submission
+        while self.request_timeout is not None:
+            remaining = (started[0] if started else submitted) + self.request_timeout - time.monotonic()
+            done, _ = wait([future], timeout=max(remaining, 0))
+            if done:
+                break
+            if started and time.monotonic() - started[0] >= self.request_timeout:
+                future.cancel()
+                raise TimeoutException("Timeout for model response")
+            if not started and time.monotonic() - submitted >= self.request_timeout:
+                return None
+        return future.result()
+
+    def run(self, jobs: Iterable[tuple]) -> Iterator[tuple[str, Exception]]:
+        """
+        Sends all requests and yields the responses in request order.
+        :param jobs: iterable of (final_prompt, system_instruction) tuples. An optional third element is a stop
+        condition for generators supporting an early stop (only used for single requests, not for batches).
+        :return: iterator of (result, error) tuples. error is None on success, otherwise the raised exception
+        """
+        if self.max_workers == 1 and self.request_timeout is None:
+            # sequential execution on the calling thread, identical to the classic behaviour
+            for unit in self._units(jobs):
+                yield from self._execute(unit, [])
+            return
+
+        pools = [ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="glitch-request")]
+        pending = deque()  # (future, start time list, unit, submission time) in submission order
+        window = 2 * self.max_workers  # units queued ahead, keeps the workers busy while the head is awaited
+        units = self._units(jobs)
+
+        def submit(unit: list[tuple]) -> tuple:
+            started = []
+            return pools[-1].submit(self._execute, unit, started), started, unit, time.monotonic()
+
+        def replace_pool() -> None:
+            # the workers of abandoned requests stay blocked, so the units no worker picked up yet are moved to a
+            # fresh pool. Running units of the old pool finish there
+            pools.append(ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="glitch-request"))
+            for index, (future, started, unit, _) in enumerate(pending):
+                if not started and future.cancel():
+                    pending[index] = submit(unit)
+            pools[-2].shutdown(wait=False, cancel_futures=True)
+
+        try:
+            while True:
+                while len(pending) < window:
+                    unit = next(units, None)
+                    if unit is None:
+                        break
+                    pending.append(submit(unit))
+                if not pending:
+                    return
+                future, started, unit, submitted = pending.popleft()
+                try:
+                    results = self._await(future, started, submitted)
+                except TimeoutException:
+                    print("timeout")
+                    self.metrics is not None and self.metrics.count_error("timeout", len(unit))
+                    replace_pool()
+                    yield from [("timeout", None)] * len(unit)
+                    continue
+                if results is None:
+                    # all workers are blocked by abandoned requests, the unit is sent again on a fresh pool
+                    pending.appendleft((future, started, unit, submitted))
+                    replace_pool()
+                    continue
+                yield from results
+        finally:
+            # do not wait for abandoned (timed out) requests
+            for pool in pools:
+                pool.shutdown(wait=False, cancel_futures=True)
 
+#### PROVIDER BATCH JOBS -----------------------------------------------------------------------------------------------
+class LocalBatchSubmitter(BatchSubmitter):
     """
+    Filesystem batch endpoint for tests and local runs. Every submitted batch gets its own folder with the input file,
+    a status file and an OpenAI-style output file. The requests are processed on a background thread by a
+    ResponseGenerator.
+    """
+    POLL_INTERVAL: float = 0.5
+
+    def __init__(self, generator: ResponseGenerator, path_to_folder: str, max_workers: int = 1):
+        """
+        :param generator: ResponseGenerator answering the batch requests
+        :param path_to_folder: folder the batches are stored in
+        :param max_workers: number of concurrent requests of a batch
+        """
+        self.generator = generator
+        self.path_to_folder = path_to_folder
+        self.max_workers = max_workers
+        os.makedirs(path_to_folder, exist_ok=True)
+
+    def _path(self, batch_id: str, name: str) -> str:
+        return os.path.join(self.path_to_folder, batch_id, name)
+
+    def submit(self, path_to_batch_file: str) -> str:
+        batch_id = f"batch_{datetime.now():%Y%m%d%H%M%S}_{os.urandom(4).hex()}"
+        os.makedirs(os.path.join(self.path_to_folder, batch_id))
+        with open(path_to_batch_file, encoding="utf-8") as batch_file:
+            batch_requests = [json.loads(line) for line in batch_file if line.strip()]
+        with open(self._path(batch_id, "input.jsonl"), "w", encoding="utf-8") as input_file:
+            input_file.writelines(json.dumps(request, ensure_ascii=False) + "\n" for request in batch_requests)
+        self._write_status(batch_id, "in_progress")
+        threading.Thread(target=self._process, args=(batch_id, batch_requests), daemon=True).start()
+        return batch_id
+
+    def _write_status(self, batch_id: str, status: str) -> None:
+        with open(self._path(batch_id, "status.json.tmp"), "w") as status_file:
+            json.dump({"id": batch_id, "status": status}, status_file)
+        os.replace(self._path(batch_id, "status.json.tmp"), self._path(batch_id, "status.json"))
+
+    def _answer(self, request: dict) -> dict:
+        body = request["body"]
+        system = "".join(message["content"] for message in body["messages"] if message["role"] == "system")
+        prompt = "".join(message["content"] for message in body["messages"] if message["role"] == "user")
+        try:
+            content = self.generator.generateResponse(body["model"], prompt, system)
+            return {"custom_id": request["custom_id"], "error": None, "response": {
+                "status_code": 200, "body": {"choices": [{"message": {"role": "assistant", "content": content}}]}}}
+        except Exception as e:
+            return {"custom_id": request["custom_id"], "response": None,
+                    "error": {"code": type(e).__name__, "message": str(e)}}
+
+    def _process(self, batch_id: str, batch_requests: list[dict]) -> None:
+        try:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as pool, \
+                    open(self._path(batch_id, "output.jsonl"), "w", encoding="utf-8") as output_file:
+                for line in pool.map(self._answer, batch_requests):
+                    output_file.write(json.dumps(line, ensure_ascii=False) + "\n")
+            self._write_status(batch_id, "completed")
+        except Exception as e:
+            print(f"batch {batch_id} failed: {e}")
+            self._write_status(batch_id, "failed")
+
+    def status(self, batch_id: str) -> str:
+        try:
+            with open(self._path(batch_id, "status.json")) as status_file:
+                return json.load(status_file)["status"]
+        except FileNotFoundError as e:
+            raise LookupError(f"unknown batch {batch_id}") from e
+
+    def results(self, batch_id: str) -> dict[str, str]:
+        if not os.path.exists(self._path(batch_id, "output.jsonl")):
+            return {}
+        with open(self._path(batch_id, "output.jsonl"), encoding="utf-8") as output_file:
+            return self.parse_output(output_file)
+
+#### PREDICATE ENGINE --------------------------------------------------------------------------------------------------
+class Predicate:
+    """
+    Compiled test predicate. The predicate string is parsed once, validated against an allowed subset of Python
+    expressions and evaluated with only 'token', 'result' and a few side effect free builtins in scope. Common
+    predicate forms (containment checks of the token or of constants in the result) are evaluated column-wise over a
+    whole batch, all others row by row with the compiled code.
+    """
+    ALLOWED_NODES = (ast.Expression, ast.BoolOp, ast.And, ast.Or, ast.UnaryOp, ast.Not, ast.USub, ast.UAdd,
+                     ast.BinOp, ast.Add, ast.Sub, ast.Mult, ast.Div, ast.FloorDiv, ast.Mod, ast.Compare, ast.Eq,
+                     ast.NotEq, ast.Lt, ast.LtE, ast.Gt, ast.GtE, ast.In, ast.NotIn, ast.Is, ast.IsNot, ast.IfExp,
+                     ast.Call, ast.keyword, ast.Attribute, ast.Name, ast.Load, ast.Store, ast.Constant,
+                     ast.JoinedStr, ast.FormattedValue, ast.Subscript, ast.Slice, ast.Tuple, ast.List, ast.Set,
+                     ast.GeneratorExp, ast.ListComp, ast.SetComp, ast.comprehension)
+    SAFE_BUILTINS = {function.__name__: function for function in (
+        len, str, int, float, bool, list, tuple, set, sorted, sum, min, max, any, all, abs, ord, chr, repr, range,
+        enumerate, zip, reversed, bytes)}
+    FORBIDDEN_ATTRIBUTES = {"format", "format_map", "mro"}  # str.format can reach dunder attributes
+
+    def __init__(self, expression: str):
+        """
+        :param expression: predicate string with 'token' as tested token and 'result' as model response
+        :raises ValueError: if the predicate is missing, no valid expression or uses disallowed constructs
+        """
+        if not isinstance(expression, str) or not expression.strip():
+            raise ValueError(f"Missing predicate: {expression!r}")
+        self.expression = expression
+        try:
+            tree = ast.parse(expression.strip(), mode="eval")
+        except SyntaxError as e:
+            raise ValueError(f"Predicate is no valid Python expression: {expression!r} ({e.msg})")
+        self._validate(tree)
+        self._code = compile(tree, "<predicate>", "eval")
+        self._vectorized = self._vectorize(tree.body)
+        self._monotone_predicate = self._monotone(tree.body)
+        # echo predicates can be tested for several tokens in one request (group testing)
+        self.is_echo = ast.dump(tree.body) == ast.dump(ast.parse("token in result", mode="eval").body)
+        self.evaluations = 0
+        self.errors: dict[str, int] = {}  # exception type -> number of failed evaluations
+
+    def _validate(self, tree: ast.Expression) -> None:
+        names = set(self.SAFE_BUILTINS) | {"token", "result"}
+        names |= {node.id for node in ast.walk(tree) if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Store)}
+        for node in ast.walk(tree):
+            if not isinstance(node, self.ALLOWED_NODES):
+                raise ValueError(f"Predicate {self.expression!r} uses the disallowed construct {type(node).__name__}.")
+            if isinstance(node, ast.Name) and node.id not in names:
+                raise ValueError(f"Predicate {self.expression!r} uses the unknown name '{node.id}'.")
+            if isinstance(node, ast.Attribute) and (node.attr.startswith("_") or node.attr in self.FORBIDDEN_ATTRIBUTES):
+                raise ValueError(f"Predicate {self.expression!r} uses the disallowed attribute '{node.attr}'.")
+
+    @staticmethod
+    def _vectorize(node: ast.expr):
+        """
+        Translates the supported predicate forms into a function over (tokens, results) columns, None otherwise.
+        Supported: token in result, 'const' in result(.lower()), not, and, or and the negated containment forms.
+        """
+        if isinstance(node, ast.BoolOp):
+            parts = [Predicate._vectorize(value) for value in node.values]
+            if any(part is None for part in parts):
+                return None
+            combine = np.logical_and if isinstance(node.op, ast.And) else np.logical_or
+            return lambda tokens, results: combine.reduce([part(tokens, results) for part in parts])
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.Not):
+            part = Predicate._vectorize(node.operand)
+            return None if part is None else lambda tokens, results: ~part(tokens, results)
+        if not (isinstance(node, ast.Compare) and len(node.ops) == 1 and isinstance(node.ops[0], (ast.In, ast.NotIn))):
+            return None
+        needle, haystack, negate = node.left, node.comparators[0], isinstance(node.ops[0], ast.NotIn)
+        lower = (isinstance(haystack, ast.Call) and not haystack.args and not haystack.keywords
+                 and isinstance(haystack.func, ast.Attribute) and haystack.func.attr == "lower")
+        if lower:
+            haystack = haystack.func.value
+        if not (isinstance(haystack, ast.Name) and haystack.id == "result"):
+            return None
+        if isinstance(needle, ast.Name) and needle.id == "token":
+            def contains(tokens, results):
+                column = (result.lower() for result in results) if lower else results
+                return np.fromiter(map(str.__contains__, column, tokens), dtype=bool, count=len(tokens))
+        elif isinstance(needle, ast.Constant) and isinstance(needle.value, str):
+            def contains(tokens, results):
+                column = pd.Series(results, dtype=object).str
+                column = column.lower().str if lower else column
+                return column.contains(needle.value, regex=False).to_numpy(dtype=bool)
+        else:
+            return None
+        return (lambda tokens, results: ~contains(tokens, results)) if negate else contains
+
+    @staticmethod
+    def _monotone(node: ast.expr) -> bool:
+        # True if the predicate can only change from False to True while the result grows (containment checks)
+        if isinstance(node, ast.BoolOp):
+            return all(Predicate._monotone(value) for value in node.values)
+        if not (isinstance(node, ast.Compare) and len(node.ops) == 1 and isinstance(node.ops[0], ast.In)):
+            return False
+        haystack = node.comparators[0]
+        if (isinstance(haystack, ast.Call) and not haystack.args and not haystack.keywords
+                and isinstance(haystack.func, ast.Attribute) and haystack.func.attr == "lower"):
+            haystack = haystack.func.value
+        return (isinstance(haystack, ast.Name) and haystack.id == "result"
+                and not any(isinstance(child, ast.Name) and child.id == "result" for child in ast.walk(node.left)))
+
+    def early_stop(self, token: str) -> Callable[[str], bool]:
+        """
+        Stop condition for streamed responses. Only available for predicates that cannot become False again once they
+        are True while the response grows, e.g. 'token in result'.
+        :return: function of the partial response returning True once the test is passed, None if not applicable
+        """
+        if not self._monotone_predicate:
+            return None
+
+        def decided(partial_result: str) -> bool:
+            try:
+                return bool(eval(self._code, {"__builtins__": self.SAFE_BUILTINS, "token": token,
+                                              "result": partial_result}))
+            except Exception:
+                return False
+        return decided
+
+    @property
+    def vectorizable(self) -> bool:
+        return self._vectorized is not None
+
+    def fork(self) -> Predicate:
+        """
+        :return: predicate sharing the compiled expression, with its own evaluation and error counters (e.g. one per
+        model thread)
+        """
+        predicate = copy.copy(self)
+        predicate.evaluations, predicate.errors = 0, {}
+        return predicate
+
+    def _count_error(self, error: Exception) -> None:
+        self.errors[type(error).__name__] = self.errors.get(type(error).__name__, 0) + 1
+
+    def evaluate(self, token: str, result: str) -> bool:
+        """
+        Evaluates the predicate for a single token. Evaluation errors count as a failed test.
+        """
+        self.evaluations += 1
+        try:
+            return bool(eval(self._code, {"__builtins__": self.SAFE_BUILTINS, "token": token, "result": result}))
+        except Exception as e:
+            self._count_error(e)
+            return False
+
+    def evaluate_batch(self, tokens: list[str], results: list[str]) -> list[bool]:
+        """
+        Evaluates the predicate for a batch of (token, result) pairs, column-wise if the predicate is vectorizable.
+        :return: list of test outcomes in the order of the input
+        """
+        if self._vectorized is not None and all(isinstance(result, str) for result in results):
+            try:
+                verdicts = self._vectorized(tokens, results)
+                self.evaluations += len(tokens)
+                return verdicts.tolist()
+            except Exception:
+                pass  # row-wise evaluation below records the error per token
+        return [self.evaluate(token, result) for token, result in zip(tokens, results)]
+
+#### TOKENIZER LOADING -------------------------------------------------------------------------------------------------
+class TokenizerLoader:
+    """
+    Streaming reader for token vocabularies. Tokens are yielded one by one as (token_id, token) pairs, so only the
+    selected tokens are kept in memory. Supported formats:
+    - .json: Hugging Face tokenizer.json, the model.vocab section and the added_tokens
+    - .csv: semicolon separated <Token-id>;<Token> with header row
+    - .tiktoken: tiktoken BPE ranks, lines of <base64 token> <rank>
+    - .vocab/.tsv: sentencepiece vocabulary export, lines of <piece>\t<score>, the line number is the token id
+    """
+    CHUNK_SIZE: int = 1 << 20  # bytes read per step from the tokenizer file
+    _SECTION = re.compile(r'"(added_tokens|vocab)"\s*:\s*([\[{])')
+    _VOCAB_ENTRY = re.compile(r'\s*"((?:[^"\\]|\\.)*)"\s*:\s*(-?\d+)\s*([,}])')
+    _VOCAB_END = re.compile(r'\s*}')
+    _MERGES = re.compile(r'"merges"\s*:\s*\[')
+    _MERGES_END = re.compile(r'\s*]')
+    _MERGE_ENTRY = re.compile(r'\s*(?:"((?:[^"\\]|\\.)*)"|\[\s*"((?:[^"\\]|\\.)*)"\s*,\s*"((?:[^"\\]|\\.)*)"\s*])'
+                              r'\s*([,\]])')
+
+    @staticmethod
+    def iter_tokens(path: str, token_ids: Iterable[int] = None, id_range: tuple[int, int] = None, topN: int = None,
+                    include_added_tokens: bool = True, shard: tuple[int, int] = None) -> Iterator[tuple[int, str]]:
+        """
+        Streams the selected tokens of a vocabulary file in file order.
+        :param path: path to the tokenizer file
+        :param token_ids: optional collection of token ids to select
+        :param id_range: optional half-open range (start, stop) of token ids to select
+        :param topN: optional maximum number of tokens, reading stops as soon as it is reached
+        :param include_added_tokens: yield the added_tokens of a tokenizer.json that are not part of the vocab. They
+        follow the vocab and are left out if the vocab is cut off by topN.
+        :param shard: optional (index, count), selects the tokens with token_id % count == index. It is applied after
+        all other selections, so the shards of a selection together contain exactly the tokens of the selection.
+        :return: iterator of (token_id, token) tuples
+        """
+        if shard is not None and not 0 <= shard[0] < shard[1]:
+            raise ValueError(f"Invalid shard {shard}, expected (index, count) with 0 <= index < count.")
+        token_ids = set(token_ids) if token_ids is not None else None
+
+        def selected(token_id: int) -> bool:
+            return ((token_ids is None or token_id in token_ids)
+                    and (id_range is None or id_range[0] <= token_id < id_range[1]))
+
+        if path.endswith(".json"):
+            tokens = TokenizerLoader._iter_tokenizer_json(path, include_added_tokens)
+        elif path.endswith(".csv"):
+            tokens = TokenizerLoader._iter_csv(path)
+        elif path.endswith(".tiktoken"):
+            tokens = TokenizerLoader._iter_tiktoken(path)
+        elif path.endswith(".vocab") or path.endswith(".tsv"):
+            tokens = TokenizerLoader._iter_sentencepiece(path)
+        else:  # wrong file format
+            raise ValueError("Wrong file format. Expected .csv ([TOKEN_ID; TOKEN]), "
+                             ".json ({\"model\":{\"vocab\"{\"<token>\": <id>}}}), .tiktoken or .vocab")
+        count = 0
+        for token_id, token in tokens:
+            if topN is not None and count >= topN:
+                break
+            if selected(token_id):
+                count += 1
+                if shard is None or token_id % shard[1] == shard[0]:
+                    yield token_id, token
+        tokens.close()  # stops reading the file in case of an early exit
+
+    @staticmethod
+    def iter_merges(path: str) -> Iterator[tuple[str, str]]:
+        """
+        Streams the BPE merges of a tokenizer.json in rank order. Both the "a b" and the ["a", "b"] notation are
+        supported.
+        :param path: path to the tokenizer.json
+        :return: iterator of merged pairs, empty if the tokenizer has no merges
+        """
+        with open(path, 'r', encoding='utf-8') as token_file:
+            buffer, eof = TokenizerLoader._read(token_file, "")
+            while True:
+                section = TokenizerLoader._MERGES.search(buffer)
+                if section is not None:
+                    break
+                if eof:
+                    return
+                buffer, eof = TokenizerLoader._read(token_file, buffer[-64:])
+            position = section.end()
+            if TokenizerLoader._MERGES_END.match(buffer, position):  # no merges
+                return
+            while True:
+                entry = TokenizerLoader._MERGE_ENTRY.match(buffer, position)
+                if entry is None:
+                    if eof:
+                        raise ValueError(f"Malformed merges section in {path}.")
+                    buffer, eof = TokenizerLoader._read(token_file, buffer[position:])
+                    position = 0
+                    continue
+                if entry.group(1) is not None:
+                    merge = entry.group(1)
+                    merge = json.loads(f'"{merge}"') if "\\" in merge else merge
+                    left, right = merge.split(" ", 1)
+                else:
+                    left, right = [json.loads(f'"{part}"') if "\\" in part else part
+                                   for part in (entry.group(2), entry.group(3))]
+                yield left, right
+                position = entry.end()
+                if entry.group(4) == "]":
+                    return
+
+    @staticmethod
+    def _iter_csv(path: str) -> Iterator[tuple[int, str]]:
+        with open(path, 'r', encoding='utf-8') as token_csv:
+            csv_reader = csv.reader(token_csv, delimiter=';')
+            next(csv_reader)  # skip header row
+            for row in csv_reader:
+                yield int(row[0]), row[1]
+
+    @staticmethod
+    def _iter_tiktoken(path: str) -> Iterator[tuple[int, str]]:
+        with open(path, 'rb') as token_file:
+            for line in token_file:
+                if line.strip():
+                    token, rank = line.split()
+                    # tiktoken tokens are raw bytes, partial UTF-8 sequences are kept as escapes
+                    yield int(rank), base64.b64decode(token).decode("utf-8", errors="backslashreplace")
+
+    @staticmethod
+    def _iter_sentencepiece(path: str) -> Iterator[tuple[int, str]]:
+        with open(path, 'r', encoding='utf-8') as token_file:
+            for token_id, line in enumerate(token_file):
+                yield token_id, line.rstrip("\n").split("\t")[0]
+
+    @staticmethod
+    def _read(token_file, buffer: str) -> tuple[str, bool]:
+        chunk = token_file.read(TokenizerLoader.CHUNK_SIZE)
+        return buffer + chunk, chunk == ""
+
+    @staticmethod
+    def _decode_added_tokens(token_file, buffer: str, eof: bool, section) -> tuple[dict[int, str], str, bool]:
+        # decodes the added_tokens array starting at the section match, reading more of the file if needed
+        while True:
+            try:
+                entries, end = json.JSONDecoder().raw_decode(buffer, section.start(2))
+                return {int(entry["id"]): entry["content"] for entry in entries}, buffer[end:], eof
+            except json.JSONDecodeError:
+                if eof:
+                    raise ValueError(f"Incomplete added_tokens section in {token_file.name}.")
+                buffer, eof = TokenizerLoader._read(token_file, buffer)
+
+    @staticmethod
+    def read_added_tokens(path: str) -> dict[int, str]:
+        """
+        :param path: path to a tokenizer.json
+        :return: dictionary token_id -> content of the added (special) tokens
+        """
+        with open(path, 'r', encoding='utf-8') as token_file:
+            buffer, eof = TokenizerLoader._read(token_file, "")
+            while True:
+                section = TokenizerLoader._SECTION.search(buffer)
+                if section is not None and section.group(1) == "added_tokens":
+                    return TokenizerLoader._decode_added_tokens(token_file, buffer, eof, section)[0]
+                if eof:
+                    return {}
+                buffer, eof = TokenizerLoader._read(token_file, buffer[-64:])
+
+    @staticmethod
+    def _iter_tokenizer_json(path: str, include_added_tokens: bool) -> Iterator[tuple[int, str]]:
+        # The file is scanned chunk-wise for the "added_tokens" array and the "vocab" object. The added tokens are
+        # decoded at once (they are few), the vocab entries are matched one by one and the rest of the file
+        # (merges, normalizer, ...) is never parsed.
+        added_tokens: dict[int, str] = {}
+        vocab_ids: set[int] = set()
+        with open(path, 'r', encoding='utf-8') as token_file:
+            buffer, eof = TokenizerLoader._read(token_file, "")
+            while True:
+                section = TokenizerLoader._SECTION.search(buffer)
+                if section is None:
+                    if eof:
+                        break
+                    buffer, eof = TokenizerLoader._read(token_file, buffer[-64:])  # keep a possibly cut section key
+                    continue
+                if section.group(1) == "added_tokens":
+                    added_tokens, buffer, eof = TokenizerLoader._decode_added_tokens(token_file, buffer, eof, section)
+                    continue
+                # vocab section
+                position = section.end()
+                if TokenizerLoader._VOCAB_END.match(buffer, position):  # empty vocab
+                    break
+                while True:
+                    entry = TokenizerLoader._VOCAB_ENTRY.match(buffer, position)
+                    if entry is None:
+                        if eof:
+                            raise ValueError(f"Malformed vocab section in {path}.")
+                        buffer, eof = TokenizerLoader._read(token_file, buffer[position:])
+                        position = 0
+                        continue
+                    token = entry.group(1)
+                    if "\\" in token:
+                        token = json.loads(f'"{token}"')
+                    token_id = int(entry.group(2))
+                    if token_id in added_tokens:
+                        vocab_ids.add(token_id)
+                    yield token_id, token
+                    position = entry.end()
+                    if entry.group(3) == "}":
+                        break
+                break  # the vocab is the last section of interest
+        if include_added_tokens:
+            for token_id, token in added_tokens.items():
+                if token_id not in vocab_ids:
+                    yield token_id, token
+
+#### OFFLINE TOKEN PRE-SCREENING --------------------------------------------------------------------------------------
+class TokenPrescreen:
+    """
+    Pure-CPU pre-screening of a vocabulary based on the tokenizer itself. Every token gets a score and a set of tags
+    describing structural anomalies, e.g. tokens the BPE merges of the tokenizer cannot re-produce from their own
+    characters (unreachable tokens), byte-fallback tokens or long whitespace runs. High scores mark likely glitch
+    token candidates, a score of 0 marks structurally unremarkable tokens.
+    """
+    WEIGHTS: dict[str, float] = {"unreachable": 3.0, "special": 2.0, "whitespace_run": 2.0, "byte_fallback": 1.0,
+                                 "partial_utf8": 1.0, "non_printable": 1.0, "long": 0.5}
+    WHITESPACE_RUN: int = 4  # minimum number of consecutive whitespaces for the whitespace_run tag
+    LONG_TOKEN: int = 16  # minimum number of decoded characters for the long tag
+    _BYTE_FALLBACK = re.compile(r"<0x[0-9A-Fa-f]{2}>")
+
+    def __init__(self, path_to_tokenizer: str):
+        """
+        :param path_to_tokenizer: tokenizer file. The merge based tags are only available for tokenizer.json files
+        with BPE merges, all other formats get the character based tags only.
+        """
+        self.ranks: dict[tuple[str, str], int] = {}
+        self.special: set[int] = set()
+        if path_to_tokenizer.endswith(".json"):
+            self.ranks = {pair: rank for rank, pair in enumerate(TokenizerLoader.iter_merges(path_to_tokenizer))}
+            self.special = set(TokenizerLoader.read_added_tokens(path_to_tokenizer))
+        # byte-level BPE vocabularies (GPT-2 style) encode bytes as printable characters, e.g. 'Ġ' for a space
+        self._byte_decoder = {char: byte for byte, char in TokenPrescreen._bytes_to_unicode().items()}
+        self.byte_level = bool(self.ranks) and any("Ġ" in pair for pair in list(self.ranks)[:1000])
+
+    @staticmethod
+    def _bytes_to_unicode() -> dict[int, str]:
+        # byte to character table of byte-level BPE tokenizers
+        printable = (list(range(ord("!"), ord("~") + 1)) + list(range(ord("¡"), ord("¬") + 1))
+                     + list(range(ord("®"), ord("ÿ") + 1)))
+        table, extra = {}, 0
+        for byte in range(256):
+            if byte in printable:
+                table[byte] = chr(byte)
+            else:
+                table[byte] = chr(256 + extra)
+                extra += 1
+        return table
+
+    def _decode(self, token: str) -> tuple[str, bool]:
+        # returns the decoded text of a vocab entry and whether it is a complete UTF-8 sequence
+        if self.byte_level and all(char in self._byte_decoder for char in token):
+            raw = bytes(self._byte_decoder[char] for char in token)
+            try:
+                return raw.decode("utf-8"), True
+            except UnicodeDecodeError:
+                return raw.decode("utf-8", errors="replace"), False
+        return token.replace("▁", " "), True
+
+    def _reachable(self, token: str) -> bool:
+        # re-encodes the characters of the token with the BPE merges and checks whether the token itself results
+        parts = list(token)
+        while len(parts) > 1:
+            best = min(((self.ranks.get((parts[i], parts[i + 1])), i) for i in range(len(parts) - 1)
+                        if (parts[i], parts[i + 1]) in self.ranks), default=None)
+            if best is None:
+                break
+            pair = (parts[best[1]], parts[best[1] + 1])
+            merged, i = [], 0
+            while i < len(parts):
+                if i < len(parts) - 1 and (parts[i], parts[i + 1]) == pair:
+                    merged.append(parts[i] + parts[i + 1])
+                    i += 2
+                else:
+                    merged.append(parts[i])
+                    i += 1
+            parts = merged
+        return len(parts) == 1
+
+    def tags(self, token_id: int, token: str) -> list[str]:
+        """
+        :return: anomaly tags of a single token
+        """
+        if token_id in self.special:
+            return ["special"]
+        if self._BYTE_FALLBACK.fullmatch(token):
+            return ["byte_fallback"]
+        tags = []
+        text, complete = self._decode(token)
+        if self.ranks and len(token) > 1 and not self._reachable(token):
+            tags.append("unreachable")
+        if not complete:
+            tags.append("partial_utf8")
+        if re.search(rf"\s{{{self.WHITESPACE_RUN},}}", text):
+            tags.append("whitespace_run")
+        if any(not char.isprintable() and not char.isspace() for char in text):
+            tags.append("non_printable")
+        if len(text) >= self.LONG_TOKEN:
+            tags.append("long")
+        return tags
+
+    def score(self, tokens: Iterable[tuple[int, str]]) -> list[tuple[float, list[str]]]:
+        """
+        Scores tokens by the summed weights of their tags.
+        :param tokens: iterable of (token_id, token) pairs
+        :return: list of (score, tags) in input order
+        """
+        results = []
+        for token_id, token in tokens:
+            tags = self.tags(token_id, token)
+            results.append((sum(self.WEIGHTS[tag] for tag in tags), tags))
+        return results
+
+#### PRIOR GLITCH LIKELIHOOD FOR BUDGETED RUNS -------------------------------------------------------------------------
+class TokenPrior:
+    """
+    Prior glitch likelihood of tokens from cheap features: the pre-screening score of the TokenPrescreen (whitespace
+    runs, byte-fallback and unreachable tokens, ...), the byte length, the rarity (BPE vocabularies assign the later ids
+    to the rarer merges) and the result files of other models. Glitch tokens often transfer between models trained on
+    similar data, so a token listed in the results of other models is the strongest feature.
+    """
+    BIAS: float = -5.0  # log-odds of a token without any feature
+    WEIGHTS: dict[str, float] = {"prescreen": 2.0, "rarity": 1.0, "bytes": 0.5, "reference": 4.0}
+    MAX_BYTES: int = 32  # byte length at which the bytes feature saturates
+    _BYTE_DECODER = {char: byte for byte, char in TokenPrescreen._bytes_to_unicode().items()}
+
+    def __init__(self, path_to_tokenizer: str, paths_to_reference_results: list[str] = None):
+        """
+        :param path_to_tokenizer: tokenizer file of the tested model
+        :param paths_to_reference_results: result csv files of other models, e.g. the files in 'Glitch Token Results'.
+        The first two columns have to be token id and token, the header names do not matter.
+        """
+        self.prescreen = TokenPrescreen(path_to_tokenizer)
+        self.references = [TokenPrior.read_reference(path) for path in paths_to_reference_results or []]
+
+    @staticmethod
+    def normalize(token: str) -> str:
+        """
+        :return: decoded text of a vocab entry, so tokens of different tokenizers can be compared ('Ġ' and '▁' become
+        spaces)
+        """
+        if any(ord(char) >= 256 for char in token) and all(char in TokenPrior._BYTE_DECODER for char in token):
+            try:
+                return bytes(TokenPrior._BYTE_DECODER[char] for char in token).decode("utf-8")
+            except UnicodeDecodeError:
+                pass
+        return token.replace("▁", " ")
+
+    @staticmethod
+    def read_reference(path: str) -> set[str]:
+        """
+        :return: normalized glitch tokens of a result csv file
+        """
+        frame = pd.read_csv(path, sep=";", usecols=[1], dtype=str, keep_default_na=False)
+        return {TokenPrior.normalize(token) for token in frame.iloc[:, 0]}
+
+    def features(self, tokens: list) -> dict[str, np.ndarray]:
+        """
+        :param tokens: (token_id, token) pairs
+        :return: feature name -> values in [0, 1] (prescreen is the raw score)
+        """
+        texts = [TokenPrior.normalize(token) for _, token in tokens]
+        ids = np.fromiter((token_id for token_id, _ in tokens), dtype=np.int64, count=len(tokens))
+        return {
+            "prescreen": np.array([score for score, _ in self.prescreen.score(tokens)], dtype=float),
+            "rarity": np.argsort(np.argsort(ids, kind="stable"), kind="stable") / max(len(tokens) - 1, 1),
+            "bytes": np.minimum([len(text.encode("utf-8")) for text in texts], self.MAX_BYTES) / self.MAX_BYTES,
+            "reference": np.array([sum(text in reference for reference in self.references) for text in texts],
+                                  dtype=float) / max(len(self.references), 1),
+        }
+
+    def probabilities(self, tokens: list) -> np.ndarray:
+        """
+        :param tokens: (token_id, token) pairs
+        :return: prior glitch probability of every token (logistic function of the weighted features)
+        """
+        logits = np.full(len(tokens), self.BIAS)
+        for name, values in self.features(tokens).items():
+            logits += self.WEIGHTS[name] * values
+        return 1 / (1 + np.exp(-logits))
+
+#### RUN JOURNAL FOR CRASH-SAFE INTERMEDIATE RESULTS AND RESUMPTION -----------------------------------------------------
+class RunJournal:
+    """
+    Append-only journal of all evaluated (stage, token) pairs of a GlitchTest run. Every record is one JSON line
+    {"stage", "token_id", "token", "response", "passed"}; the first line is a header with the model and the prompts of
+    the run. Records are flushed and fsynced in batches, so a crash loses at most one batch. A journal can be reloaded
+    to resume a run without querying the model again for the recorded pairs.
+    """
+
+    def __init__(self, path: str, model: str, prompts: list, fsync_interval: int = 300, resume: bool = False):
+        """
+        :param path: file path of the journal (.jsonl)
+        :param model: name of the tested model, stored in the header and validated on resumption
+        :param prompts: prompts of the run, stored in the header and validated on resumption
+        :param fsync_interval: number of records after which the journal is flushed to disk
+        :param resume: load an existing journal at path and append to it instead of starting a new one
+        """
+        self.path = path
+        self.fsync_interval = max(1, fsync_interval)
+        self.header = {"type": "header", "model": model,
+                       "prompts": [[str(value) for value in prompt] for prompt in prompts]}
+        self._completed: dict[int, dict[int, tuple[str, bool]]] = {}  # stage -> token_id -> (response, passed)
+        self._unsynced = 0
+
+        if resume and os.path.exists(path):
+            self._load()
+            self._file = open(path, "a", encoding="utf-8")
+        else:
+            if os.path.exists(path) and os.path.getsize(path) > 0:
+                raise FileExistsError(f"Journal {path} already exists. Use resume=True to continue the run.")
+            self._file = open(path, "w", encoding="utf-8")
+            self._write(self.header)
+            self.flush()
+
+    def _load(self) -> None:
+        # reads all complete records. A partially written last line of a crashed run is cut off
+        valid_bytes = 0
+        with open(self.path, "rb") as journal_file:
+            for line_number, line in enumerate(journal_file):
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break
+                if not line.endswith(b"\n"):
+                    break
+                valid_bytes += len(line)
+                if line_number == 0:
+                    if record.get("model") != self.header["model"] or record.get("prompts") != self.header["prompts"]:
+                        raise ValueError(f"Journal {self.path} belongs to a run with a different model or prompts.")
+                    continue
+                self._completed.setdefault(record["stage"], {})[record["token_id"]] = (record["response"],
+                                                                                       record["passed"])
+        if valid_bytes == 0:
+            raise ValueError(f"Journal {self.path} has no valid header.")
+        with open(self.path, "r+b") as journal_file:
+            journal_file.truncate(valid_bytes)
+
+    def _write(self, record: dict) -> None:
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    @staticmethod
+    def read(path: str) -> tuple[dict, list[dict]]:
+        """
+        Reads a journal without opening it for writing.
+        :return: header and list of all complete records
+        """
+        records = []
+        with open(path, "r", encoding="utf-8") as journal_file:
+            header = json.loads(journal_file.readline())
+            for line in journal_file:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    break  # torn last line of a crashed run
+        return header, records
+
+    def completed(self, stage: int) -> dict[int, tuple[str, bool]]:
+        """
+        :param stage: position of the prompt in the run
+        :return: dictionary token_id -> (response, passed) of all recorded tokens of the stage
+        """
+        return self._completed.get(stage, {})
+
+    def stages(self) -> list[int]:
+        """
+        :return: stages with records, in the order they were first recorded (the stage order of the run)
+        """
+        return list(self._completed)
+
+    def record(self, stage: int, token_id: int, token: str, response: str, passed: bool) -> None:
+        """
+        Appends the evaluation of a token. The journal is synced every fsync_interval records.
+        """
+        self._write({"stage": stage, "token_id": int(token_id), "token": token, "response": response,
+                     "passed": bool(passed)})
+        self._unsynced += 1
+        if self._unsynced >= self.fsync_interval:
+            self.flush()
+
+    def flush(self) -> None:
+        """
+        Writes all buffered records to disk.
+        """
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._unsynced = 0
+
+    def close(self) -> None:
+        self.flush()
+        self._file.close()
+
+#### COLUMNAR RESULT STORE ---------------------------------------------------------------------------------------------
+class ResultStore:
+    """
+    Column-wise store of the tested tokens and their responses. Token ids and tokens are stored once, every stage has
+    its own response column and a mask marks the tokens that failed all tests so far. Only responses of failing tokens
+    are kept. Responses above compress_threshold bytes are stored zlib compressed.
+    """
+
+    def __init__(self, tokens: list, stages: int, compress_threshold: int = None):
+        """
+        :param tokens: (token_id, token) pairs in output order
+        :param stages: number of test stages (prompts)
+        :param compress_threshold: optional response size in bytes above which responses are compressed
+        """
+        self.token_ids = np.fromiter((token_id for token_id, _ in tokens), dtype=np.int64, count=len(tokens))
+        self.tokens = np.array([token for _, token in tokens], dtype=object)
+        self.responses = [np.full(len(tokens), None, dtype=object) for _ in range(stages)]
+        self.surviving = np.ones(len(tokens), dtype=bool)
+        self.compress_threshold = compress_threshold
+
+    def __len__(self) -> int:
+        return int(self.surviving.sum())
+
+    def rows(self, order: np.ndarray = None) -> np.ndarray:
+        """
+        :param order: optional test order as a permutation of all row indices
+        :return: indices of the surviving rows, in the given order
+        """
+        if order is None:
+            return np.flatnonzero(self.surviving)
+        return order[self.surviving[order]]
+
+    def record(self, stage: int, row: int, response: str, passed: bool) -> None:
+        """
+        Stores the response of a failed test, tokens passing the test are dropped from all further stages.
+        """
+        if passed:
+            self.surviving[row] = False
+            return
+        if self.compress_threshold is not None and len(response) > self.compress_threshold:
+            encoded = response.encode("utf-8")
+            if len(encoded) > self.compress_threshold:
+                response = zlib.compress(encoded)
+        self.responses[stage][row] = response
+
+    def response(self, stage: int, row: int) -> str:
+        response = self.responses[stage][row]
+        return zlib.decompress(response).decode("utf-8") if isinstance(response, bytes) else response
+
+    def columns(self, stages: int | Iterable[int] = None) -> dict:
+        """
+        :param stages: number of stages or indices of the stages to include, all by default
+        :return: column name -> values of the surviving rows (token_id, token, res_1, res_2, ...)
+        """
+        rows = self.rows()
+        columns = {"token_id": self.token_ids[rows], "token": self.tokens[rows]}
+        if stages is None or isinstance(stages, int):
+            stages = range(len(self.responses) if stages is None else stages)
+        for stage in stages:
+            columns[f"res_{stage + 1}"] = [self.response(stage, row) for row in rows]
+        return columns
+
+    def to_frame(self, stages: int | Iterable[int] = None) -> pd.DataFrame:
+        return pd.DataFrame(self.columns(stages))
+
+    def to_parquet(self, path: str, stages: int | Iterable[int] = None) -> None:
+        """
+        Writes the surviving rows as a Parquet file. Requires the optional pyarrow package.
+        """
+        try:
+            import pyarrow, pyarrow.parquet
+        except ImportError:
+            raise ImportError("Parquet output requires the pyarrow package (pip install pyarrow).")
+        table = pyarrow.table({name: pyarrow.array(list(values), pyarrow.int64() if name == "token_id" else
+                                                   pyarrow.string()) for name, values in self.columns(stages).items()})
+        pyarrow.parquet.write_table(table, path)
+
+#### PUSH NOTIFICATIONS FOR REMOTE STATUS UPDATE (OPTIONAL, ONLY USED AS A CONVENIENCE BENEFIT) ------------------------
+class PushNotification:
+    TIMEOUT_SECONDS: float = 10.0  # a slow or unreachable Pushover API must not hold up the caller
+
+    @staticmethod
+    def send_push(message: str, timeout: float = None) -> None:
+        api_token: str = load_config().get("PUSHOVER_API_TOKEN")
+        user_key: str = load_config().get("PUSHOVER_USER_KEY")
+        if api_token is None or user_key is None: return
+        url = "https://api.pushover.net/1/messages.json"
+        data = {
+            "token": api_token,
+            "user": user_key,
+            "message": message
+        }
+        response = requests.post(url, data=data, timeout=timeout or PushNotification.TIMEOUT_SECONDS)
+        response.raise_for_status()
+
+
+class NotificationSink(ABC):
+    """
+    Destination of the run events of an EventPipeline. send is called on the worker thread of the pipeline with the
+    coalesced events since the last delivery, it may block and raise.
+    """
+
+    @abstractmethod
+    def send(self, events: list[dict]) -> None:
+        pass
+
+    @staticmethod
+    def format(events: list[dict]) -> str:
+        """
+        :return: the messages of the events, one per line
+        """
+        return "\n".join(event["message"] for event in events)
+
+
+class PushoverSink(NotificationSink):
+    MAX_CHARS: int = 1024  # message limit of the Pushover API
+
+    def send(self, events: list[dict]) -> None:
+        message = NotificationSink.format(events)
+        PushNotification.send_push(message if len(message) <= self.MAX_CHARS else message[:self.MAX_CHARS - 3] + "...")
+
+
+class WebhookSink(NotificationSink):
+    def __init__(self, url: str, headers: dict = None, timeout: float = 10.0):
+        """
+        :param url: endpoint receiving the events as JSON ({"events": [...], "text": "..."}) by POST
+        :param headers: optional HTTP headers, e.g. an authorization header
+        :param timeout: timeout per delivery in seconds
+        """
+        self.url = url
+        self.headers = headers
+        self.timeout = timeout
+
+    def send(self, events: list[dict]) -> None:
+        response = requests.post(self.url, json={"events": events, "text": NotificationSink.format(events)},
+                                 headers=self.headers, timeout=self.timeout)
+        response.raise_for_status()
+
+
+class FileSink(NotificationSink):
+    def __init__(self, path: str):
+        """
+        :param path: file the events are appended to, one JSON object per line
+        """
+        self.path = path
+
+    def send(self, events: list[dict]) -> None:
+        with open(self.path, "a", encoding="utf-8") as event_file:
+            event_file.writelines(json.dumps(event, ensure_ascii=False) + "\n" for event in events)
+
+
+class EventPipeline:
+    """
+    Non-blocking delivery of run events (run and stage start and end, progress, errors) to notification sinks. emit
+    puts an event on a bounded queue and returns immediately, the event is dropped if the queue is full. A background
+    worker coalesces the events, progress events are reduced to the latest one per model and stage and errors to one
+    summary per model, and delivers them to every sink at most once per min_interval seconds.
+    """
+    MAX_QUEUE: int = 1000  # events waiting for the worker, further events are dropped
+    MIN_INTERVAL: float = 30.0  # seconds between two deliveries
+
+    def __init__(self, sinks: list[NotificationSink], max_queue: int = None, min_interval: float = None):
+        """
+        :param sinks: destinations of the events
+        :param max_queue: capacity of the event queue
+        :param min_interval: minimum seconds between two deliveries, the last events are delivered on close
+        """
+        self.sinks = list(sinks)
+        self.MIN_INTERVAL = min_interval if min_interval is not None else self.MIN_INTERVAL
+        self._queue = queue.Queue(maxsize=max_queue if max_queue is not None else self.MAX_QUEUE)
+        self._closed = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.emitted = 0
+        self.dropped = 0
+        self.delivered = 0
+        self.sink_errors = 0
+
+    def emit(self, kind: str, message: str, **fields) -> bool:
+        """
+        Queues an event without blocking.
+        :param kind: event type, e.g. 'run_started', 'stage_started', 'progress', 'error', 'stage_finished',
+        'run_finished'
+        :param message: human readable text of the event
+        :param fields: further JSON serializable fields, e.g. model and stage
+        :return: False if the event was dropped
+        """
+        if self._closed.is_set():
+            return False
+        try:
+            self._queue.put_nowait({"type": kind, "message": message,
+                                    "time": datetime.now().isoformat(timespec="seconds"), **fields})
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            return False
+        with self._lock:
+            self.emitted += 1
+        return True
+
+    @staticmethod
+    def coalesce(events: list[dict]) -> list[dict]:
+        """
+        :return: the events with only the latest progress event per model and stage and one error summary per model
+        """
+        progress, errors, result = {}, {}, []
+        for event in events:
+            if event["type"] == "progress":
+                key = (event.get("model"), event.get("stage"))
+                if key in progress:
+                    result[progress[key]] = event  # the newer progress replaces the older one in place
+                else:
+                    progress[key] = len(result)
+                    result.append(event)
+            elif event["type"] == "error":
+                summary = errors.get(event.get("model"))
+                if summary is None:
+                    summary = errors[event.get("model")] = dict(event, count=0)
+                    result.append(summary)
+                summary["count"] += event.get("count", 1)
+                summary["last_error"] = event["message"]
+                summary["message"] = (f"⚠️ {summary['count']} errors on model {event.get('model')}, last error: "
+                                      f"{event.get('error', event['message'])}" if summary["count"] > 1
+                                      else event["message"])
+            else:
+                result.append(event)
+        return result
+
+    def _deliver(self, events: list[dict]) -> None:
+        events = EventPipeline.coalesce(events)
+        for sink in self.sinks:
+            try:
+                sink.send(events)
+            except Exception as e:  # a failing sink must not stop the run or the other sinks
+                self.sink_errors += 1
+                print(f"notification sink {type(sink).__name__} failed: {e}")
+        self.delivered += len(events)
+
+    def _run(self) -> None:
+        pending = []
+        last_delivery = -float("inf")
+        while True:
+            timeout = max(last_delivery + self.MIN_INTERVAL - time.monotonic(), 0.0) if pending else None
+            try:
+                event = self._queue.get(timeout=timeout)
+            except queue.Empty:  # the next delivery is due
+                event = None
+            closing = event is not None and event["type"] == "_close"
+            if event is not None and not closing:
+                pending.append(event)
+            if closing:  # take everything that was emitted before the close
+                while not self._queue.empty():
+                    pending.append(self._queue.get_nowait())
+            if pending and (closing or time.monotonic() >= last_delivery + self.MIN_INTERVAL):
+                self._deliver(pending)
+                pending = []
+                last_delivery = time.monotonic()
+            if closing:
+                return
+
+    def start(self) -> "EventPipeline":
+        self._thread = threading.Thread(target=self._run, name="glitch-events", daemon=True)
+        self._thread.start()
+        return self
+
+    def close(self, timeout: float = 30.0) -> None:
+        """
+        Delivers the remaining events and stops the worker, waiting at most timeout seconds.
+        """
+        if self._closed.is_set():
+            return
+        self._closed.set()
+        if self._thread is not None:
+            try:  # waits for a free slot, the worker keeps draining the queue
+                self._queue.put({"type": "_close"}, timeout=timeout)
+            except queue.Full:
+                print("notification pipeline did not drain in time, remaining events are dropped.")
+                return
+            self._thread.join(timeout)
+
+    def stats(self) -> dict:
+        return {"emitted": self.emitted, "dropped": self.dropped, "delivered": self.delivered,
+                "sink_errors": self.sink_errors, "queued": self._queue.qsize()}
+
+#### GLITCH FINDER METHOD TO IMPLEMENT MAIN FUNCTIONALITY --------------------------------------------------------------
+class GlitchFinder:
+    EVALUATION_WINDOW: int = 256  # number of responses evaluated together by the predicate
+    # group testing of echo stages: several tokens per request as a JSON list
+    GROUP_SYSTEM_INSTRUCTION: str = ("Your task is to repeat strings exactly as they are given to you. Answer only "
+                                     "with a JSON list of strings and nothing more.")
+    GROUP_PROMPT: str = ("Please repeat every string of the following JSON list exactly. Return a JSON list with the "
+                         "repeated strings in the same order: {}")
+    GROUP_BLOCK: int = 32  # number of groups resolved together, keeps the results streaming in token order
+    # adaptive stage order: every stage is measured on a random sample of the tokens before the run
+    ADAPTIVE_SAMPLE_SIZE: int = 64
+    ADAPTIVE_SEED: int = 0
+    ADAPTIVE_EXHAUSTIVE_STAGES: int = 7  # up to this many stages all orders are compared
+    @staticmethod
+    def read_prompts(path_to_prompts_csv: str = None) -> list:
+        """
+        Reads a SEMICOLON SEPARATED prompt CSV [PROMPT_ID, SYSTEM_INSTRUCTION, PROMPT_TEXT, PREDICATE] into nested
+        lists. Without a path the default prompts are returned.
+        """
+        if path_to_prompts_csv is None:
+            return default_prompts
+        return pd.read_csv(path_to_prompts_csv, delimiter=";").values.tolist()
+
+    @staticmethod
+    def GlitchTest(path_to_token_csv_or_json: str,
+                   path_to_output_csv: str,
+                   model: str | list[tuple[str, ResponseGenerator]],
+                   generator: ResponseGenerator = None,
+                   path_to_intermediate_res_folder: str = None,
+                   path_to_prompts_csv: str = None,
+                   saving_interval=300,
+                   topN=None,
+                   sendSMS: bool = False,
+                   max_workers: int = 1,
+                   request_timeout: float = None,
+                   batch_size: int = 1,
+                   path_to_journal: str = None,
+                   resume: bool = False,
+                   token_ids: Iterable[int] = None,
+                   token_id_range: tuple[int, int] = None,
+                   include_added_tokens: bool = True,
+                   prescreen: str = None,
+                   prescreen_threshold: float = 1.0,
+                   shard: tuple[int, int] = None,
+                   path_to_manifest: str = None,
+                   batch_submitter: BatchSubmitter = None,
+                   path_to_batch_folder: str = None,
+                   path_to_output_parquet: str = None,
+                   compress_threshold: int = None,
+                   metrics: RunMetrics = None,
+                   previous_manifest: str = None,
+                   group_size: int = 1,
+                   prefix_cache: bool = False,
+                   notification_sinks: list[NotificationSink] = None,
+                   adaptive_order: bool = False) -> None:
+        """
+        Main Method to extract glitch tokens from a closed source model with the use of a predefined list of prompts
+        listed in this python file.
+
+        :param topN: for testing and debugging of data: if set. the token will be sliced at the set row number
+        :param token_ids: optional collection of token ids to be tested
+        :param token_id_range: optional half-open range (start, stop) of token ids to be tested
+        :param include_added_tokens: also test the added_tokens of a tokenizer.json that are not in the vocab
+        :param prescreen: optional offline pre-screening of the tokens with the TokenPrescreen. 'tag' only reports
+        the tags (saved in the intermediate folder), 'skip' does not test tokens with a score below
+        prescreen_threshold, 'prioritize' tests the highest scored tokens first.
+        :param prescreen_threshold: minimum pre-screening score of a token to be tested in 'skip' mode
+        :param shard: optional (index, count) to only test the tokens with token_id % count == index. The outputs of
+        all shards can be combined with GlitchFinder.MergeShards.
+        :param path_to_manifest: file path of the run manifest (.json) describing model, prompts, tokenizer and token
+        selection of the run. Shard runs write it next to the output csv if not set.
+        :param path_to_intermediate_res_folder: folder path to save the intermediate results in case intermediate
+        results are wished.
+        :param path_to_prompts_csv: path to SEMICOLON SEPARATED Prompt CSV of the form
+        [PROMPT_ID, SYSTEM_INSTRUCTION, PROMPT_TEXT, PREDICATE]
+        :param generator: ResponseGenerator implementation to execute model requests
+        :param saving_interval: maximum number of tested tokens between two syncs of the run journal to disk
+        :param model: name of the model as listed in ollama server, or a list of (model, generator) pairs that are
+        tested in a single pass. Every model then gets its own outputs (csv, journal, parquet, manifest) with the model
+        name appended to the file name, and a cross-model matrix <output>_matrix.csv lists which tokens fail on which
+        models. Tokens and compiled predicates are shared by all models. Caching is per generator: one
+        CachedResponseGenerator can be passed for several models of the same backend (its key includes the model),
+        otherwise every generator needs its own.
+        :param path_to_token_csv_or_json: File path to the csv-file containing the tokens in the following format:
+        <Token-id>;<Token>. Alternatively a tokenizer.json, tiktoken (.tiktoken) or sentencepiece (.vocab) file.
+        :param path_to_output_csv: File path to the result file in which the values will be positioned as follows:
+        <Token-ID>;<Token>;<Prompt1_answer>;<Prompt2_answer>;<Prompt3_answer>
+        :param sendSMS if an SMS should be sent to update on status (Pushover, see notification_sinks).
+        :param notification_sinks: optional further sinks (WebhookSink, FileSink, ...) of the run events. Events are
+        delivered by a background worker at most every EventPipeline.MIN_INTERVAL seconds, progress events and errors
+        are coalesced. The test loop never waits for a notification.
+        :param max_workers: number of concurrent requests sent to the generator. The generator has to be thread-safe
+        for values above 1. The result order stays the same as in a sequential run.
+        :param request_timeout: optional timeout in seconds per request enforced by the RequestEngine. Timed out
+        requests get the result 'timeout'.
+        :param batch_size: number of prompts sent together through generator.generateResponses
+        :param path_to_journal: file path of the append-only run journal (.jsonl). If not set but an intermediate
+        folder is given, the journal is created in that folder.
+        :param resume: reload the journal at path_to_journal and skip all (stage, token) pairs recorded in it
+        :param batch_submitter: optional BatchSubmitter of a provider batch API. The requests of every stage are
+        submitted as one batch job instead of being sent one by one through the generator.
+        :param path_to_batch_folder: folder of the batch files, defaults to the intermediate folder or the folder of
+        the output csv. Batches submitted by an interrupted run are picked up again instead of being resubmitted.
+        :param path_to_output_parquet: optional file path of an additional Parquet output (requires pyarrow)
+        :param compress_threshold: optional response size in bytes above which responses are kept zlib compressed
+        in memory, useful for runs with long runaway responses
+        :param metrics: optional RunMetrics with hooks, snapshot file, metrics endpoint or profiler of the run. A
+        summary of the request latency and the time split is printed in any case.
+        :param previous_manifest: manifest of an earlier run of the same model with a journal. Responses of that run
+        are carried forward for every (request, token) pair that did not change, so only new or changed tokens and
+        new or changed prompts cause requests. Changed predicates are re-evaluated on the carried responses.
+        :param group_size: number of tokens packed into one request in stages with the predicate 'token in result'.
+        Tokens echoed correctly in a group pass, the others are tested again with the prompt of the stage. Groups
+        with an unreadable answer are split in halves down to single tokens.
+        :param prefix_cache: local serving mode reusing the KV cache of the server. The requests of a stage are sent in
+        the order of the token strings, so consecutive requests share the system instruction, the prompt up to the
+        token and the beginning of the token. Ollama generators without a keep_alive keep the model loaded for
+        OllamaResponseGenerator.PREFIX_CACHE_KEEP_ALIVE. The output keeps the tokenizer order.
+        :param adaptive_order: run the stages in the order with the lowest expected inference time instead of the
+        prompt order. Pass rate and time per token of every stage are measured on ADAPTIVE_SAMPLE_SIZE random tokens
+        first, their responses are reused in the run. The glitch tokens and the output columns stay the same, as a
+        token still has to fail every stage.
+        :return results only in form of a saved csv file
+        """
+        load_lazy_modules()  # before any worker or model thread starts
+
+        # Choosing the standard model provider
+        if generator is None and batch_submitter is None and isinstance(model, str):
+            print("Choosing Ollama as model serving engine!")
+            generator = OllamaResponseGenerator()
+            model_is_installed = False
+            try: # check whether the model is installed, 'ollama list' prints a header and one model per line
+                result = subprocess.run(["ollama", "list"], capture_output=True, text=True, check=True)
+                installed_models = {line.split()[0] for line in result.stdout.splitlines()[1:] if line.strip()}
+                model_is_installed = model in installed_models or f"{model}:latest" in installed_models
+            except Exception as e:
+                print(f"Error: {e}")
+
+            if not model_is_installed:
+                print(f"Model {model} not installed! Try pulling it by executing the command 'ollama pull {model}'.")
+                return None # termination
+
+        # for csv saving
+        def save_token_map_to_csv(data: pd.DataFrame, day, month, year, hour, minute, prompt_nr, folder, model):
+            filename = f"intermediate_res_{model}_{day}-{month}-{year}_{hour}{minute}_p{prompt_nr}.csv"
+            data.to_csv(f"{folder}/{filename}", sep=";", index=False)
+
+        # Console output coloring
+        GREEN = "\033[92m"
+        RED = "\033[91m"
+        BLUE = "\033[94m"
+        RESET = "\033[0m"
+        bar_format = f"{GREEN}{{l_bar}}{{bar}}{{r_bar}}{RESET}"  # progress bar coloring
+
+        # fixating time and date values for traceability
+        now = datetime.now()
+        day_now, month_now, year_now, hour_now, min_now = now.day, now.month, now.year, now.hour, now.minute
+
+        # 1 Read in the token map, streamed and filtered by the token selection
+        print("reading in tokens...")
+        remaining_tokens = [[token_id, token] for token_id, token in TokenizerLoader.iter_tokens(
+            path_to_token_csv_or_json, token_ids=token_ids, id_range=token_id_range, topN=topN,
+            include_added_tokens=include_added_tokens, shard=shard)]
+        print(f"selected {len(remaining_tokens)} tokens.")
+
+        # 1.1 optional offline pre-screening, scores and tags the tokens based on the tokenizer alone
+        test_order = None  # row indices in test order, only set if the test order is changed
+        if prescreen is not None:
+            if prescreen not in ("tag", "skip", "prioritize"):
+                raise ValueError("prescreen has to be one of 'tag', 'skip' or 'prioritize'.")
+            print("pre-screening tokens...")
+            scores = TokenPrescreen(path_to_token_csv_or_json).score(remaining_tokens)
+            tag_counts: dict[str, int] = {}
+            for _, tags in scores:
+                for tag in tags:
+                    tag_counts[tag] = tag_counts.get(tag, 0) + 1
+            print(f"pre-screening tags: {tag_counts}")
+            if path_to_intermediate_res_folder is not None:
+                pd.DataFrame([[row[0], row[1], score, ",".join(tags)] for row, (score, tags) in
+                              zip(remaining_tokens, scores)], columns=["token_id", "token", "score", "tags"]).to_csv(
+                    f"{path_to_intermediate_res_folder}/prescreen_{model}_{day_now}-{month_now}-{year_now}_"
+                    f"{hour_now}{min_now}.csv", sep=";", index=False)
+            if prescreen == "skip":
+                # structurally unremarkable tokens are not sent to the model
+                remaining_tokens = [row for row, (score, _) in zip(remaining_tokens, scores)
+                                    if score >= prescreen_threshold]
+                print(f"{len(remaining_tokens)} tokens with a score of at least {prescreen_threshold} remain.")
+            elif prescreen == "prioritize":
+                # suspicious tokens are tested first, the output keeps the tokenizer order
+                test_order = np.argsort([-score for score, _ in scores], kind="stable")
+
+        # 1.2 optional request order for prefix cache hits, tokens with the same beginning follow each other
+        if prefix_cache:
+            if prescreen == "prioritize":
+                raise ValueError("prefix_cache orders the requests by token, it cannot be combined with "
+                                 "prescreen='prioritize'.")
+            test_order = np.argsort(np.array([token for _, token in remaining_tokens], dtype=object), kind="stable")
+
+        print("reading in prompts...")
+
+        # 2 Read in the prompts, save as nested lists via pandas
+        prompts = GlitchFinder.read_prompts(path_to_prompts_csv)
+        if adaptive_order and batch_submitter is not None:
+            raise ValueError("adaptive_order measures the stages with direct requests, it cannot be combined with "
+                             "batch_submitter.")
+
+        # predicates are compiled and validated once before the first request is sent, all models share them
+        compiled_predicates = [Predicate(prompt[3] if len(prompt) > 3 else None) for prompt in prompts]
+
+        # run events for remote status updates, delivered by a background worker
+        sinks = list(notification_sinks or []) + ([PushoverSink()] if sendSMS else [])
+        events = EventPipeline(sinks).start() if sinks else None
+
+        def test_model(model: str, generator: ResponseGenerator, path_to_output_csv: str, path_to_journal: str,
+                       path_to_output_parquet: str, path_to_manifest: str, metrics: RunMetrics,
+                       position: int = 0, previous_manifest: str = previous_manifest) -> ResultStore:
+            # runs all stages for one model and saves its outputs, several models can run in parallel threads
+            request_hashes = [GlitchFinder.request_sha256(model, prompt) for prompt in prompts]
+            # every model counts its own evaluation errors, the compiled expressions are shared
+            predicates = [predicate.fork() for predicate in compiled_predicates]
+            # column-wise results, the rows of tokens passing a test are masked out
+            store = ResultStore(remaining_tokens, len(prompts), compress_threshold=compress_threshold)
+
+            # push notification with initialization information
+            events is not None and events.emit(
+                "run_started", f"Starting the tests with {len(prompts)} prompts on model {model} with {len(store)} "
+                f"tokens.\nThe program is running on {socket.gethostname()}.", model=model, tokens=len(store))
+            print("starting the testing proces...")
+
+            # run journal for intermediate results and resumption
+            if resume and path_to_journal is None:
+                raise ValueError("resume=True requires the path_to_journal of the interrupted run.")
+            if path_to_journal is None and path_to_intermediate_res_folder is not None:
+                path_to_journal = (f"{path_to_intermediate_res_folder}/journal_{model}_{day_now}-{month_now}-{year_now}_"
+                                   f"{hour_now}{min_now}.jsonl")
+            # responses of an earlier run by request hash and token id, reused for unchanged (request, token) pairs
+            carried = {}
+            if previous_manifest is not None:
+                carried, previous_tokens = GlitchFinder.load_previous_run(previous_manifest, model)
+                new = sum(int(token_id) not in previous_tokens for token_id in store.token_ids.tolist())
+                changed = sum(previous_tokens.get(int(token_id), token) != token
+                              for token_id, token in zip(store.token_ids.tolist(), store.tokens))
+                print(f"incremental run: {new} new and {changed} changed tokens compared to the previous run, "
+                      f"{sum(request in carried for request in request_hashes)} of {len(prompts)} prompts unchanged")
+                if path_to_manifest is None:
+                    path_to_manifest = f"{os.path.splitext(path_to_output_csv)[0]}.manifest.json"
+
+            journal = RunJournal(path_to_journal, model, prompts, fsync_interval=saving_interval,
+                                 resume=resume) if path_to_journal is not None else None
+
+            # instrumentation of the run, statistics of the generator are included in the snapshots
+            metrics = metrics if metrics is not None else RunMetrics()
+            for name, stats in (("generator", "stats"), ("endpoints", "endpoint_stats"), ("prompts", "prompt_stats")):
+                callable(getattr(generator, stats, None)) and metrics.add_source(name, getattr(generator, stats))
+            events is not None and metrics.add_source("notifications", events.stats)
+            metrics.start()
+
+            # the model and its cached prompt prefix stay loaded between requests and stages
+            if prefix_cache and getattr(generator, "keep_alive", False) is None:
+                generator.keep_alive = OllamaResponseGenerator.PREFIX_CACHE_KEEP_ALIVE
+
+            # request execution, sequential by default or with several requests in flight
+            engine = RequestEngine(generator, model, max_workers=max_workers, request_timeout=request_timeout,
+                                   batch_size=batch_size, metrics=metrics)
+
+            def stage_responses(stage: int, open_rows: list[int]) -> Iterator[tuple[str, Exception]]:
+                # 5 sending the requests of a stage to the response generator, returned in the order of the rows
+                # streaming generators stop the generation as soon as the predicate is passed
+                system_instruction, prompt_string = prompts[stage][1], prompts[stage][2]
+                if batch_submitter is not None:
+                    # all requests of the stage as batch jobs, the results are ingested in token order
+                    return GlitchFinder.run_batch_stage(
+                        batch_submitter, model, stage,
+                        [(int(store.token_ids[row]), prompt_string.replace("{}", store.tokens[row]), system_instruction)
+                         for row in open_rows],
+                        path_to_batch_folder or path_to_intermediate_res_folder or
+                        os.path.dirname(os.path.abspath(path_to_output_csv)))
+                if group_size > 1 and predicates[stage].is_echo:
+                    # several tokens per request, failing tokens are tested again one by one
+                    return GlitchFinder.run_group_stage(engine, [store.tokens[row] for row in open_rows],
+                                                        prompt_string, system_instruction, group_size,
+                                                        predicates[stage].early_stop)
+                return engine.run((prompt_string.replace("{}", store.tokens[row]), system_instruction,
+                                   predicates[stage].early_stop(store.tokens[row])) for row in open_rows)
+
+            def known_responses(stage: int, rows: list[int]) -> dict[int, str]:
+                # responses of the rows recorded in the journal or carried forward from the previous run
+                completed = journal.completed(stage) if journal is not None else {}
+                previous = carried.get(request_hashes[stage], {})
+                known = {}
+                for row in rows:
+                    token_id = int(store.token_ids[row])
+                    entry = previous.get(token_id)
+                    if token_id in completed:
+                        known[row] = completed[token_id][0]
+                    elif entry is not None and entry[0] == store.tokens[row]:
+                        known[row] = entry[1]
+                return known
+
+            # 2.1 optional adaptive stage order, every stage is measured on the same random sample of tokens
+            stage_order = list(range(len(prompts)))
+            sampled: dict[int, dict[int, str]] = {}  # stage -> token_id -> response of the sample, reused in the run
+            if adaptive_order and len(prompts) > 1 and len(store) > 0:
+                sample = np.sort(np.random.default_rng(GlitchFinder.ADAPTIVE_SEED).choice(
+                    len(store), min(GlitchFinder.ADAPTIVE_SAMPLE_SIZE, len(store)), replace=False)).tolist()
+                print(f"measuring the {len(prompts)} stages on {len(sample)} sample tokens...")
+                passed = np.zeros((len(sample), len(prompts)), dtype=bool)
+                costs = np.full(len(prompts), np.nan)  # seconds per requested token, unknown without requests
+                for stage in range(len(prompts)):
+                    results = known_responses(stage, sample)
+                    open_rows = [row for row in sample if row not in results]
+                    started = time.perf_counter()
+                    responses = stage_responses(stage, open_rows)
+                    for row, (result, error) in zip(open_rows, responses):
+                        results[row] = result if error is None else f"ERROR occurred: {error}"
+                    responses.close()
+                    if open_rows:
+                        costs[stage] = (time.perf_counter() - started) / len(open_rows)
+                    sampled[stage] = {int(store.token_ids[row]): results[row] for row in open_rows}
+                    passed[:, stage] = predicates[stage].evaluate_batch([store.tokens[row] for row in sample],
+                                                                        [results[row] for row in sample])
+                # stages answered completely from the journal or a previous run get the mean cost of the others
+                costs = np.nan_to_num(costs, nan=np.nanmean(costs) if not np.isnan(costs).all() else 0.0)
+                stage_order, expected = GlitchFinder.adaptive_stage_order(passed, costs)
+                # a resumed run keeps the order of the stages already started
+                recorded = journal.stages() if journal is not None else []
+                if recorded:
+                    stage_order = recorded + [stage for stage in stage_order if stage not in recorded]
+                    expected = GlitchFinder.expected_stage_cost(passed, costs, stage_order)
+                print(f"adaptive stage order: prompts {', '.join(str(prompts[stage][0] + 1) for stage in stage_order)}"
+                      f", expected {expected * 1000:.1f} ms per token (prompt order "
+                      f"{GlitchFinder.expected_stage_cost(passed, costs, range(len(prompts))) * 1000:.1f} ms)")
+                for stage in range(len(prompts)):
+                    print(f"  prompt {prompts[stage][0] + 1}: pass rate {passed[:, stage].mean():.1%}, "
+                          f"{costs[stage] * 1000:.1f} ms per token")
+
+            # 3 Iterating every prompt
+            for step, stage in enumerate(stage_order):
+                prompt = prompts[stage]
+                # extracting prompt parameters
+                prompt_index = prompt[0]
+                prompt_string, prompt_predicate = prompt[2], prompt[3]
+                predicate = predicates[stage]
+                """
+                Lingo for predicate is a string containing the predicate with 'result' as model response
+                and 'token' as the token to be tested in the current iteration
+                """
+                # traceability measures
+                print(f"Testing prompt {prompt_index + 1} of {len(prompts)}: {prompt_string}")
+                # tokens already evaluated in an interrupted run are taken from the journal
+                completed = journal.completed(stage) if journal is not None else {}
+                if completed:
+                    print(f"resuming stage {prompt_index + 1}: {len(completed)} tokens taken from the journal")
+                # surviving rows of the store in test order
+                rows = store.rows(test_order)
+                print(f"{RED}{len(rows)}{RESET} Tokens remaining")
+                events is not None and events.emit(
+                    "stage_started", f"{model}-test Stage {prompt_index + 1} of {len(prompts)} started with {len(rows)} "
+                    f"tokens.", model=model, stage=stage, tokens=len(rows))
+                # quarter marks for push notifications
+                marks: list[int] = [int(len(rows) * 0.25), int(len(rows) * 0.5), int(len(rows) * 0.75), int(len(rows))]
+                SMS_count = 0  # tokens processed in this stage, for SMS tracing
+                open_rows = [row for row in rows.tolist() if int(store.token_ids[row]) not in completed]
+                # responses carried forward from the previous run, the predicate is evaluated again
+                previous = carried.get(request_hashes[stage], {})
+                reused = {}
+                for row in open_rows:
+                    entry = previous.get(int(store.token_ids[row]))
+                    if entry is not None and entry[0] == store.tokens[row]:
+                        reused[int(store.token_ids[row])] = entry[1]
+                if reused:
+                    print(f"{len(reused)} responses carried forward from the previous run")
+                # responses of the adaptive order sample are evaluated like carried responses
+                sample_responses = sampled.get(stage, {})
+                reused.update((int(store.token_ids[row]), sample_responses[int(store.token_ids[row])])
+                              for row in open_rows if int(store.token_ids[row]) in sample_responses)
+                if reused:
+                    open_rows = [row for row in open_rows if int(store.token_ids[row]) not in reused]
+                metrics.start_stage(stage, len(rows))
+                responses = stage_responses(stage, open_rows)
+                # window of [row, token_id, token, result, verdict] entries, the predicate is evaluated for the whole
+                # window at once. The window is journaled and synced when it is evaluated, so it is not larger than the
+                # saving_interval and a crash loses less than saving_interval responses
+                window = []
+                window_size = max(1, min(GlitchFinder.EVALUATION_WINDOW, saving_interval))
+
+                def evaluate_window():
+                    # 6 result evaluation based on the compiled predicate, verdicts of journaled tokens are kept
+                    open_entries = [entry for entry in window if entry[4] is None]
+                    started = time.perf_counter()
+                    verdicts = predicate.evaluate_batch([entry[2] for entry in open_entries],
+                                                        [entry[3] for entry in open_entries])
+                    evaluated = time.perf_counter()
+                    for entry, test_eval in zip(open_entries, verdicts):
+                        entry[4] = test_eval
+                        # append-only intermediate saving
+                        journal is not None and journal.record(stage, entry[1], entry[2], entry[3], test_eval)
+                    journal is not None and open_entries and journal.flush()
+                    metrics.add_phase("predicate", evaluated - started)
+                    metrics.add_phase("saving", time.perf_counter() - evaluated)
+                    failed = 0
+                    for row, _, _, result, test_eval in window:
+                        # if eval fails, the token remains for the next prompt tests and its response is stored
+                        store.record(stage, row, result, test_eval)
+                        failed += not test_eval
+                    metrics.count_tokens(stage, len(window), failed)
+                    window.clear()
+
+                # progress bar and iterable configuration with tqdm progress bar
+                from tqdm import tqdm
+                pbar = tqdm(rows.tolist(), desc="Processing Tokens ", bar_format=bar_format, position=position)
+                # 4 iterating every remaining token
+                for row in pbar:  # row index of the token in the result store
+                    token, token_index = store.tokens[row], int(store.token_ids[row])
+                    # update progress bar
+                    pbar.set_description(f"Processing Tokens Stage {prompt_index + 1} '{token}'")
+                    if token_index in completed:
+                        window.append([row, token_index, token, *completed[token_index]])
+                    elif token_index in reused:
+                        window.append([row, token_index, token, reused[token_index], None])
+                    else:
+                        started = time.perf_counter()
+                        result, error = next(responses)
+                        metrics.add_phase("waiting", time.perf_counter() - started)
+                        if error is not None:
+                            result = f"ERROR occurred: {error}"
+                            # send push to fathom error origin, bursts of errors are coalesced into one notification
+                            events is not None and events.emit("error", f"⚠️ An error occurred. Message: {error}",
+                                                               model=model, stage=stage, error=str(error))
+                        window.append([row, token_index, token, result, None])
+                    if len(window) >= window_size:
+                        evaluate_window()
+                        metrics.tick()
+
+                    # send status SMS
+                    SMS_count += 1
+                    if events is not None and SMS_count in marks:
+                        events.emit("progress", f"{model}-test Stage {prompt_index + 1} of {len(prompts)}: "
+                                                f"{SMS_count / len(rows) * 100:.2f}% done.", model=model, stage=stage,
+                                    done=SMS_count / len(rows))
+                evaluate_window()
+
+                if predicate.errors:
+                    print(f"Errors while evaluating the predicate of prompt {prompt_index + 1} ({prompt_predicate}): "
+                          f"{predicate.errors}. These tests count as failed.")
+                responses.close()  # releases the worker threads of the stage
+                started = time.perf_counter()
+                journal is not None and journal.flush()
+
+                # saving the final results of prompt test if requested
+                if path_to_intermediate_res_folder is not None:
+                    # columns of the stages run so far, in prompt order
+                    save_token_map_to_csv(store.to_frame(stages=sorted(stage_order[:step + 1])), day_now, month_now,
+                                          year_now, hour_now, min_now, prompt_index, path_to_intermediate_res_folder,
+                                          f"{model}_finalresultIn{prompt_index}.csv")
+                metrics.add_phase("saving", time.perf_counter() - started)
+                metrics.end_stage(stage)
+                events is not None and events.emit(
+                    "stage_finished", f"{model}-test Stage {prompt_index + 1} of {len(prompts)} finished, {len(store)} "
+                    f"tokens remaining.", model=model, stage=stage, remaining=len(store))
+
+            journal is not None and journal.close()
+            if isinstance(generator, CachedResponseGenerator):
+                print(f"response cache: {generator.stats()}")
+            if isinstance(generator, OllamaResponseGenerator) and generator.prompt_stats()["requests"]:
+                print(f"prompt evaluation: {generator.prompt_stats()}")
+
+            # final save of result of last prompt test iteration
+            print("saving the final results...")
+            started = time.perf_counter()
+            end_result = store.to_frame()  # token_id, token, res_1, res_2, ... in tokenizer order
+
+            # csv export
+            end_result.to_csv(path_to_output_csv, index=False, sep=";")
+            path_to_output_parquet is not None and store.to_parquet(path_to_output_parquet)
+            metrics.add_phase("saving", time.perf_counter() - started)
+            metrics.stop()
+            print(metrics.summary())
+
+            # run manifest, needed to merge the results of sharded runs
+            if path_to_manifest is None and shard is not None:
+                path_to_manifest = f"{os.path.splitext(path_to_output_csv)[0]}.manifest.json"
+            if path_to_manifest is not None:
+                GlitchFinder.write_manifest(path_to_manifest, {
+                    "model": model,
+                    "generator": type(generator).__name__,
+                    "prompts_sha256": GlitchFinder.prompts_sha256(prompts),
+                    "tokenizer": os.path.abspath(path_to_token_csv_or_json),
+                    "tokenizer_sha256": GlitchFinder.file_sha256(path_to_token_csv_or_json),
+                    "selection": {"topN": topN, "token_id_range": list(token_id_range) if token_id_range else None,
+                                  "token_ids_sha256": hashlib.sha256(json.dumps(sorted(token_ids)).encode()).hexdigest()
+                                  if token_ids is not None else None,
+                                  "include_added_tokens": include_added_tokens,
+                                  "prescreen": prescreen, "prescreen_threshold": prescreen_threshold},
+                    "shard": list(shard) if shard is not None else None,
+                    "output": os.path.abspath(path_to_output_csv),
+                    "journal": os.path.abspath(path_to_journal) if path_to_journal is not None else None,
+                    "stages": [{"request_sha256": request_hash, "predicate": str(prompt[3])}
+                               for request_hash, prompt in zip(request_hashes, prompts)],
+                    "stage_order": stage_order,
+                    "tokens_sha256": hashlib.sha256(json.dumps(list(zip(store.token_ids.tolist(), store.tokens)),
+                                                               ensure_ascii=False).encode("utf-8")).hexdigest(),
+                    "glitch_tokens": len(store),
+                    "finished": datetime.now().isoformat(timespec="seconds"),
+                })
+
+            # end communication
+            print(f"{RED}{len(store)}{RESET} Tokens failed all tests and will be saved in a final csv-file.")
+
+            events is not None and events.emit("run_finished", f"{len(store)} tokens found in test for model {model}. "
+                                                                f"The files are saved in {path_to_output_csv}.🥳 ",
+                                               model=model, glitch_tokens=len(store))
+            print(f"file saved in {BLUE}{path_to_output_csv}{RESET}")
+            return store
+
+        if isinstance(model, str):
+            try:
+                test_model(model, generator, path_to_output_csv, path_to_journal, path_to_output_parquet,
+                           path_to_manifest, metrics)
+            finally:
+                events is not None and events.close()
+            return None
+
+        # several models in a single pass: tokens and prompts are shared and every model runs its stages in its own
+        # thread, so the requests of all models are interleaved and all backends are kept busy
+        names = [name for name, _ in model]
+        if len(set(names)) != len(names):
+            raise ValueError("Every model may only be listed once.")
+        if metrics is not None:
+            raise ValueError("With several models every model gets its own RunMetrics, metrics can not be set.")
+
+        def model_path(path: str, name: str) -> str:
+            # per-model variant of an output path
+            if path is None:
+                return None
+            root, extension = os.path.splitext(path)
+            return f"{root}_{re.sub(r'[^A-Za-z0-9_.-]', '_', name)}{extension}"
+
+        with ThreadPoolExecutor(max_workers=len(model), thread_name_prefix="glitch-model") as pool:
+            futures = [pool.submit(test_model, name, model_generator if model_generator is not None else
+                                   OllamaResponseGenerator(), model_path(path_to_output_csv, name),
+                                   model_path(path_to_journal, name), model_path(path_to_output_parquet, name),
+                                   model_path(path_to_manifest, name), RunMetrics(), position,
+                                   model_path(previous_manifest, name))
+                       for position, (name, model_generator) in enumerate(model)]
+            try:
+                stores = [future.result() for future in futures]
+            finally:
+                events is not None and events.close()
+
+        # cross-model matrix of the tokens failing all tests on at least one model (1 = glitch token of the model)
+        token_ids = np.fromiter((token_id for token_id, _ in remaining_tokens), dtype=np.int64,
+                                count=len(remaining_tokens))
+        failing = np.column_stack([np.isin(token_ids, store.token_ids[store.rows()]) for store in stores])
+        selected = failing.any(axis=1)
+        matrix = pd.DataFrame(failing[selected].astype(int), columns=names)
+        matrix.insert(0, "token", [token for (_, token), keep in zip(remaining_tokens, selected) if keep])
+        matrix.insert(0, "token_id", token_ids[selected])
+        matrix["models"] = matrix[names].sum(axis=1)
+        path_to_matrix = f"{os.path.splitext(path_to_output_csv)[0]}_matrix.csv"
+        matrix.to_csv(path_to_matrix, sep=";", index=False)
+        for name, store in zip(names, stores):
+            print(f"{name}: {RED}{len(store)}{RESET} glitch tokens")
+        print(f"{RED}{int(failing.all(axis=1).sum())}{RESET} tokens fail on all {len(names)} models, "
+              f"cross-model matrix saved in {BLUE}{path_to_matrix}{RESET}")
+        return None
+
+    @staticmethod
+    def expected_stage_cost(passed: np.ndarray, costs: np.ndarray, order: Iterable[int]) -> float:
+        """
+        Expected cost per token of a stage order on a sample. A token is only tested in a stage if it failed all
+        earlier stages, so every stage cost is weighted by the share of sample tokens reaching the stage.
+        :param passed: sample tokens x stages, True if the token passed the test of the stage
+        :param costs: cost per token of every stage
+        :param order: stage indices in test order
+        """
+        reaching = np.ones(len(passed), dtype=bool)
+        cost = 0.0
+        for stage in order:
+            cost += costs[stage] * reaching.mean()
+            reaching &= ~passed[:, stage]
+        return cost
+
+    @staticmethod
+    def adaptive_stage_order(passed: np.ndarray, costs: np.ndarray) -> tuple[list[int], float]:
+        """
+        Stage order with the lowest expected cost per token on a sample (see expected_stage_cost). Up to
+        ADAPTIVE_EXHAUSTIVE_STAGES stages all orders are compared, which also accounts for stages filtering the same
+        tokens. Above that the stages are sorted by cost per passing token, the optimum for independent stages.
+        Ties keep the prompt order.
+        :param passed: sample tokens x stages, True if the token passed the test of the stage
+        :param costs: cost per token of every stage
+        :return: stage order and its expected cost per token
+        """
+        stages = passed.shape[1]
+        if len(passed) == 0:
+            return list(range(stages)), 0.0
+        if stages <= GlitchFinder.ADAPTIVE_EXHAUSTIVE_STAGES:
+            candidates = itertools.permutations(range(stages))
+        else:
+            pass_rates = passed.mean(axis=0)
+            candidates = [sorted(range(stages), key=lambda stage: costs[stage] / pass_rates[stage]
+                                 if pass_rates[stage] > 0 else float("inf"))]
+        order = min(candidates, key=lambda candidate: GlitchFinder.expected_stage_cost(passed, costs, candidate))
+        return list(order), GlitchFinder.expected_stage_cost(passed, costs, order)
+
+    @staticmethod
+    def run_batch_stage(submitter: BatchSubmitter, model: str, stage: int, jobs: list[tuple[int, str, str]],
+                        path_to_folder: str) -> Iterator[tuple[str, Exception]]:
+        """
+        Writes the requests of a stage as OpenAI-style batch files (custom_id '<stage>-<token_id>'), submits them and
+        waits until all batches are finished. A batch file whose submission is recorded next to it with the same
+        content is not submitted again, so an interrupted run continues waiting for its batches. The record is removed
+        once the results are ingested, and a recorded batch unknown to the submitter is submitted again.
+        :param jobs: (token_id, prompt, system instruction) of every request of the stage
+        :param path_to_folder: folder of the batch files
+        :return: iterator of (result, error) in the order of the jobs, like RequestEngine.run
+        """
+        os.makedirs(path_to_folder, exist_ok=True)
+        max_requests = getattr(submitter, "MAX_REQUESTS", BatchSubmitter.MAX_REQUESTS)
+        batch_ids, paths_to_state = [], []
+        for part, start in enumerate(range(0, len(jobs), max_requests)):
+            content = "".join(json.dumps({
+                "custom_id": f"{stage}-{token_id}", "method": "POST", "url": "/v1/chat/completions",
+                "body": {"model": model, "messages": [{"role": "system", "content": system},
+                                                      {"role": "user", "content": prompt}]}},
+                ensure_ascii=False) + "\n" for token_id, prompt, system in jobs[start:start + max_requests])
+            digest = hashlib.sha256(content.encode("utf-8")).hexdigest()
+            path_to_batch_file = f"{path_to_folder}/batch_{model}_stage{stage + 1}_part{part + 1}.jsonl"
+            path_to_state = f"{path_to_batch_file}.submitted.json"
+            state = None
+            if os.path.exists(path_to_state):
+                with open(path_to_state, encoding="utf-8") as state_file:
+                    state = json.load(state_file)
+            if state is not None and state["sha256"] == digest:
+                try:
+                    submitter.status(state["batch_id"])
+                    print(f"waiting for batch {state['batch_id']} submitted by an earlier run")
+                except LookupError:
+                    print(f"batch {state['batch_id']} of an earlier run is unknown, submitting it again")
+                    state = None
+            if state is None or state["sha256"] != digest:
+                with open(path_to_batch_file, "w", encoding="utf-8") as batch_file:
+                    batch_file.write(content)
+                state = {"batch_id": submitter.submit(path_to_batch_file), "sha256": digest}
+                with open(path_to_state, "w", encoding="utf-8") as state_file:
+                    json.dump(state, state_file)
+                print(f"submitted batch {state['batch_id']} with {len(jobs[start:start + max_requests])} requests")
+            batch_ids.append(state["batch_id"])
+            paths_to_state.append(path_to_state)
+
+        results = {}
+        for batch_id in batch_ids:
+            # polling until the provider finished the batch
+            while (status := submitter.status(batch_id)) not in BatchSubmitter.FINISHED:
+                time.sleep(getattr(submitter, "POLL_INTERVAL", BatchSubmitter.POLL_INTERVAL))
+            if status != "completed":
+                print(f"batch {batch_id} ended with status '{status}', results may be missing")
+            results.update(submitter.results(batch_id))
+        for path_to_state in paths_to_state:  # ingested, a later run with the same prompts submits new batches
+            os.path.exists(path_to_state) and os.remove(path_to_state)
+        for token_id, _, _ in jobs:
+            result = results.get(f"{stage}-{token_id}")
+            yield (result, None) if result is not None else (None, LookupError("no result in the batch output"))
+
+    @staticmethod
+    def file_sha256(path: str) -> str:
+        """
+        :return: SHA-256 hex digest of a file, read chunk-wise
+        """
+        digest = hashlib.sha256()
+        with open(path, "rb") as hashed_file:
+            for chunk in iter(lambda: hashed_file.read(1 << 20), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    @staticmethod
+    def prompts_sha256(prompts: list) -> str:
+        """
+        :return: SHA-256 hex digest of system instructions, prompt texts and predicates of a prompt list
+        """
+        return hashlib.sha256(json.dumps([[str(value) for value in prompt] for prompt in prompts],
+                                         ensure_ascii=False).encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def parse_group_response(response: str, size: int) -> list[str]:
+        """
+        :return: the strings of the JSON list in a group response, None if the answer contains no list of size strings
+        """
+        if not isinstance(response, str):
+            return None
+        start, end = response.find("["), response.rfind("]")
+        if start < 0 or end < start:
+            return None
+        try:
+            items = json.loads(response[start:end + 1])
+        except ValueError:
+            return None
+        if not isinstance(items, list) or len(items) != size or not all(isinstance(item, str) for item in items):
+            return None
+        return items
+
+    @staticmethod
+    def run_group_stage(engine: RequestEngine, tokens: list[str], prompt_string: str, system_instruction: str,
+                        group_size: int, early_stop: Callable[[str], Callable[[str], bool]]
+                        ) -> Iterator[tuple[str, Exception]]:
+        """
+        Group testing of an echo stage. Tokens are sent in groups of group_size with GROUP_PROMPT. A token contained
+        in its echo in the answer gets the echo as result, the tokens failing in a group are tested again with the
+        prompt of the stage, so glitch tokens always get the verdict of the single token test. If the answer of a
+        group can not be read, the group is split in halves until single tokens are left.
+        :param engine: RequestEngine of the run
+        :param tokens: tokens to be tested, in order
+        :param early_stop: Predicate.early_stop of the stage, used for the single token requests
+        :return: iterator of (result, error) per token in token order, like RequestEngine.run
+        """
+        def job(block: list[str], group: list[int]) -> tuple:
+            if len(group) == 1:
+                return prompt_string.replace("{}", block[group[0]]), system_instruction, early_stop(block[group[0]])
+            strings = json.dumps([block[index] for index in group], ensure_ascii=False)
+            return GlitchFinder.GROUP_PROMPT.replace("{}", strings), GlitchFinder.GROUP_SYSTEM_INSTRUCTION, None
+
+        block_size = group_size * GlitchFinder.GROUP_BLOCK
+        requests_sent = 0
+        grouping = True
+        try:
+            for start in range(0, len(tokens), block_size):
+                block = tokens[start:start + block_size]
+                results: list[tuple[str, Exception]] = [None] * len(block)
+                width = group_size if grouping else 1
+                pending = [list(range(index, min(index + width, len(block)))) for index in range(0, len(block), width)]
+                retested = 0
+                # resolves the block level by level, the requests of one level are sent concurrently
+                while pending:
+                    jobs = [job(block, group) for group in pending]
+                    requests_sent += len(jobs)
+                    next_pending = []
+                    for group, (response, error) in zip(pending, engine.run(jobs)):
+                        if len(group) == 1:
+                            results[group[0]] = (response, error)
+                            continue
+                        items = GlitchFinder.parse_group_response(response, len(group)) if error is None else None
+                        if items is None:
+                            half = len(group) // 2
+                            next_pending += [group[:half], group[half:]]
+                            continue
+                        for index, item in zip(group, items):
+                            if block[index] in item:
+                                results[index] = (item, None)
+                            else:
+                                next_pending.append([index])
+                                retested += 1
+                    pending = next_pending
+                # groups only pay off if most tokens pass, e.g. not in later stages where mostly glitch tokens remain
+                grouping = grouping and retested < len(block) * (1 - 1 / group_size)
+                yield from results
+        finally:
+            # the caller closes the iterator after the last token
+            print(f"group testing: {requests_sent} requests for {len(tokens)} tokens")
+
+    @staticmethod
+    def request_sha256(model: str, prompt: list) -> str:
+        """
+        :return: SHA-256 hex digest of the request of a stage (model, system instruction and prompt text)
+        """
+        return hashlib.sha256(json.dumps([model, str(prompt[1]), str(prompt[2])], ensure_ascii=False)
+                              .encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def load_previous_run(path_to_manifest: str, model: str) -> tuple[dict[str, dict[int, tuple[str, str]]],
+                                                                      dict[int, str]]:
+        """
+        Reads the journal of an earlier run for an incremental re-run.
+        :param path_to_manifest: manifest of the earlier run
+        :param model: model of the current run, has to match the earlier run
+        :return: request hash -> token id -> (token, response) of all recorded evaluations, and token id -> token of
+        all tokens tested by the earlier run
+        """
+        with open(path_to_manifest, "r", encoding="utf-8") as manifest_file:
+            manifest = json.load(manifest_file)
+        if manifest["model"] != model:
+            raise ValueError(f"The previous run tested {manifest['model']}, responses can not be carried to {model}.")
+        if not manifest.get("journal") or "stages" not in manifest:
+            raise ValueError("The previous run has no journal, run it with a path_to_journal or intermediate folder.")
+        _, records = RunJournal.read(manifest["journal"])
+        stage_hashes = [stage["request_sha256"] for stage in manifest["stages"]]
+        carried: dict[str, dict[int, tuple[str, str]]] = {}
+        previous_tokens = {}
+        for record in records:
+            carried.setdefault(stage_hashes[record["stage"]], {})[record["token_id"]] = (record["token"],
+                                                                                        record["response"])
+            if record["stage"] == 0:
+                previous_tokens[record["token_id"]] = record["token"]
+        return carried, previous_tokens
+
+    @staticmethod
+    def write_manifest(path_to_manifest: str, manifest: dict) -> None:
+        with open(path_to_manifest, "w", encoding="utf-8") as manifest_file:
+            json.dump(manifest, manifest_file, indent=2, ensure_ascii=False)
+
+    @staticmethod
+    def MergeShards(paths_to_manifests: list[str], path_to_output_csv: str) -> None:
+        """
+        Combines the outputs of sharded GlitchTest runs into the csv file a single run over the whole selection would
+        have produced (same rows, columns and tokenizer order).
+
+        :param paths_to_manifests: manifests of all shard runs
+        :param path_to_output_csv: File path of the merged result file
+        """
+        manifests = []
+        for path_to_manifest in paths_to_manifests:
+            with open(path_to_manifest, "r", encoding="utf-8") as manifest_file:
+                manifests.append(json.load(manifest_file))
+        # all shards have to belong to the same run
+        for key in ("model", "prompts_sha256", "tokenizer_sha256", "selection"):
+            if any(manifest[key] != manifests[0][key] for manifest in manifests):
+                raise ValueError(f"The shards differ in '{key}' and cannot be merged.")
+        shards = sorted(tuple(manifest["shard"]) for manifest in manifests if manifest["shard"] is not None)
+        if len(shards) != len(manifests) or shards != [(index, shards[0][1]) for index in range(shards[0][1])]:
+            raise ValueError(f"Expected exactly one manifest for every shard, got {shards}.")
+
+        frames = [pd.read_csv(manifest["output"], sep=";", dtype=str, keep_default_na=False)
+                  for manifest in manifests]
+        merged = pd.concat(frames, ignore_index=True)
+        # order of a single run: the order in which the tokenizer file yields the tokens
+        tokenizer = manifests[0]["tokenizer"]
+        if os.path.exists(tokenizer) and GlitchFinder.file_sha256(tokenizer) == manifests[0]["tokenizer_sha256"]:
+            glitch_ids = set(merged["token_id"])
+            position = {str(token_id): index for index, (token_id, _) in enumerate(TokenizerLoader.iter_tokens(
+                tokenizer, include_added_tokens=manifests[0]["selection"]["include_added_tokens"]))
+                        if str(token_id) in glitch_ids}
+            merged = merged.iloc[merged["token_id"].map(position).argsort(kind="stable")]
+        else:
+            print("tokenizer file not available, ordering the merged results by token id.")
+            merged = merged.iloc[merged["token_id"].astype(int).argsort(kind="stable")]
+        merged.to_csv(path_to_output_csv, index=False, sep=";")
+        print(f"merged {len(manifests)} shards with {len(merged)} tokens into {path_to_output_csv}")
+
+    @staticmethod
+    def RescoreJournal(path_to_journal: str, path_to_output_csv: str, path_to_prompts_csv: str = None) -> None:
+        """
+        Re-evaluates the responses recorded in a run journal with the predicates of a (changed) prompt file. No model
+        requests are sent, vectorizable predicates are evaluated column-wise. Tokens that would need a response the
+        journal does not contain (because they passed a stage under the old predicate) are reported and left out.
+
+        :param path_to_journal: journal of a finished or interrupted GlitchTest run
+        :param path_to_output_csv: File path of the result file, same format as the GlitchTest output
+        :param path_to_prompts_csv: prompt CSV with the new predicates. System instructions and prompt texts have to
+        match the journal, default prompts are used if not set.
+        """
+        header, records = RunJournal.read(path_to_journal)
+        prompts = GlitchFinder.read_prompts(path_to_prompts_csv)
+        if [[str(value) for value in prompt[1:3]] for prompt in prompts] != [prompt[1:3] for prompt in header["prompts"]]:
+            raise ValueError("The prompts differ from the journal, only predicates can be changed for re-scoring.")
+        predicates = [Predicate(prompt[3] if len(prompt) > 3 else None) for prompt in prompts]
+
+        journal_frame = pd.DataFrame.from_records(records, columns=["stage", "token_id", "token", "response"])
+        stage_frames = [frame.drop_duplicates("token_id", keep="last").set_index("token_id")
+                        for _, frame in journal_frame.groupby("stage", sort=True)]
+        if len(stage_frames) == 0:
+            raise ValueError(f"Journal {path_to_journal} contains no records.")
+
+        surviving = stage_frames[0].index
+        columns = []
+        missing = 0
+        for stage, predicate in enumerate(predicates):
+            frame = stage_frames[stage] if stage < len(stage_frames) else stage_frames[0].iloc[0:0]
+            available = surviving.isin(frame.index)
+            missing += int((~available).sum())
+            frame = frame.loc[surviving[available]]
+            verdicts = np.asarray(predicate.evaluate_batch(frame["token"].tolist(), frame["response"].tolist()))
+            surviving = frame.index[~verdicts]
+            columns.append(frame["response"])
+            if predicate.errors:
+                print(f"Errors while evaluating the predicate of prompt {stage + 1}: {predicate.errors}")
+
+        end_result = pd.DataFrame({"token_id": surviving, "token": stage_frames[0].loc[surviving, "token"].values})
+        for stage, column in enumerate(columns):
+            end_result[f"res_{stage + 1}"] = column.loc[surviving].values
+        end_result.to_csv(path_to_output_csv, index=False, sep=";")
+        print(f"{len(end_result)} tokens failed all tests after re-scoring, saved in {path_to_output_csv}.")
+        if missing:
+            print(f"{missing} tokens need responses that are not in the journal and were left out.")
+
+    @staticmethod
+    def budget_order(prior: np.ndarray, explore: float = 0.0, seed: int = None) -> tuple[np.ndarray, np.ndarray]:
+        """
+        :param prior: prior glitch probabilities
+        :param explore: share of the positions filled with randomly chosen tokens instead of the most likely ones.
+        Their results are an unbiased sample of the less likely tokens, which the coverage estimate is based on.
+        :return: row indices in test order and the mask of the randomly chosen rows
+        """
+        generator = np.random.default_rng(seed)
+        greedy = iter(np.argsort(-prior, kind="stable").tolist())
+        randomized = iter(generator.permutation(len(prior)).tolist())
+        taken = np.zeros(len(prior), dtype=bool)
+        explored = np.zeros(len(prior), dtype=bool)
+        order = []
+        for random_choice in (generator.random(len(prior)) < explore).tolist():
+            row = next(randomized if random_choice else greedy)
+            while taken[row]:
+                row = next(randomized if random_choice else greedy)
+            taken[row] = True
+            explored[row] = random_choice
+            order.append(row)
+        return np.array(order, dtype=np.int64), explored
+
+    @staticmethod
+    def estimate_coverage(prior: np.ndarray, tested: np.ndarray, glitch: np.ndarray, explored: np.ndarray,
+                          bins: int = 10, pseudo_count: float = 2.0) -> dict:
+        """
+        Estimates how many glitch tokens the untested tokens contain. The tokens are binned by prior, the glitch rate
+        of the untested tokens of a bin is the rate of the randomly chosen (explored) tokens of the bin, shrunk towards
+        the mean prior of the bin. Without explored tokens the estimate relies on the prior alone.
+        :param prior: prior glitch probabilities
+        :param tested: mask of the tokens with a verdict
+        :param glitch: mask of the tokens that failed all tests
+        :param explored: mask of the randomly chosen tokens
+        :param bins: number of prior quantile bins
+        :param pseudo_count: weight of the prior in the glitch rate of a bin, in tokens
+        :return: found glitch tokens, estimated total and estimated coverage
+        """
+        found = int(glitch.sum())
+        edges = np.quantile(prior, np.linspace(0, 1, bins + 1))
+        bin_index = np.clip(np.searchsorted(edges, prior, side="right") - 1, 0, bins - 1)
+        sample = tested & explored
+        missing = 0.0
+        for index in range(bins):
+            members = bin_index == index
+            untested = int((members & ~tested).sum())
+            if untested == 0:
+                continue
+            rate = ((int((glitch & sample & members).sum()) + pseudo_count * float(prior[members].mean()))
+                    / (int((sample & members).sum()) + pseudo_count))
+            missing += untested * rate
+        return {"glitch_tokens": found, "estimated_glitch_tokens": round(found + missing, 1),
+                "estimated_coverage": round(found / (found + missing), 4) if found + missing > 0 else 1.0}
+
+    @staticmethod
+    def BudgetedTest(path_to_token_csv_or_json: str,
+                     path_to_output_csv: str,
+                     model: str,
+                     generator: ResponseGenerator = None,
+                     request_budget: int = None,
+                     cost_budget: float = None,
+                     cost_per_million_tokens: tuple[float, float] = None,
+                     paths_to_reference_results: list[str] = None,
+                     path_to_prompts_csv: str = None,
+                     max_workers: int = 1,
+                     request_timeout: float = None,
+                     explore: float = 0.05,
+                     seed: int = 0,
+                     topN: int = None,
+                     token_ids: Iterable[int] = None,
+                     token_id_range: tuple[int, int] = None,
+                     include_added_tokens: bool = True,
+                     path_to_report: str = None) -> dict:
+        """
+        Budgeted discovery: the tokens are tested in the order of their prior glitch likelihood (TokenPrior) until the
+        request or cost budget is spent. Every token runs through all stages before the next tokens are started, so
+        every tested token gets a final verdict. Most glitch tokens are found for a fraction of the cost of a full run.
+
+        :param path_to_token_csv_or_json: tokenizer or token csv file, see GlitchTest
+        :param path_to_output_csv: result file of the glitch tokens found, same format as the GlitchTest output
+        :param model: name of the model
+        :param generator: ResponseGenerator implementation, the local Ollama server by default
+        :param request_budget: maximum number of requests
+        :param cost_budget: maximum cost of the run, computed with cost_per_million_tokens
+        :param cost_per_million_tokens: (input, output) price per million tokens, tokens are estimated as characters / 4
+        :param paths_to_reference_results: result csv files of other models used for the prior
+        :param path_to_prompts_csv: prompt CSV, see GlitchTest
+        :param max_workers: number of concurrent requests
+        :param request_timeout: optional timeout in seconds per request
+        :param explore: share of randomly chosen tokens, needed for an unbiased coverage estimate
+        :param seed: seed of the random choice
+        :param path_to_report: JSON report of the run, <output>.budget.json by default
+        :return: the report: requests, cost, tested tokens, glitch tokens found and the coverage estimate
+        """
+        if cost_budget is not None and cost_per_million_tokens is None:
+            raise ValueError("cost_budget requires the cost_per_million_tokens (input, output).")
+        if not 0 <= explore <= 1:
+            raise ValueError("explore has to be between 0 and 1.")
+        load_lazy_modules()
+        generator = generator if generator is not None else OllamaResponseGenerator()
+        tokens = [[token_id, token] for token_id, token in TokenizerLoader.iter_tokens(
+            path_to_token_csv_or_json, token_ids=token_ids, id_range=token_id_range, topN=topN,
+            include_added_tokens=include_added_tokens)]
+        prompts = GlitchFinder.read_prompts(path_to_prompts_csv)
+        predicates = [Predicate(prompt[3] if len(prompt) > 3 else None) for prompt in prompts]
+        print(f"computing the prior of {len(tokens)} tokens...")
+        prior = TokenPrior(path_to_token_csv_or_json, paths_to_reference_results).probabilities(tokens)
+        order, explored = GlitchFinder.budget_order(prior, explore, seed)
+
+        store = ResultStore(tokens, len(prompts))
+        tested = np.zeros(len(tokens), dtype=bool)  # tokens with a final verdict
+        spent = {"requests": 0, "cost": 0.0}
+        input_price, output_price = cost_per_million_tokens or (0.0, 0.0)
+
+        def exhausted() -> bool:
+            return ((request_budget is not None and spent["requests"] >= request_budget)
+                    or (cost_budget is not None and spent["cost"] >= cost_budget))
+
+        engine = RequestEngine(generator, model, max_workers=max_workers, request_timeout=request_timeout)
+        block = 4 * max_workers  # tokens started together, keeps the workers busy between the stages of a token
+        from tqdm import tqdm
+        pbar = tqdm(total=request_budget or len(tokens) * len(prompts), desc="Requests ")
+        for start in range(0, len(order), block):
+            if exhausted():
+                break
+            active = order[start:start + block].tolist()
+            # token-major: the failing tokens of the block go through the next stage right away
+            for stage, prompt in enumerate(prompts):
+                system_instruction, prompt_string, predicate = prompt[1], prompt[2], predicates[stage]
+
+                def jobs(rows: list[int]) -> Iterator[tuple]:
+                    # stops submitting as soon as the budget is spent, requests in flight are still answered
+                    for row in rows:
+                        if exhausted():
+                            return
+                        final_prompt = prompt_string.replace("{}", store.tokens[row])
+                        spent["requests"] += 1
+                        spent["cost"] += (len(final_prompt) + len(system_instruction)) / 4 * input_price / 1e6
+                        yield final_prompt, system_instruction, predicate.early_stop(store.tokens[row])
+
+                responses = []
+                for result, error in engine.run(jobs(active)):
+                    responses.append(f"ERROR occurred: {error}" if error is not None else result)
+                    spent["cost"] += len(responses[-1] or "") / 4 * output_price / 1e6
+                    pbar.update(1)
+                answered = active[:len(responses)]
+                verdicts = predicate.evaluate_batch([store.tokens[row] for row in answered], responses)
+                for row, response, passed in zip(answered, responses, verdicts):
+                    store.record(stage, row, response, passed)
+                    tested[row] = passed or stage == len(prompts) - 1
+                active = [row for row, passed in zip(answered, verdicts) if not passed]
+                if not active:
+                    break
+        pbar.close()
+
+        # only tokens that failed all stages are glitch tokens, tokens cut off by the budget have no verdict
+        store.surviving &= tested
+        store.to_frame().to_csv(path_to_output_csv, index=False, sep=";")
+        report = {"model": model, "requests": spent["requests"], "cost": round(spent["cost"], 6),
+                  "request_budget": request_budget, "cost_budget": cost_budget, "tokens": len(tokens),
+                  "tested_tokens": int(tested.sum()), "explore": explore,
+                  **GlitchFinder.estimate_coverage(prior, tested, store.surviving, explored)}
+        path_to_report = path_to_report or f"{os.path.splitext(path_to_output_csv)[0]}.budget.json"
+        with open(path_to_report, "w", encoding="utf-8") as report_file:
+            json.dump(report, report_file, indent=2)
+        print(f"{report['requests']} requests, {report['tested_tokens']} of {len(tokens)} tokens tested, "
+              f"{report['glitch_tokens']} glitch tokens found, estimated coverage "
+              f"{report['estimated_coverage']:.1%} of {report['estimated_glitch_tokens']:.0f} glitch tokens.")
+        print(f"file saved in {path_to_output_csv}, report in {path_to_report}")
+        return report
+
+
+#### COMMAND LINE INTERFACE --------------------------------------------------------------------------------------------
+def build_argument_parser() -> argparse.ArgumentParser:
+    """
+    :return: parser of the headless command line interface, one option per parameter of GlitchFinder.GlitchTest
+    """
+    parser = argparse.ArgumentParser(
+        prog="GlitchTokenDiscovery",
+        description="Tests the tokens of a tokenizer for glitch tokens without any interaction. Options can also be "
+                    "given in a JSON or TOML file (--config), options on the command line take precedence.")
+    parser.add_argument("--config", help="JSON or TOML file with options, keys as the option names below with "
+                                         "underscores (e.g. path_to_journal, max_workers)")
+    files = parser.add_argument_group("files")
+    files.add_argument("--tokenizer", dest="path_to_token_csv_or_json",
+                       help="token csv, tokenizer.json, .tiktoken or .vocab file")
+    files.add_argument("--output", dest="path_to_output_csv", help="result csv file")
+    files.add_argument("--prompts", dest="path_to_prompts_csv", help="semicolon separated prompt csv")
+    files.add_argument("--intermediate-folder", dest="path_to_intermediate_res_folder")
+    files.add_argument("--journal", dest="path_to_journal", help="run journal (.jsonl)")
+    files.add_argument("--resume", action="store_true", default=None, help="skip the requests recorded in the journal")
+    files.add_argument("--manifest", dest="path_to_manifest", help="run manifest (.json)")
+    files.add_argument("--previous-manifest", dest="previous_manifest",
+                       help="manifest of an earlier run to carry unchanged responses forward")
+    files.add_argument("--parquet", dest="path_to_output_parquet", help="additional Parquet output")
+    files.add_argument("--saving-interval", type=int, dest="saving_interval")
+    model = parser.add_argument_group("model and generator")
+    model.add_argument("--model", action="append", dest="models",
+                       help="model name, repeat the option to test several models in a single pass")
+    model.add_argument("--generator", choices=("ollama", "pooled", "gpt", "deepseek"),
+                       help="response generator, ollama by default")
+    model.add_argument("--api-url", action="append", dest="api_urls",
+                       help="Ollama generate endpoint, repeat the option for the pooled generator")
+    model.add_argument("--api-key", help="API key of gpt or deepseek. If not set, OPENAI_API_KEY or DEEPSEEK_API_KEY "
+                                         "is read from the environment or the .env file")
+    model.add_argument("--base-url", help="OpenAI compatible base url of the gpt generator")
+    model.add_argument("--timeout", type=int, dest="timeout_seconds", help="timeout per request of the generator")
+    model.add_argument("--temperature", type=float)
+    model.add_argument("--stream", action="store_true", default=None, help="stream Ollama responses")
+    model.add_argument("--max-chars", type=int, help="stop streamed responses after this many characters")
+    model.add_argument("--num-predict", type=int, help="maximum number of generated tokens per response")
+    model.add_argument("--keep-alive", help="how long Ollama keeps the model loaded, e.g. 30m or -1 (forever)")
+    model.add_argument("--cache", dest="path_to_cache", help="persistent response cache (.sqlite)")
+    model.add_argument("--requests-per-minute", type=float, help="rate limit with retries and circuit breaking")
+    model.add_argument("--tokens-per-minute", type=float, help="token rate limit with retries and circuit breaking")
+    model.add_argument("--max-outage", type=float,
+                       help="seconds the circuit breaker may stay open before the run is aborted, waits if not set")
+    model.add_argument("--batch", choices=("openai", "local"), dest="batch_submitter",
+                       help="submit every stage as one provider batch job")
+    model.add_argument("--batch-folder", dest="path_to_batch_folder")
+    selection = parser.add_argument_group("token selection")
+    selection.add_argument("--top-n", type=int, dest="topN", help="only test the first N tokens")
+    selection.add_argument("--token-ids", help="comma separated token ids or a file with one token id per line")
+    selection.add_argument("--token-id-range", type=int, nargs=2, metavar=("START", "STOP"))
+    selection.add_argument("--no-added-tokens", action="store_false", default=None, dest="include_added_tokens")
+    selection.add_argument("--prescreen", choices=("tag", "skip", "prioritize"))
+    selection.add_argument("--prescreen-threshold", type=float)
+    selection.add_argument("--shard", type=int, nargs=2, metavar=("INDEX", "COUNT"))
+    execution = parser.add_argument_group("execution")
+    execution.add_argument("--max-workers", type=int)
+    execution.add_argument("--request-timeout", type=float)
+    execution.add_argument("--batch-size", type=int)
+    execution.add_argument("--group-size", type=int)
+    execution.add_argument("--compress-threshold", type=int)
+    execution.add_argument("--prefix-cache", action="store_true", default=None,
+                           help="order the requests for KV cache reuse and keep the model loaded")
+    execution.add_argument("--adaptive-order", action="store_true", default=None,
+                           help="run the stages in the order with the lowest expected cost, measured on a sample")
+    budget = parser.add_argument_group("budgeted run", "with a budget the tokens are tested in the order of their "
+                                                       "prior glitch likelihood until the budget is spent")
+    budget.add_argument("--request-budget", type=int, help="maximum number of requests")
+    budget.add_argument("--cost-budget", type=float, help="maximum cost, needs --cost-per-million-tokens")
+    budget.add_argument("--cost-per-million-tokens", type=float, nargs=2, metavar=("INPUT", "OUTPUT"))
+    budget.add_argument("--reference-results", action="append", dest="paths_to_reference_results",
+                        help="result csv of another model used for the prior, can be repeated")
+    budget.add_argument("--explore", type=float, help="share of randomly chosen tokens for the coverage estimate")
+    budget.add_argument("--budget-report", dest="path_to_report", help="JSON report of the budgeted run")
+    notifications = parser.add_argument_group("notifications")
+    notifications.add_argument("--send-sms", action="store_true", default=None, dest="sendSMS",
+                               help="Pushover notifications, keys from the .env file")
+    notifications.add_argument("--webhook", action="append", dest="webhooks", help="URL receiving the run events")
+    notifications.add_argument("--event-file", help="file the run events are appended to (JSON lines)")
+    observability = parser.add_argument_group("metrics")
+    observability.add_argument("--metrics-snapshot", dest="path_to_snapshot", help="JSON snapshot of the run metrics")
+    observability.add_argument("--metrics-port", type=int, help="port of the /metrics endpoint")
+    observability.add_argument("--metrics-host", help="interface of the /metrics endpoint, 127.0.0.1 by default, "
+                                                      "0.0.0.0 serves it on every interface")
+    observability.add_argument("--profiler", choices=("cprofile", "sampling"))
+    observability.add_argument("--profile", dest="path_to_profile", help="output file of the profiler")
+    return parser
+
+
+def load_cli_config(path: str) -> dict:
+    """
+    :param path: JSON or TOML (.toml) file with option names as keys
+    :return: the options of the file
+    """
+    if path.endswith(".toml"):
+        import tomllib  # python 3.11+
+        with open(path, "rb") as config_file:
+            return tomllib.load(config_file)
+    with open(path, encoding="utf-8") as config_file:
+        return json.load(config_file)
+
+
+def main(argv: list[str] = None) -> int:
+    """
+    Headless entry point: python GlitchTokenDiscovery.py --tokenizer tokenizer.json --output results.csv --model llama2
+    :param argv: command line arguments, sys.argv[1:] if not set
+    :return: exit status
+    """
+    parser = build_argument_parser()
+    arguments = parser.parse_args(argv)
+    if arguments.config is not None:
+        options = load_cli_config(arguments.config)
+        unknown = set(options) - set(vars(arguments))
+        if unknown:
+            parser.error(f"unknown options in {arguments.config}: {', '.join(sorted(unknown))}")
+        for option in ("models", "api_urls"):
+            if isinstance(options.get(option), str):
+                options[option] = [options[option]]
+        for option, value in options.items():  # options of the command line override the file
+            if getattr(arguments, option) is None:
+                setattr(arguments, option, value)
+    for option, name in (("path_to_token_csv_or_json", "--tokenizer"), ("path_to_output_csv", "--output"),
+                         ("models", "--model")):
+        if not getattr(arguments, option):
+            parser.error(f"{name} is required")
+
+    def api_key(name: str) -> str:
+        # the command line wins over the environment, the environment over the .env file
+        if arguments.api_key is not None:
+            return arguments.api_key
+        return os.environ.get(name) or load_config().get(name)
+
+    def build_generator(model: str) -> ResponseGenerator:
+        name = arguments.generator or ("pooled" if arguments.api_urls and len(arguments.api_urls) > 1 else "ollama")
+        ollama_options = {"timeout_seconds": arguments.timeout_seconds, "stream": bool(arguments.stream),
+                          "max_chars": arguments.max_chars, "num_predict": arguments.num_predict,
+                          "pool_size": arguments.max_workers}
+        if arguments.temperature is not None:
+            ollama_options["temperature"] = arguments.temperature
+        if arguments.keep_alive is not None:  # Ollama takes numbers as seconds and strings as durations
+            keep_alive = str(arguments.keep_alive)
+            ollama_options["keep_alive"] = int(keep_alive) if keep_alive.lstrip("-").isdigit() else keep_alive
+        if name == "pooled":
+            if not arguments.api_urls:
+                parser.error("the pooled generator needs at least one --api-url")
+            generator = PooledOllamaResponseGenerator(arguments.api_urls, **ollama_options)
+        elif name == "ollama":
+            generator = OllamaResponseGenerator(api_url=arguments.api_urls[0] if arguments.api_urls else None,
+                                                **ollama_options)
+        elif name == "gpt":
+            from Generators.GPTResponseGenerator import GPTResponseGenerator
+            generator = GPTResponseGenerator(api_key=api_key("OPENAI_API_KEY"), base_url=arguments.base_url)
+        else:
+            from Generators.DeepSeekResponseGenerator import DeepSeekResponseGenerator
+            generator = DeepSeekResponseGenerator(api_key=api_key("DEEPSEEK_API_KEY"))
+        if any(option is not None for option in (arguments.requests_per_minute, arguments.tokens_per_minute,
+                                                 arguments.max_outage)):
+            generator = ScheduledResponseGenerator(generator, requests_per_minute=arguments.requests_per_minute,
+                                                   tokens_per_minute=arguments.tokens_per_minute,
+                                                   max_outage=arguments.max_outage)
+        if arguments.path_to_cache is not None:
+            path = arguments.path_to_cache
+            if len(arguments.models) > 1:  # one cache per model, like the other outputs of a multi-model run
+                root, extension = os.path.splitext(path)
+                path = f"{root}_{re.sub(r'[^A-Za-z0-9_.-]', '_', model)}{extension}"
+            generator = CachedResponseGenerator(generator, path)
+        return generator
+
+    token_ids = arguments.token_ids
+    if isinstance(token_ids, str):
+        if os.path.isfile(token_ids):
+            with open(token_ids, encoding="utf-8") as token_id_file:
+                token_ids = [int(line) for line in token_id_file if line.strip()]
+        else:
+            token_ids = [int(token_id) for token_id in token_ids.split(",") if token_id.strip()]
+
+    batch_submitter = None
+    if arguments.batch_submitter == "openai":
+        from Generators.OpenAIBatchSubmitter import OpenAIBatchSubmitter
+        batch_submitter = OpenAIBatchSubmitter(api_key=api_key("OPENAI_API_KEY"), base_url=arguments.base_url)
+    elif arguments.batch_submitter == "local":
+        batch_submitter = LocalBatchSubmitter(build_generator(arguments.models[0]),
+                                              arguments.path_to_batch_folder or os.path.dirname(
+                                                  os.path.abspath(arguments.path_to_output_csv)))
+
+    metrics = None
+    if arguments.path_to_snapshot or arguments.metrics_port or arguments.profiler:
+        metrics = RunMetrics(path_to_snapshot=arguments.path_to_snapshot, port=arguments.metrics_port,
+                             host=arguments.metrics_host or "127.0.0.1", profiler=arguments.profiler,
+                             path_to_profile=arguments.path_to_profile)
+
+    if arguments.request_budget is not None or arguments.cost_budget is not None:
+        if len(arguments.models) > 1:
+            parser.error("budgeted runs test a single model")
+        options = {name: getattr(arguments, name) for name in (
+            "cost_per_million_tokens", "paths_to_reference_results", "path_to_prompts_csv", "max_workers",
+            "request_timeout", "explore", "topN", "token_id_range", "include_added_tokens", "path_to_report")}
+        options = {name: tuple(value) if name in ("cost_per_million_tokens", "token_id_range") else value
+                   for name, value in options.items() if value is not None}
+        GlitchFinder.BudgetedTest(arguments.path_to_token_csv_or_json, arguments.path_to_output_csv,
+                                  arguments.models[0], generator=build_generator(arguments.models[0]),
+                                  request_budget=arguments.request_budget, cost_budget=arguments.cost_budget,
+                                  token_ids=token_ids, **options)
+        return 0
+
+    if len(arguments.models) > 1:
+        model = [(name, build_generator(name)) for name in arguments.models]
+        generator = None
+    else:
+        model = arguments.models[0]
+        # without any generator option GlitchTest chooses the local Ollama server and checks the model
+        generator_options = (arguments.generator, arguments.api_urls, arguments.timeout_seconds,
+                             arguments.temperature, arguments.stream, arguments.max_chars, arguments.num_predict,
+                             arguments.keep_alive, arguments.path_to_cache, arguments.requests_per_minute,
+                             arguments.tokens_per_minute, arguments.max_outage)
+        generator = build_generator(model) if any(option is not None for option in generator_options) else None
+
+    sinks = [WebhookSink(url) for url in arguments.webhooks or []]
+    arguments.event_file is not None and sinks.append(FileSink(arguments.event_file))
+
+    # options that are not set keep the defaults of GlitchTest
+    options = {name: getattr(arguments, name) for name in (
+        "path_to_intermediate_res_folder", "path_to_prompts_csv", "saving_interval", "topN", "sendSMS", "max_workers",
+        "request_timeout", "batch_size", "path_to_journal", "resume", "token_id_range", "include_added_tokens",
+        "prescreen", "prescreen_threshold", "shard", "path_to_manifest", "path_to_batch_folder",
+        "path_to_output_parquet", "compress_threshold", "previous_manifest", "group_size", "prefix_cache",
+        "adaptive_order")}
+    options = {name: tuple(value) if isinstance(value, list) else value
+               for name, value in options.items() if value is not None}
+    GlitchFinder.GlitchTest(path_to_token_csv_or_json=arguments.path_to_token_csv_or_json,
+                            path_to_output_csv=arguments.path_to_output_csv, model=model, generator=generator,
+                            token_ids=token_ids, batch_submitter=batch_submitter, metrics=metrics,
+                            notification_sinks=sinks or None, **options)
+    return 0
+
+
+#### MAIN METHODOLOGY --------------------------------------------------------------------------------------------------
+if __name__ == "__main__":
+    """
+    The main method is configured to choose all necessary files by file select windows 
+
+    """
+    if len(sys.argv) > 1:  # headless run, see build_argument_parser for the options
+        sys.exit(main())
+
     print("Choosing OLLAMA as response generator as default..\n")
 
     # Import model name
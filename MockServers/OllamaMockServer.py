@@ -0,0 +1,313 @@
+"""
+Local stand-in for the Ollama /api/generate endpoint and the OpenAI chat completions endpoint. It answers the default
+test prompts deterministically without a model, so sharded, concurrent or multi-endpoint runs of the GlitchFinder can be
+tested and benchmarked on a single machine.
+
+Usage: python -m MockServers.OllamaMockServer --port 11434 --glitch-rate 0.02
+"""
+import argparse, hashlib, json, os, random, re, sys, threading, time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class QuietHTTPServer(ThreadingHTTPServer):
+    """
+    ThreadingHTTPServer that does not report clients closing their connection, which is how generators cancel a
+    streamed generation.
+    """
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        if not isinstance(sys.exc_info()[1], (ConnectionResetError, BrokenPipeError)):
+            super().handle_error(request, client_address)
+
+
+class OllamaMockServer:
+    """
+    Answers prompts like a well-behaved model: the string between the first and the last single quote is repeated,
+    converted into its UTF-8 bit sequence or its normal/not normal character count, depending on the prompt. The
+    strings of a JSON list (group tests) are repeated as a JSON list. Tokens
+    selected as glitch tokens get an evasive answer instead, which fails all default predicates.
+    """
+    GLITCH_ANSWER: str = "I'm sorry, I cannot repeat that string."
+    LATENCY_DISTRIBUTIONS = ("constant", "uniform", "exponential", "lognormal")
+    CHARS_PER_TOKEN: int = 4  # prompt length in tokens is estimated from its characters
+    PROMPT_EVAL_NS_PER_TOKEN: int = 200_000  # reported prompt evaluation time per evaluated token
+    LOAD_NS: int = 2_000_000_000  # reported load time of a model that is not loaded
+    KEEP_ALIVE_SECONDS: float = 300.0  # Ollama default keep_alive of 5 minutes
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, glitch_tokens: set[str] = None,
+                 glitch_rate: float = 0.0, latency: float = 0.0, runaway_chars: int = 0, chunk_chars: int = 4,
+                 chunk_latency: float = 0.0, error_rate: float = 0.0, error_status: int = 429,
+                 retry_after: float = None, seed: int = None, latency_distribution: str = "constant",
+                 response_chars: int = 0, cache_slots: int = 1):
+        """
+        :param host: interface to listen on
+        :param port: port to listen on, 0 picks a free port
+        :param glitch_tokens: strings the server treats as glitch tokens
+        :param glitch_rate: share of all other strings treated as glitch tokens, selected by a hash of the string so
+        every server instance and run selects the same strings
+        :param latency: seconds every response is delayed, the mean delay for random latency distributions
+        :param latency_distribution: 'constant', 'uniform' (0 to 2 * latency), 'exponential' or 'lognormal'
+        (heavy-tailed like real model servers)
+        :param runaway_chars: length of the whitespace run appended to glitch token answers, like the runaway
+        outputs real models produce for glitch tokens
+        :param chunk_chars: characters per chunk of a streamed response ("stream": true)
+        :param chunk_latency: seconds between two chunks of a streamed response
+        :param error_rate: share of requests answered with error_status instead, to test retries and rate limiting
+        :param error_status: HTTP status of injected errors
+        :param retry_after: Retry-After header (seconds) sent with injected errors
+        :param seed: seed of the error injection and the latency distribution
+        :param response_chars: minimum length of regular answers, shorter answers are padded with dots
+        :param cache_slots: number of emulated KV cache slots (OLLAMA_NUM_PARALLEL). Every /api/generate response
+        reports prompt_eval_count, prompt_eval_duration and load_duration like Ollama: the prompt prefix shared with the
+        best matching slot is not evaluated again, and a model unloaded after its keep_alive is loaded again.
+        """
+        if latency_distribution not in self.LATENCY_DISTRIBUTIONS:
+            raise ValueError(f"latency_distribution has to be one of {self.LATENCY_DISTRIBUTIONS}.")
+        self.glitch_tokens = set(glitch_tokens or ())
+        self.glitch_rate = glitch_rate
+        self.latency = latency
+        self.latency_distribution = latency_distribution
+        self.response_chars = response_chars
+        self.runaway_chars = runaway_chars
+        self.chunk_chars = chunk_chars
+        self.chunk_latency = chunk_latency
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.retry_after = retry_after
+        self.outage = False  # while True every request is answered with 503, like a service that is down
+        self.requests = 0
+        self.errors = 0  # injected error responses
+        self.streamed_chars = 0  # characters actually sent in streamed responses
+        self.cache_slots = [""] * cache_slots  # prompt held in every KV cache slot
+        self._loaded_until: dict[str, float] = {}  # model -> monotonic time it is unloaded
+        self._lock = threading.Lock()
+        self._random = random.Random(seed)
+        self._server = QuietHTTPServer((host, port), self._handler())
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        """
+        generate endpoint of the server, to be used as api_url of the OllamaResponseGenerator
+        """
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/api/generate"
+
+    @property
+    def openai_url(self) -> str:
+        """
+        base url of the OpenAI compatible endpoint (/v1/chat/completions)
+        """
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def delay(self) -> float:
+        """
+        :return: latency of the next response in seconds, drawn from the latency distribution
+        """
+        if not self.latency or self.latency_distribution == "constant":
+            return self.latency
+        with self._lock:
+            if self.latency_distribution == "uniform":
+                return self._random.uniform(0, 2 * self.latency)
+            if self.latency_distribution == "exponential":
+                return self._random.expovariate(1 / self.latency)
+            return self.latency * self._random.lognormvariate(-0.5, 1.0)  # mean of the factor is 1
+
+    def prompt_evaluation(self, model: str, system: str, prompt: str, keep_alive=None) -> dict:
+        """
+        Emulates the prompt processing of the server for the statistics of a response.
+        :return: prompt_eval_count, prompt_eval_duration and load_duration (nanoseconds) of the request
+        """
+        text = f"{system}\n{prompt}"
+        now = time.monotonic()
+        with self._lock:
+            # like llama.cpp the slot with the longest common prefix is used and holds the new prompt afterwards
+            slot = max(range(len(self.cache_slots)),
+                       key=lambda index: len(os.path.commonprefix([self.cache_slots[index], text])))
+            cached = len(os.path.commonprefix([self.cache_slots[slot], text]))
+            loaded = self._loaded_until.get(model, 0.0) > now
+            if not loaded:  # a model loaded again starts with empty caches
+                self.cache_slots = [""] * len(self.cache_slots)
+                cached = 0
+            self.cache_slots[slot] = text
+            self._loaded_until[model] = now + self._keep_alive_seconds(keep_alive)
+        evaluated = max(len(text) // self.CHARS_PER_TOKEN - cached // self.CHARS_PER_TOKEN, 1)
+        return {"prompt_eval_count": evaluated, "prompt_eval_duration": evaluated * self.PROMPT_EVAL_NS_PER_TOKEN,
+                "load_duration": 0 if loaded else self.LOAD_NS}
+
+    def _keep_alive_seconds(self, keep_alive) -> float:
+        # keep_alive as seconds or a duration like '30m', negative values keep the model loaded forever
+        if keep_alive is None:
+            return self.KEEP_ALIVE_SECONDS
+        if isinstance(keep_alive, str):
+            match = re.fullmatch(r"(-?[0-9.]+)([smh]?)", keep_alive.strip())
+            if match is None:
+                return self.KEEP_ALIVE_SECONDS
+            keep_alive = float(match.group(1)) * {"": 1, "s": 1, "m": 60, "h": 3600}[match.group(2)]
+        return float("inf") if keep_alive < 0 else float(keep_alive)
+
+    def is_glitch(self, string: str) -> bool:
+        if string in self.glitch_tokens:
+            return True
+        bucket = int.from_bytes(hashlib.sha256(string.encode("utf-8")).digest()[:8], "big") / 2 ** 64
+        return bucket < self.glitch_rate
+
+    def answer(self, prompt: str) -> str:
+        """
+        :return: response text of the stand-in model for a prompt
+        """
+        if "JSON list" in prompt and "[" in prompt:
+            # group test: every string of the JSON list is echoed, glitch tokens get the evasive answer
+            strings = json.loads(prompt[prompt.find("["):prompt.rfind("]") + 1])
+            return json.dumps([self.GLITCH_ANSWER if self.is_glitch(string) else string for string in strings],
+                              ensure_ascii=False)
+        string = prompt[prompt.find("'") + 1:prompt.rfind("'")]
+        if self.is_glitch(string):
+            return self.GLITCH_ANSWER + " " * self.runaway_chars
+        if "UTF-8" in prompt:
+            answer = " ".join(f"{byte:08b}" for byte in string.encode("utf-8"))
+        elif "normal characters" in prompt:
+            normal = sum(char.isascii() and char.isalpha() for char in string)
+            answer = f"({normal},{len(string) - normal})"
+        else:
+            answer = string
+        if len(answer) < self.response_chars:
+            answer += " " + "." * (self.response_chars - len(answer) - 1)
+        return answer
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive connections like the real server
+            disable_nagle_algorithm = True  # headers and body are written separately, avoids delayed ACK stalls
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send(self, status: int, payload: dict, headers: dict = None) -> None:
+                body = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                if self.path not in ("/api/generate", "/v1/chat/completions"):
+                    self._send(404, {"error": f"unknown endpoint {self.path}"})
+                    return
+                with server._lock:
+                    server.requests += 1
+                    status = 503 if server.outage else \
+                        server.error_status if server._random.random() < server.error_rate else None
+                    server.errors += status is not None
+                if status is not None:
+                    headers = {"Retry-After": str(server.retry_after)} if server.retry_after is not None else None
+                    self._send(status, {"error": "rate limit exceeded" if status == 429 else "service unavailable"},
+                               headers)
+                    return
+                delay = server.delay()
+                if delay:
+                    time.sleep(delay)
+                if self.path == "/v1/chat/completions":
+                    self._chat_completion(request)
+                    return
+                answer = server.answer(request.get("prompt", ""))
+                statistics = server.prompt_evaluation(request.get("model", ""), request.get("system", ""),
+                                                      request.get("prompt", ""), request.get("keep_alive"))
+                if request.get("stream", True):  # like Ollama, streaming is the default
+                    self._stream(request.get("model"), answer, statistics)
+                else:
+                    self._send(200, {"model": request.get("model"), "response": answer, "done": True, **statistics})
+
+            def _chat_completion(self, request: dict) -> None:
+                prompt = "".join(message.get("content", "") for message in request.get("messages", [])
+                                 if message.get("role") == "user")
+                answer = server.answer(prompt)
+                self._send(200, {
+                    "id": f"chatcmpl-{server.requests}", "object": "chat.completion", "created": int(time.time()),
+                    "model": request.get("model"),
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": answer},
+                                 "finish_reason": "stop"}],
+                    "usage": {"prompt_tokens": len(prompt) // 4, "completion_tokens": len(answer) // 4,
+                              "total_tokens": (len(prompt) + len(answer)) // 4}})
+
+            def _stream(self, model: str, answer: str, statistics: dict) -> None:
+                # newline delimited JSON chunks with chunked transfer encoding, stops when the client disconnects
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                chunks = [answer[i:i + server.chunk_chars] for i in range(0, len(answer), server.chunk_chars)]
+                try:
+                    for piece in chunks:
+                        self._write_chunk({"model": model, "response": piece, "done": False})
+                        with server._lock:
+                            server.streamed_chars += len(piece)
+                        if server.chunk_latency:
+                            time.sleep(server.chunk_latency)
+                    self._write_chunk({"model": model, "response": "", "done": True, **statistics})
+                    self.wfile.write(b"0\r\n\r\n")
+                except (BrokenPipeError, ConnectionResetError):
+                    self.close_connection = True  # client cancelled the generation
+
+            def _write_chunk(self, payload: dict) -> None:
+                line = json.dumps(payload).encode("utf-8") + b"\n"
+                self.wfile.write(f"{len(line):X}\r\n".encode("ascii") + line + b"\r\n")
+                self.wfile.flush()
+
+        return Handler
+
+    def start(self) -> "OllamaMockServer":
+        """
+        Starts serving on a background thread.
+        """
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self) -> None:
+        """
+        Serves on the calling thread until interrupted.
+        """
+        self._server.serve_forever()
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "OllamaMockServer":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local stand-in for the Ollama /api/generate endpoint.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--glitch-rate", type=float, default=0.0, help="share of strings answered like glitch tokens")
+    parser.add_argument("--latency", type=float, default=0.0, help="(mean) delay of every response in seconds")
+    parser.add_argument("--latency-distribution", default="constant", choices=OllamaMockServer.LATENCY_DISTRIBUTIONS)
+    parser.add_argument("--response-chars", type=int, default=0, help="minimum length of regular answers")
+    parser.add_argument("--runaway-chars", type=int, default=0, help="whitespace run appended to glitch answers")
+    parser.add_argument("--chunk-latency", type=float, default=0.0, help="delay between streamed chunks in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered with an error")
+    parser.add_argument("--error-status", type=int, default=429, help="HTTP status of injected errors")
+    parser.add_argument("--cache-slots", type=int, default=1, help="emulated KV cache slots (OLLAMA_NUM_PARALLEL)")
+    arguments = parser.parse_args()
+    mock_server = OllamaMockServer(arguments.host, arguments.port, glitch_rate=arguments.glitch_rate,
+                                   latency=arguments.latency, runaway_chars=arguments.runaway_chars,
+                                   chunk_latency=arguments.chunk_latency, error_rate=arguments.error_rate,
+                                   error_status=arguments.error_status,
+                                   latency_distribution=arguments.latency_distribution,
+                                   response_chars=arguments.response_chars, cache_slots=arguments.cache_slots)
+    print(f"serving {mock_server.url} and {mock_server.openai_url}/chat/completions")
+    mock_server.serve_forever()
@@ -0,0 +1 @@
+from .OllamaMockServer import OllamaMockServer
@@ -0,0 +1,56 @@
+import filecmp, os, tempfile, unittest
+
+from GlitchTokenDiscovery import GlitchFinder, OllamaResponseGenerator
+from MockServers import OllamaMockServer
+
+TOKENIZER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Examples",
+                         "tokenizer_llama2-7b.json")
+
+
+class GroupTestingTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.addCleanup(self.folder.cleanup)
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.folder.name, name)
+
+    def run_test(self, server: OllamaMockServer, name: str, **kwargs) -> int:
+        # runs GlitchTest and returns the number of requests it sent
+        requests = server.requests
+        GlitchFinder.GlitchTest(TOKENIZER, self.path(f"{name}.csv"), "m",
+                                generator=OllamaResponseGenerator(pool_size=4, api_url=server.url), topN=1200,
+                                **kwargs)
+        return server.requests - requests
+
+    def test_group_testing_matches_a_sequential_run(self):
+        with OllamaMockServer(glitch_rate=0.03, glitch_tokens={"▁the"}, seed=0) as server:
+            sequential = self.run_test(server, "sequential")
+            grouped = {(group_size, max_workers): self.run_test(server, f"group_{group_size}_{max_workers}",
+                                                                group_size=group_size, max_workers=max_workers)
+                       for group_size, max_workers in ((4, 1), (16, 4))}
+
+        for (group_size, max_workers), requests in grouped.items():
+            with self.subTest(group_size=group_size, max_workers=max_workers):
+                self.assertTrue(filecmp.cmp(self.path("sequential.csv"),
+                                            self.path(f"group_{group_size}_{max_workers}.csv"), shallow=False))
+                self.assertLess(requests, sequential)
+
+    def test_unreadable_group_answers_are_split(self):
+        class Unreadable(OllamaMockServer):
+            # groups containing a glitch token get an answer that is no JSON list
+            def answer(self, prompt: str) -> str:
+                answer = super().answer(prompt)
+                if "JSON list" in prompt and self.GLITCH_ANSWER in answer:
+                    return self.GLITCH_ANSWER
+                return answer
+
+        with Unreadable(glitch_rate=0.03, glitch_tokens={"▁the"}, seed=0) as server:
+            self.run_test(server, "sequential")
+            self.run_test(server, "grouped", group_size=8, max_workers=2)
+        self.assertTrue(filecmp.cmp(self.path("sequential.csv"), self.path("grouped.csv"), shallow=False))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,53 @@
+import filecmp, os, tempfile, unittest
+
+import pandas as pd
+
+from GlitchTokenDiscovery import GlitchFinder, OllamaResponseGenerator, default_prompts
+from MockServers import OllamaMockServer
+
+TOKENIZER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Examples",
+                         "tokenizer_llama2-7b.json")
+
+
+class IncrementalRunTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.addCleanup(self.folder.cleanup)
+        prompts = [prompt for prompt in default_prompts if len(prompt) == 4]
+        pd.DataFrame(prompts[:3]).to_csv(self.path("prompts3.csv"), sep=";", index=False)
+        pd.DataFrame(prompts).to_csv(self.path("prompts.csv"), sep=";", index=False)
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.folder.name, name)
+
+    def run_test(self, server: OllamaMockServer, name: str, topN: int, prompts: str, **kwargs) -> int:
+        # runs GlitchTest and returns the number of requests it sent
+        requests = server.requests
+        GlitchFinder.GlitchTest(TOKENIZER, self.path(f"{name}.csv"), "m",
+                                generator=OllamaResponseGenerator(pool_size=2, api_url=server.url), topN=topN,
+                                path_to_prompts_csv=self.path(prompts), **kwargs)
+        return server.requests - requests
+
+    def test_incremental_run_matches_a_sequential_run(self):
+        with OllamaMockServer(glitch_rate=0.05, seed=0) as server:
+            self.run_test(server, "first", 300, "prompts3.csv", path_to_journal=self.path("first.jsonl"),
+                          path_to_manifest=self.path("first.manifest.json"))
+            # more tokens and an additional prompt
+            incremental = self.run_test(server, "incremental", 400, "prompts.csv",
+                                        path_to_journal=self.path("incremental.jsonl"),
+                                        path_to_manifest=self.path("incremental.manifest.json"),
+                                        previous_manifest=self.path("first.manifest.json"))
+            full = self.run_test(server, "full", 400, "prompts.csv")
+            unchanged = self.run_test(server, "unchanged", 400, "prompts.csv",
+                                      path_to_journal=self.path("unchanged.jsonl"),
+                                      previous_manifest=self.path("incremental.manifest.json"))
+
+        self.assertTrue(filecmp.cmp(self.path("incremental.csv"), self.path("full.csv"), shallow=False))
+        self.assertTrue(filecmp.cmp(self.path("unchanged.csv"), self.path("full.csv"), shallow=False))
+        self.assertLess(incremental, full)
+        self.assertEqual(unchanged, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
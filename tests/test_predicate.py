@@ -0,0 +1,72 @@
+import unittest
+
+from GlitchTokenDiscovery import Predicate
+
+
+class PredicateTest(unittest.TestCase):
+
+    def test_rejects_unsafe_expressions(self):
+        unsafe = [
+            "__import__('os').system('true')",  # unknown name
+            "open('/etc/passwd').read()",
+            "getattr(token, '__class__')",
+            "token.__class__",  # private attributes
+            "().__class__.__bases__[0].__subclasses__()",
+            "result._private",
+            "'{0.__class__}'.format(token)",  # format can reach dunder attributes
+            "str.mro()",
+            "(lambda: True)()",  # constructs outside the allowed subset
+            "lambda token: True",
+            "[x for x in result if (y := x)]",
+            "{'a': 1}",
+            "await result",
+        ]
+        for expression in unsafe:
+            with self.subTest(expression=expression), self.assertRaises(ValueError):
+                Predicate(expression)
+
+    def test_rejects_missing_and_invalid_predicates(self):
+        for expression in (None, "", "   ", "token in", "token = result"):
+            with self.subTest(expression=expression), self.assertRaises(ValueError):
+                Predicate(expression)
+
+    def test_evaluates_allowed_expressions(self):
+        cases = [
+            ("token in result", "abc", "xxabcxx", True),
+            ("token in result", "abc", "ab", False),
+            ("token.upper() in result", "abc", "ABC", True),
+            ("len(result) < 2 * len(token)", "ab", "abc", True),
+            ("not any(c.isdigit() for c in result)", "a", "a1", False),
+            ("result.strip().lower() == token.lower()", "Hi", " hi ", True),
+        ]
+        for expression, token, result, expected in cases:
+            with self.subTest(expression=expression, result=result):
+                self.assertEqual(Predicate(expression).evaluate(token, result), expected)
+
+    def test_evaluation_errors_count_as_failed(self):
+        predicate = Predicate("int(result) > 0")
+        self.assertFalse(predicate.evaluate("a", "not a number"))
+        self.assertTrue(predicate.evaluate("a", "3"))
+        self.assertEqual(predicate.errors, {"ValueError": 1})
+        self.assertEqual(predicate.evaluations, 2)
+
+    def test_batch_evaluation_matches_row_wise_evaluation(self):
+        tokens = ["a", "▁the", "<0x0A>", "", "x"]
+        results = ["a", "the", "<0x0A> and more", "anything", None]
+        for expression in ("token in result", "token not in result", "'sorry' in result.lower()"):
+            with self.subTest(expression=expression):
+                predicate = Predicate(expression)
+                self.assertEqual(predicate.evaluate_batch(tokens, results),
+                                 [predicate.evaluate(token, result) for token, result in zip(tokens, results)])
+
+    def test_fork_has_its_own_counters(self):
+        predicate = Predicate("token in result")
+        predicate.evaluate("a", "a")
+        fork = predicate.fork()
+        fork.evaluate("a", None)
+        self.assertEqual((predicate.evaluations, predicate.errors), (1, {}))
+        self.assertEqual((fork.evaluations, fork.errors), (1, {"TypeError": 1}))
+
+
+if __name__ == "__main__":
+    unittest.main()
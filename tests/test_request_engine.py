@@ -0,0 +1,93 @@
+import random, threading, time, unittest
+
+from GlitchTokenDiscovery import RequestEngine, ResponseGenerator
+
+
+class EchoGenerator(ResponseGenerator):
+    """
+    Answers with the prompt after a random delay, so concurrent requests finish out of order. The prompt 'hang' blocks
+    until the release event is set.
+    """
+
+    def __init__(self, max_latency: float = 0.01):
+        self.max_latency = max_latency
+        self.release = threading.Event()
+        self.random = random.Random(0)
+        self.lock = threading.Lock()
+
+    def generateResponse(self, model, prompt, systemInstruction, **kwargs):
+        if prompt == "hang":
+            self.release.wait()
+            return "late"
+        with self.lock:
+            delay = self.random.uniform(0, self.max_latency)
+        time.sleep(delay)
+        return prompt
+
+
+class RequestEngineTest(unittest.TestCase):
+
+    def setUp(self):
+        self.generator = EchoGenerator()
+
+    def tearDown(self):
+        self.generator.release.set()  # lets the abandoned workers finish
+
+    def run_engine(self, prompts: list[str], **kwargs) -> list[tuple[str, Exception]]:
+        engine = RequestEngine(self.generator, "m", **kwargs)
+        return list(engine.run((prompt, "system") for prompt in prompts))
+
+    def test_sequential_order(self):
+        prompts = [f"p{index}" for index in range(20)]
+        self.assertEqual(self.run_engine(prompts), [(prompt, None) for prompt in prompts])
+
+    def test_concurrent_results_keep_request_order(self):
+        prompts = [f"p{index}" for index in range(200)]
+        for max_workers in (2, 8):
+            with self.subTest(max_workers=max_workers):
+                self.assertEqual(self.run_engine(prompts, max_workers=max_workers),
+                                 [(prompt, None) for prompt in prompts])
+
+    def test_errors_are_reported_per_token(self):
+        class Failing(EchoGenerator):
+            def generateResponse(self, model, prompt, systemInstruction, **kwargs):
+                if prompt == "fail":
+                    raise RuntimeError(prompt)
+                return prompt
+
+        self.generator = Failing()
+        results = self.run_engine(["a", "fail", "b"], max_workers=2)
+        self.assertEqual([result for result, _ in results], ["a", None, "b"])
+        self.assertIsInstance(results[1][1], RuntimeError)
+        self.assertIsNone(results[0][1])
+
+    def test_timeout_only_affects_the_hanging_token(self):
+        prompts = [f"p{index}" for index in range(10)] + ["hang"] + [f"q{index}" for index in range(10)]
+        expected = [("timeout", None) if prompt == "hang" else (prompt, None) for prompt in prompts]
+        for max_workers in (1, 3):
+            with self.subTest(max_workers=max_workers):
+                started = time.monotonic()
+                self.assertEqual(self.run_engine(prompts, max_workers=max_workers, request_timeout=0.5), expected)
+                self.assertLess(time.monotonic() - started, 5)
+
+    def test_several_hanging_tokens_with_a_single_worker(self):
+        prompts = ["hang", "a", "hang", "b"]
+        self.assertEqual(self.run_engine(prompts, max_workers=1, request_timeout=0.3),
+                         [("timeout", None), ("a", None), ("timeout", None), ("b", None)])
+
+    def test_batches_keep_request_order(self):
+        class Batching(EchoGenerator):
+            def generateResponses(self, model, prompts, systemInstruction):
+                return list(prompts)
+
+        self.generator = Batching()
+        prompts = [f"p{index}" for index in range(25)]
+        self.assertEqual(self.run_engine(prompts, max_workers=3, batch_size=4), [(prompt, None) for prompt in prompts])
+
+    def test_invalid_arguments(self):
+        with self.assertRaises(ValueError):
+            RequestEngine(self.generator, "m", max_workers=0)
+
+
+if __name__ == "__main__":
+    unittest.main()
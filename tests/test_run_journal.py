@@ -0,0 +1,66 @@
+import filecmp, json, os, tempfile, unittest
+
+from GlitchTokenDiscovery import GlitchFinder, OllamaResponseGenerator, RunJournal
+from MockServers import OllamaMockServer
+
+TOKENIZER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Examples",
+                         "tokenizer_llama2-7b.json")
+
+
+class RunJournalTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.addCleanup(self.folder.cleanup)
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.folder.name, name)
+
+    def test_torn_last_line_is_cut_off(self):
+        journal = RunJournal(self.path("j.jsonl"), "m", [[0, "system", "{}", "token in result"]])
+        journal.record(0, 1, "a", "a", True)
+        journal.record(0, 2, "b", "x", False)
+        journal.close()
+        with open(self.path("j.jsonl"), "a", encoding="utf-8") as journal_file:
+            journal_file.write('{"stage": 0, "token_id": 3, "tok')
+        resumed = RunJournal(self.path("j.jsonl"), "m", [[0, "system", "{}", "token in result"]], resume=True)
+        self.assertEqual(resumed.completed(0), {1: ("a", True), 2: ("x", False)})
+        resumed.record(0, 3, "c", "c", True)
+        resumed.close()
+        header, records = RunJournal.read(self.path("j.jsonl"))
+        self.assertEqual(header["model"], "m")
+        self.assertEqual([record["token_id"] for record in records], [1, 2, 3])
+
+    def test_resume_validates_the_run(self):
+        RunJournal(self.path("j.jsonl"), "m", [[0, "system", "{}", "token in result"]]).close()
+        with self.assertRaises(FileExistsError):
+            RunJournal(self.path("j.jsonl"), "m", [[0, "system", "{}", "token in result"]])
+        with self.assertRaises(ValueError):
+            RunJournal(self.path("j.jsonl"), "other", [[0, "system", "{}", "token in result"]], resume=True)
+
+    def test_resumed_run_only_requests_the_remaining_tokens(self):
+        with OllamaMockServer(glitch_rate=0.05, seed=0) as server:
+            generator = OllamaResponseGenerator(pool_size=2, api_url=server.url)
+            GlitchFinder.GlitchTest(TOKENIZER, self.path("full.csv"), "m", generator=generator, topN=300,
+                                    path_to_journal=self.path("full.jsonl"))
+            full_requests = server.requests
+
+            # journal of a run that crashed while writing its 120th record
+            with open(self.path("full.jsonl"), "r", encoding="utf-8") as journal_file:
+                lines = journal_file.readlines()
+            with open(self.path("crashed.jsonl"), "w", encoding="utf-8") as journal_file:
+                journal_file.writelines(lines[:120])
+                journal_file.write(lines[120][:len(lines[120]) // 2])
+
+            GlitchFinder.GlitchTest(TOKENIZER, self.path("resumed.csv"), "m", generator=generator, topN=300,
+                                    path_to_journal=self.path("crashed.jsonl"), resume=True)
+            resumed_requests = server.requests - full_requests
+
+        self.assertEqual(resumed_requests, full_requests - 119)
+        self.assertTrue(filecmp.cmp(self.path("full.csv"), self.path("resumed.csv"), shallow=False))
+        with open(self.path("crashed.jsonl"), "r", encoding="utf-8") as journal_file:
+            self.assertEqual(len([json.loads(line) for line in journal_file]), len(lines))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,56 @@
+import filecmp, os, shutil, tempfile, unittest
+
+from GlitchTokenDiscovery import GlitchFinder, OllamaResponseGenerator
+from MockServers import OllamaMockServer
+
+TOKENIZER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Examples",
+                         "tokenizer_llama2-7b.json")
+
+
+class MergeShardsTest(unittest.TestCase):
+    SHARDS = 3
+
+    @classmethod
+    def setUpClass(cls):
+        cls.folder = tempfile.TemporaryDirectory()
+        # private copy of the tokenizer, so a test can remove it
+        cls.tokenizer = shutil.copy(TOKENIZER, cls.path("tokenizer.json"))
+        with OllamaMockServer(glitch_rate=0.05, seed=0) as server:
+            generator = OllamaResponseGenerator(pool_size=2, api_url=server.url)
+            GlitchFinder.GlitchTest(cls.tokenizer, cls.path("single.csv"), "m", generator=generator, topN=400)
+            for index in range(cls.SHARDS):
+                GlitchFinder.GlitchTest(cls.tokenizer, cls.path(f"shard{index}.csv"), "m", generator=generator,
+                                        topN=400, shard=(index, cls.SHARDS), max_workers=2)
+        cls.manifests = [cls.path(f"shard{index}.manifest.json") for index in range(cls.SHARDS)]
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.folder.cleanup()
+
+    @classmethod
+    def path(cls, name: str) -> str:
+        return os.path.join(cls.folder.name, name)
+
+    def test_merged_shards_reproduce_a_single_run(self):
+        GlitchFinder.MergeShards(self.manifests[::-1], self.path("merged.csv"))
+        self.assertTrue(filecmp.cmp(self.path("single.csv"), self.path("merged.csv"), shallow=False))
+
+    def test_merge_without_tokenizer_orders_by_token_id(self):
+        # the example vocabulary lists the tokens by id, so the fallback order is the tokenizer order
+        os.rename(self.tokenizer, self.tokenizer + ".moved")
+        try:
+            GlitchFinder.MergeShards(self.manifests, self.path("merged_by_id.csv"))
+        finally:
+            os.rename(self.tokenizer + ".moved", self.tokenizer)
+        self.assertTrue(filecmp.cmp(self.path("single.csv"), self.path("merged_by_id.csv"), shallow=False))
+
+    def test_incomplete_shards_are_rejected(self):
+        with self.assertRaises(ValueError):
+            GlitchFinder.MergeShards(self.manifests[:-1], self.path("incomplete.csv"))
+        with self.assertRaises(ValueError):
+            GlitchFinder.MergeShards(self.manifests + self.manifests[:1], self.path("duplicate.csv"))
+        self.assertFalse(os.path.exists(self.path("incomplete.csv")))
+
+
+if __name__ == "__main__":
+    unittest.main()
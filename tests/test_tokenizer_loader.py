@@ -0,0 +1,71 @@
+import json, os, tempfile, unittest
+from unittest import mock
+
+from GlitchTokenDiscovery import TokenizerLoader
+
+TOKENIZER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Examples",
+                         "tokenizer_llama2-7b.json")
+
+
+def reference_tokens(path: str, include_added_tokens: bool = True) -> list[tuple[int, str]]:
+    # the token order of the streaming loader, read with json.load
+    with open(path, "r", encoding="utf-8") as token_file:
+        tokenizer = json.load(token_file)
+    tokens = [(token_id, token) for token, token_id in tokenizer["model"]["vocab"].items()]
+    if include_added_tokens:
+        vocab_ids = {token_id for token_id, _ in tokens}
+        tokens += [(entry["id"], entry["content"]) for entry in tokenizer.get("added_tokens", [])
+                   if entry["id"] not in vocab_ids]
+    return tokens
+
+
+class TokenizerLoaderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.addCleanup(self.folder.cleanup)
+
+    def write_tokenizer(self, vocab: dict[str, int], added_tokens: list[dict], indent: int = None,
+                        ensure_ascii: bool = True) -> str:
+        path = os.path.join(self.folder.name, "tokenizer.json")
+        with open(path, "w", encoding="utf-8") as token_file:
+            json.dump({"version": "1.0", "added_tokens": added_tokens, "normalizer": None,
+                       "model": {"type": "BPE", "vocab": vocab, "merges": ["a b", "ab c"]}}, token_file,
+                      indent=indent, ensure_ascii=ensure_ascii)
+        return path
+
+    def test_example_tokenizer_matches_json_load(self):
+        self.assertEqual(list(TokenizerLoader.iter_tokens(TOKENIZER)), reference_tokens(TOKENIZER))
+        self.assertEqual(list(TokenizerLoader.iter_tokens(TOKENIZER, include_added_tokens=False)),
+                         reference_tokens(TOKENIZER, include_added_tokens=False))
+
+    def test_escaped_keys_match_json_load(self):
+        keys = ['quote"inside', 'back\\slash', '\\"', 'tab\tnew\nline', 'é', '▁the', '😀', '/slash',
+                '\x00\x1f', '"', '\\', '}', '{"vocab": {', 'a" : 1, "b', '']
+        vocab = {key: token_id for token_id, key in enumerate(keys)}
+        added_tokens = [{"id": 0, "content": "<unk>"}, {"id": 100, "content": '<s "special">'}]
+        for indent in (None, 2):
+            for ensure_ascii in (True, False):
+                with self.subTest(indent=indent, ensure_ascii=ensure_ascii):
+                    path = self.write_tokenizer(vocab, added_tokens, indent, ensure_ascii)
+                    self.assertEqual(list(TokenizerLoader.iter_tokens(path)), reference_tokens(path))
+
+    def test_entries_split_across_chunks(self):
+        vocab = {f'tok"{index}\\é': index for index in range(500)}
+        path = self.write_tokenizer(vocab, [{"id": 500, "content": "</s>"}], indent=1)
+        for chunk_size in (7, 64, 1000):
+            with self.subTest(chunk_size=chunk_size), mock.patch.object(TokenizerLoader, "CHUNK_SIZE", chunk_size):
+                self.assertEqual(list(TokenizerLoader.iter_tokens(path)), reference_tokens(path))
+                self.assertEqual(list(TokenizerLoader.iter_merges(path)), [("a", "b"), ("ab", "c")])
+
+    def test_selection(self):
+        tokens = reference_tokens(TOKENIZER)
+        self.assertEqual(list(TokenizerLoader.iter_tokens(TOKENIZER, topN=50)), tokens[:50])
+        self.assertEqual(list(TokenizerLoader.iter_tokens(TOKENIZER, id_range=(100, 120))),
+                         [(token_id, token) for token_id, token in tokens if 100 <= token_id < 120])
+        shards = [list(TokenizerLoader.iter_tokens(TOKENIZER, topN=300, shard=(index, 3))) for index in range(3)]
+        self.assertEqual(sorted(token for shard in shards for token in shard), sorted(tokens[:300]))
+
+
+if __name__ == "__main__":
+    unittest.main()